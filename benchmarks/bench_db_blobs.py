@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tamaño de la base y carga de sesiones con imágenes dentro de chat_messages frente al almacén deduplicado
+Uso: python benchmarks/bench_db_blobs.py [--sessions 50] [--images 10] [--distinct 20] [--image-kb 300]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa random para elegir qué imagen se sube
+import random  # Subidas repetidas
+# Importa sqlite3 para crear la base con el esquema anterior
+import sqlite3  # Base de datos local
+# Importa tempfile para la base de datos temporal
+import tempfile  # Directorio temporal
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.database_module import ChatDatabase, MIGRATIONS  # Base de datos de chat y sus migraciones
+
+
+def build_v2(path, sessions, images, distinct, image_kb):
+    """Base con el esquema anterior (versión 2): cada mensaje de imagen guarda sus bytes en image_data"""
+    rng = random.Random(0)
+    pool = [os.urandom(image_kb * 1024) for _ in range(distinct)]  # Fotos de las mismas personas, subidas varias veces
+    conn = sqlite3.connect(path)
+    for _, _, statements in MIGRATIONS[:2]:
+        for statement in statements:
+            conn.execute(statement)
+    conn.execute("PRAGMA user_version = 2")
+    for s in range(sessions):
+        session_id = conn.execute("INSERT INTO chat_sessions (session_name) VALUES (?)", (f"sesión {s}",)).lastrowid
+        for i in range(images):
+            conn.execute("INSERT INTO chat_messages (session_id, message_type, content, image_data) VALUES (?, 'image', ?, ?)",
+                         (session_id, f"Imagen {i}", rng.choice(pool)))
+            for j in range(10):  # Conversación entre imagen e imagen
+                conn.execute("INSERT INTO chat_messages (session_id, message_type, content) VALUES (?, ?, ?)",
+                             (session_id, "user" if j % 2 else "assistant", f"mensaje {j} " * 20))
+    conn.commit()
+    conn.close()
+
+
+def load_all(fetch, sessions):
+    """Media en ms de cargar cada sesión"""
+    start = time.perf_counter()
+    for session_id in range(1, sessions + 1):
+        fetch(session_id)
+    return (time.perf_counter() - start) / sessions * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Almacén de imágenes deduplicado")
+    parser.add_argument("--sessions", type=int, default=50, help="Sesiones")
+    parser.add_argument("--images", type=int, default=10, help="Imágenes por sesión")
+    parser.add_argument("--distinct", type=int, default=20, help="Imágenes distintas entre todas las subidas")
+    parser.add_argument("--image-kb", type=int, default=300, help="Tamaño de cada imagen (KiB)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "chat.db")
+        build_v2(path, args.sessions, args.images, args.distinct, args.image_kb)
+        size_before = os.path.getsize(path)
+        conn = sqlite3.connect(path)
+        load_before = load_all(lambda session_id: conn.execute(
+            "SELECT id, message_type, content, user_name, emotion, image_data, timestamp FROM chat_messages "
+            "WHERE session_id = ? ORDER BY timestamp ASC", (session_id,)).fetchall(), args.sessions)
+        conn.close()
+
+        start = time.perf_counter()
+        database = ChatDatabase(path)  # Aplica la migración 3 y compacta el archivo
+        migration = time.perf_counter() - start
+        size_after = os.path.getsize(path)
+        load_after = load_all(database.get_session_messages, args.sessions)
+        stats = database.get_storage_stats()
+        database.close()
+
+    print(f"migración a la versión 3: {migration:.1f} s; {stats['references']} referencias a {stats['images']} imágenes")
+    print(f"tamaño de la base:  {size_before / 2 ** 20:8.1f} MiB -> {size_after / 2 ** 20:8.1f} MiB")
+    print(f"cargar una sesión:  {load_before:8.2f} ms  -> {load_after:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Consultas de ChatDatabase sobre una base con muchos mensajes, antes y después de la migración de índices
+Uso: python benchmarks/bench_db_indexes.py [--messages 1000000] [--sessions 2000] [--repeat 20]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa random para elegir sesiones al azar
+import random  # Sesiones consultadas
+# Importa sqlite3 para crear la base con el esquema anterior
+import sqlite3  # Base de datos local
+# Importa tempfile para la base de datos temporal
+import tempfile  # Directorio temporal
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.database_module import ChatDatabase, MIGRATIONS, SCHEMA_VERSION  # Base de datos de chat y sus migraciones
+
+
+def build_v1(path, messages, sessions):
+    """Crea una base con el esquema original (versión 1, sin índices) y messages mensajes sintéticos"""
+    conn = sqlite3.connect(path)
+    for statement in MIGRATIONS[0][2]:
+        conn.execute(statement)
+    conn.execute("PRAGMA user_version = 1")
+    conn.executemany("INSERT INTO chat_sessions (session_name) VALUES (?)", ((f"sesión {s}",) for s in range(sessions)))
+    conn.executemany(
+        "INSERT INTO chat_messages (session_id, message_type, content, timestamp) VALUES (?, ?, ?, datetime(?, 'unixepoch'))",
+        ((i % sessions + 1, "user" if i % 2 else "assistant", f"mensaje sintético {i}", 1700000000 + i)
+         for i in range(messages)))
+    conn.commit()
+    conn.close()
+
+
+def timed(function, repeat):
+    """Media en ms de repeat llamadas"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índices y contador de mensajes de ChatDatabase")
+    parser.add_argument("--messages", type=int, default=1_000_000, help="Mensajes sintéticos")
+    parser.add_argument("--sessions", type=int, default=2000, help="Sesiones entre las que se reparten")
+    parser.add_argument("--repeat", type=int, default=20, help="Repeticiones por consulta")
+    args = parser.parse_args()
+    rng = random.Random(0)
+    victims = rng.sample(range(1, args.sessions + 1), 2 * args.repeat)  # Sesiones a borrar (distintas antes y después)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "chat.db")
+        start = time.perf_counter()
+        build_v1(path, args.messages, args.sessions)
+        print(f"{args.messages} mensajes en {args.sessions} sesiones creados en {time.perf_counter() - start:.1f} s")
+
+        # Esquema v1: mismas consultas que ChatDatabase hacía antes de la migración
+        conn = sqlite3.connect(path)
+        before = {
+            "get_session_messages": timed(lambda: conn.execute(
+                "SELECT id, message_type, content, user_name, emotion, image_data, timestamp FROM chat_messages "
+                "WHERE session_id = ? ORDER BY timestamp ASC", (rng.randint(1, args.sessions),)).fetchall(), args.repeat),
+            "get_all_sessions": timed(lambda: conn.execute(
+                "SELECT id, session_name, created_at, last_updated, "
+                "(SELECT COUNT(*) FROM chat_messages WHERE session_id = chat_sessions.id) FROM chat_sessions "
+                "ORDER BY last_updated DESC").fetchall(), 1)  # Un COUNT(*) por sesión sobre toda la tabla: una vez basta
+        }
+        deleted = iter(victims[:args.repeat])
+
+        def delete_v1():
+            session_id = next(deleted)
+            with conn:
+                conn.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+                conn.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
+
+        before["delete_session"] = timed(delete_v1, args.repeat)
+
+        # Solo la migración 2 (índice y contador), igual que la aplica init_database
+        start = time.perf_counter()
+        conn.execute("BEGIN")
+        for statement in MIGRATIONS[1][2]:
+            conn.execute(statement)
+        conn.execute("PRAGMA user_version = 2")
+        conn.commit()
+        migration = time.perf_counter() - start
+        conn.close()
+
+        database = ChatDatabase(path)  # Aplica el resto de migraciones hasta SCHEMA_VERSION (fuera de la medida)
+        after = {
+            "get_session_messages": timed(lambda: database.get_session_messages(rng.randint(1, args.sessions)), args.repeat),
+            "get_all_sessions": timed(database.get_all_sessions, max(1, args.repeat // 10))
+        }
+        deleted = iter(victims[args.repeat:])
+        after["delete_session"] = timed(lambda: database.delete_session(next(deleted)), args.repeat)
+        database.close()
+
+    print(f"migración a la versión 2: {migration:.1f} s (una sola vez)")
+    print(f"{'consulta':<22}{'v1 (ms)':>12}{f'v{SCHEMA_VERSION} (ms)':>12}")
+    for name, ms in after.items():
+        print(f"{name:<22}{before[name]:>12.2f}{ms:>12.2f}  ({before[name] / ms:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Abrir una sesión larga: todos los mensajes frente a la última página, y recorrido completo por páginas
+Uso: python benchmarks/bench_db_pagination.py [--messages 20000] [--page 50]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa tempfile para la base de datos temporal
+import tempfile  # Directorio temporal
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.database_module import ChatDatabase  # Base de datos de chat
+
+
+def timed(function):
+    """Devuelve (resultado, ms)"""
+    start = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paginación por clave de los mensajes de una sesión")
+    parser.add_argument("--messages", type=int, default=20000, help="Mensajes en la sesión")
+    parser.add_argument("--page", type=int, default=50, help="Mensajes por página")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = ChatDatabase(os.path.join(tmp, "chat.db"))
+        session_id = database.create_new_session("larga")
+        with database._connect() as conn:  # Carga masiva en una sola transacción
+            conn.executemany(
+                "INSERT INTO chat_messages (session_id, message_type, content, timestamp) "
+                "VALUES (?, ?, ?, datetime(?, 'unixepoch'))",
+                ((session_id, "user" if i % 2 else "assistant", f"mensaje {i} " * 30, 1700000000 + i)
+                 for i in range(args.messages)))
+
+        everything, all_ms = timed(lambda: database.get_session_messages(session_id))
+        page, page_ms = timed(lambda: database.get_session_messages(session_id, limit=args.page))
+        # Subir hasta el principio: una consulta por página, cada una a partir del mensaje más antiguo recibido
+        start = time.perf_counter()
+        oldest, pages = page[0]['id'], 1
+        while True:
+            older = database.get_session_messages(session_id, before_id=oldest, limit=args.page)
+            if not older:
+                break
+            oldest, pages = older[0]['id'], pages + 1
+        scroll_ms = (time.perf_counter() - start) * 1000
+        streamed, iter_ms = timed(lambda: sum(1 for _ in database.iter_session_messages(session_id, args.page)))
+        database.close()
+
+    print(f"sesión completa ({len(everything)} mensajes):   {all_ms:8.2f} ms")
+    print(f"última página ({len(page)} mensajes):         {page_ms:8.2f} ms")
+    print(f"páginas anteriores ({pages} en total):       {scroll_ms / max(1, pages - 1):8.3f} ms por página")
+    print(f"iter_session_messages ({streamed} mensajes): {iter_ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Mensajes/s de ChatDatabase en sesiones con muchas escrituras: conexión por llamada frente a conexión persistente con WAL
+Uso: python benchmarks/bench_db_writes.py [--sessions 5] [--messages 400] [--synchronous NORMAL]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa sqlite3 para la conexión por llamada
+import sqlite3  # Base de datos local
+# Importa tempfile para las bases de datos temporales
+import tempfile  # Directorio temporal
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules import database_module  # Módulo de base de datos
+from modules.database_module import ChatDatabase, register_functions  # Base de datos de chat y sus funciones SQL
+
+
+class PerCallDatabase(ChatDatabase):
+    """Comportamiento anterior: una conexión nueva por operación con los pragmas por defecto de SQLite"""
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        register_functions(conn)  # Las migraciones 3 y 4 las necesitan
+        return conn
+
+
+def run(database, sessions, messages):
+    """Simula conversaciones (mensaje del usuario + respuesta) y devuelve mensajes/s"""
+    start = time.perf_counter()
+    for s in range(sessions):
+        session_id = database.create_new_session(f"sesión {s}")
+        for i in range(messages // 2):
+            database.save_message(session_id, "user", f"mensaje {i} " * 8, user_name="benchmark", emotion="feliz")
+            database.save_message(session_id, "assistant", f"respuesta {i} " * 40)
+        database.get_session_messages(session_id)
+        database.get_all_sessions()
+    return sessions * messages / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rendimiento de escritura de ChatDatabase")
+    parser.add_argument("--sessions", type=int, default=5, help="Sesiones simuladas")
+    parser.add_argument("--messages", type=int, default=400, help="Mensajes por sesión")
+    parser.add_argument("--synchronous", default=None, help="Sobrescribe DB_SYNCHRONOUS (OFF, NORMAL, FULL)")
+    args = parser.parse_args()
+    if args.synchronous:
+        database_module.DB_SYNCHRONOUS = args.synchronous
+
+    with tempfile.TemporaryDirectory() as tmp:
+        per_call = run(PerCallDatabase(os.path.join(tmp, "per_call.db")), args.sessions, args.messages)
+        persistent_db = ChatDatabase(os.path.join(tmp, "persistent.db"))
+        persistent = run(persistent_db, args.sessions, args.messages)
+        journal = persistent_db._connect().execute("PRAGMA journal_mode").fetchone()[0]
+        persistent_db.close()
+    print(f"conexión por llamada (journal por defecto): {per_call:10.0f} mensajes/s")
+    print(f"conexión persistente ({journal}, synchronous={database_module.DB_SYNCHRONOUS}): {persistent:10.0f} mensajes/s"
+          f"  ({persistent / per_call:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Informe del modelo int8: precisión frente a models/classification_report.txt, tamaño y latencia por imagen
+Uso: python benchmarks/bench_int8.py [--export] [--runs 200]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa re para leer el informe base
+import re  # Expresiones regulares
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # Para percentiles y métricas
+from sklearn.model_selection import train_test_split  # Misma partición que el entrenamiento
+
+from modules.vision_module import VisionModule  # Módulo de visión
+from config import INT8_MODEL_PATH, MODEL_PATH, MODELS_DIR  # Rutas de los modelos
+
+BASELINE_REPORT = MODELS_DIR / "classification_report.txt"  # Informe del modelo float32
+OUTPUT_REPORT = MODELS_DIR / "int8_report.txt"  # Informe generado
+
+
+def baseline_accuracy():
+    """Lee la precisión global del informe de clasificación existente"""
+    if not BASELINE_REPORT.exists():
+        return None
+    match = re.search(r"^\s*accuracy\s+([\d.]+)", BASELINE_REPORT.read_text(encoding='utf-8'), re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def evaluate(vision, X, labels, runs):
+    """Devuelve (precisión sobre X, p50 ms, p99 ms) con el backend actual de vision"""
+    predicted = []
+    for i in range(0, len(X), 64):
+        batch = np.asarray(X[i:i + 64]).astype(np.float32) * (1.0 / 255.0)
+        predicted.extend(r.get("emotion") for r in vision._classify(vision._run_network(batch)))
+    accuracy = float(np.mean([p == t for p, t in zip(predicted, labels)]))
+    sample = np.asarray(X[:1]).astype(np.float32) * (1.0 / 255.0)
+    for _ in range(10):
+        vision._run_network(sample)  # Calentamiento
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        vision._run_network(sample)
+        samples.append((time.perf_counter() - start) * 1000)
+    return accuracy, float(np.percentile(samples, 50)), float(np.percentile(samples, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el modelo float32 con el cuantizado a int8")
+    parser.add_argument("--export", action="store_true", help="Vuelve a exportar el modelo int8")
+    parser.add_argument("--runs", type=int, default=200, help="Predicciones medidas para la latencia")
+    args = parser.parse_args()
+
+    vision = VisionModule(backend="function")
+    if vision.model is None:
+        print("❌ Modelo CNN no disponible")
+        return
+    if args.export or not os.path.exists(INT8_MODEL_PATH):
+        vision.export_int8()
+
+    # Validación con la misma partición que train_from_emociones
+    X, y_idx, class_names = vision.load_dataset_cached()
+    _, val_idx = train_test_split(np.arange(len(X)), test_size=0.2, random_state=42)
+    X_val = X[np.sort(val_idx)]
+    labels = [class_names[i] for i in y_idx[np.sort(val_idx)]]
+
+    rows = []
+    for backend, path in (("function", MODEL_PATH), ("tflite_int8", INT8_MODEL_PATH)):
+        vision.set_backend(backend)
+        accuracy, p50, p99 = evaluate(vision, X_val, labels, args.runs)
+        rows.append((backend, accuracy, os.path.getsize(path) / 1024, p50, p99))
+
+    lines = [f"{'modelo':<12} {'precisión':>10} {'tamaño (KB)':>12} {'p50 (ms)':>9} {'p99 (ms)':>9}"]
+    for backend, accuracy, size_kb, p50, p99 in rows:
+        lines.append(f"{backend:<12} {accuracy:>10.3f} {size_kb:>12.0f} {p50:>9.2f} {p99:>9.2f}")
+    baseline = baseline_accuracy()
+    if baseline is not None:
+        lines.append(f"Precisión de referencia ({BASELINE_REPORT.name}): {baseline:.2f}")
+    lines.append(f"Validación: {len(labels)} imágenes")
+    report = "\n".join(lines)
+    print(report)
+    OUTPUT_REPORT.write_text(report + "\n", encoding='utf-8')
+
+
+if __name__ == "__main__":
+    main()
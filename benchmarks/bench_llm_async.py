@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de AsyncLLMModule contra un Ollama falso local: throughput según la concurrencia
+Uso: python benchmarks/bench_llm_async.py [--requests 64] [--delay 0.2] [--concurrency 1 2 4 8 16]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa asyncio para lanzar las peticiones concurrentes
+import asyncio  # Bucle de eventos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from loguru import logger  # Logger del proyecto
+
+from fake_ollama import FakeOllama  # Servidor falso de Ollama
+from modules.async_llm_module import AsyncLLMModule  # Cliente asíncrono
+
+
+async def run_level(url, concurrency, n, stream):
+    """Lanza n conversaciones con el límite de concurrencia dado y devuelve (peticiones/s, fallbacks)"""
+    async with AsyncLLMModule(max_concurrency=concurrency, pool_size=concurrency) as llm:
+        llm.base_url = url
+
+        async def one(i):
+            if stream:
+                return "".join([fragment async for fragment in llm.stream("", "", f"hola {i}")])
+            return await llm.generate("", "", f"hola {i}")
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(n)))
+        elapsed = time.perf_counter() - start
+    fallbacks = sum(1 for r in results if isinstance(r, dict) and r.get("fallback"))
+    return n / elapsed, fallbacks
+
+
+async def check_cancellation(url):
+    """Cancela una generación en curso y comprueba que la tarea termina enseguida"""
+    async with AsyncLLMModule() as llm:
+        llm.base_url = url
+        task = asyncio.create_task(llm.generate("", "", "hola"))
+        await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput del cliente asíncrono según la concurrencia")
+    parser.add_argument("--requests", type=int, default=64, help="Peticiones por nivel")
+    parser.add_argument("--delay", type=float, default=0.2, help="Latencia simulada de Ollama por petición (s)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Niveles de concurrencia")
+    args = parser.parse_args()
+    logger.remove()  # Silencia los logs del módulo durante la medición
+
+    fake = FakeOllama(delay=args.delay).start()
+    print(f"{'concurrencia':>12} {'generate req/s':>15} {'stream req/s':>13}")
+    for concurrency in args.concurrency:
+        generate_rps, generate_fallbacks = asyncio.run(run_level(fake.url, concurrency, args.requests, stream=False))
+        stream_rps, _ = asyncio.run(run_level(fake.url, concurrency, args.requests, stream=True))
+        note = f"  ({generate_fallbacks} fallbacks)" if generate_fallbacks else ""
+        print(f"{concurrency:>12} {generate_rps:>15.1f} {stream_rps:>13.1f}{note}")
+    print(f"Cancelación de una generación en curso: {asyncio.run(check_cancellation(fake.url)):.1f} ms")
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
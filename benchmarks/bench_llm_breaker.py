@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Coste de una caída de Ollama por mensaje, con y sin cortocircuito, y recuperación mediante la sonda de salud
+Uso: python benchmarks/bench_llm_breaker.py [--messages 10] [--read-timeout 2]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa socket para simular un Ollama colgado (acepta conexiones pero no responde)
+import socket  # Servidor que no responde
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from loguru import logger  # Logger del proyecto
+
+from fake_ollama import FakeOllama  # Servidor falso de Ollama
+from modules.llm_module import LLMModule  # Módulo LLM
+from modules.circuit_breaker import CircuitBreaker  # Cortocircuito
+
+
+def hung_server():
+    """Socket que acepta conexiones en la cola del kernel pero nunca responde"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(128)
+    return server, f"http://127.0.0.1:{server.getsockname()[1]}"
+
+
+def run_messages(llm, messages):
+    """Envía mensajes y devuelve la latencia de cada uno (ms)"""
+    latencies = []
+    for i in range(messages):
+        start = time.perf_counter()
+        llm.generate_response("", "", f"mensaje {i}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia por mensaje con Ollama caído")
+    parser.add_argument("--messages", type=int, default=10, help="Mensajes enviados durante la caída")
+    parser.add_argument("--read-timeout", type=float, default=2.0, help="Timeout de lectura (s; 30 en producción)")
+    args = parser.parse_args()
+    logger.remove()  # Silencia los logs del módulo durante la medición
+
+    server, url = hung_server()
+    for label, threshold in (("sin cortocircuito", 10 ** 9), ("con cortocircuito", 3)):
+        llm = LLMModule()
+        llm.base_url = url
+        llm.timeout = (1, args.read_timeout)
+        llm.breaker = CircuitBreaker(probe=llm.test_connection, failure_threshold=threshold, probe_interval=0.5)
+        latencies = run_messages(llm, args.messages)
+        print(f"{label:<18} total {sum(latencies) / 1000:6.1f} s | por mensaje: " + " ".join(f"{ms:.0f}" for ms in latencies) + " ms")
+
+    # Recuperación: Ollama vuelve y la sonda cierra el circuito sin que ningún mensaje espere
+    fake = FakeOllama().start()
+    llm.base_url = fake.url
+    start = time.perf_counter()
+    while llm.breaker_stats()["state"] == "open":
+        time.sleep(0.05)
+    print(f"Sonda: circuito {llm.breaker_stats()['state']} {(time.perf_counter() - start) * 1000:.0f} ms después de volver Ollama")
+    result = llm.generate_response("", "", "hola")
+    print(f"Primer mensaje tras la recuperación: fallback={result.get('fallback', False)}, circuito {llm.breaker_stats()['state']}")
+
+    # Lista de modelos con TTL: change_model no vuelve a consultar /api/tags
+    before = fake.tags_requests  # Solo /api/tags: cada cambio real también envía una precarga
+    for _ in range(20):
+        llm.change_model("mistral:latest")
+        llm.change_model("llama3:latest")
+    print(f"40 change_model -> {fake.tags_requests - before} consulta(s) a /api/tags")
+    fake.stop()
+    server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la caché de respuestas del LLM: petición a Ollama (fallo de caché) frente a acierto en memoria y en disco
+Uso: python benchmarks/bench_llm_cache.py [--delay 0.5] [--repeats 1000]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa tempfile para la base de datos de caché temporal
+import tempfile  # Directorio temporal
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from loguru import logger  # Logger del proyecto
+
+from fake_ollama import FakeOllama  # Servidor falso de Ollama
+from modules.llm_module import LLMModule, ResponseCache  # Módulo LLM y caché
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia con y sin caché de respuestas")
+    parser.add_argument("--delay", type=float, default=0.5, help="Latencia simulada de Ollama (s)")
+    parser.add_argument("--repeats", type=int, default=1000, help="Aciertos de caché a medir")
+    args = parser.parse_args()
+    logger.remove()  # Silencia los logs del módulo durante la medición
+
+    fake = FakeOllama(delay=args.delay).start()
+    context = "El usuario está en estado emocional: feliz"  # Contexto fijo de generate_model_response (temperatura 0)
+    with tempfile.TemporaryDirectory() as tmp:
+        llm = LLMModule()
+        llm.base_url = fake.url
+        llm.response_cache = ResponseCache(db_path=os.path.join(tmp, "llm_cache.db"))
+
+        start = time.perf_counter()
+        llm.generate_response("", "", context, temperature=0)
+        miss_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            llm.generate_response("", "", context, temperature=0)
+        memory_us = (time.perf_counter() - start) / args.repeats * 1e6
+
+        # Nueva instancia con la misma base de datos: el primer acierto viene de disco
+        llm_disk = LLMModule()
+        llm_disk.base_url = fake.url
+        llm_disk.response_cache = ResponseCache(db_path=os.path.join(tmp, "llm_cache.db"))
+        start = time.perf_counter()
+        llm_disk.generate_response("", "", context, temperature=0)
+        disk_us = (time.perf_counter() - start) * 1e6
+
+        print(f"Fallo de caché (Ollama):   {miss_ms:10.1f} ms")
+        print(f"Acierto en memoria:        {memory_us:10.1f} µs")
+        print(f"Acierto en disco (SQLite): {disk_us:10.1f} µs")
+        print(f"Peticiones recibidas por Ollama: {fake.requests}")
+        print(f"Estadísticas: {llm.response_cache.stats()}")
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la reutilización de la caché KV de Ollama: evaluación del prompt por turno en modo "prompt" frente a "context"
+Uso: python benchmarks/bench_llm_context.py [--turns 30] [--per-token-ms 0.2]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from loguru import logger  # Logger del proyecto
+
+from fake_ollama import FakeOllama  # Servidor falso de Ollama
+from modules.llm_module import LLMModule  # Módulo LLM
+
+
+def run_conversation(url, mode, turns):
+    """Mantiene una conversación de varios turnos y devuelve las métricas de cada uno"""
+    llm = LLMModule()
+    llm.base_url = url
+    llm.conversation_mode = mode
+    llm.response_cache.max_size = 0  # Cada turno llega a Ollama
+    llm.prompt_builder.token_budget = 10 ** 6  # Sin recortes: el historial crece libremente
+    history = []
+    rows = []
+    for turn in range(turns):
+        message = f"Este es el mensaje número {turn} de la conversación con algo de texto adicional"
+        start = time.perf_counter()
+        reply = "".join(llm.generate_response_stream("", "", message, history, session_id="bench"))
+        elapsed = (time.perf_counter() - start) * 1000
+        history.append({"user_message": message, "assistant_response": reply.strip()})
+        rows.append((llm.last_metrics.get("prompt_eval_count"), llm.last_metrics.get("prompt_eval_duration", 0) / 1e6, elapsed))
+    llm.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluación del prompt por turno con y sin context de Ollama")
+    parser.add_argument("--turns", type=int, default=30, help="Turnos de la conversación")
+    parser.add_argument("--per-token-ms", type=float, default=0.2, help="Coste simulado por token de prompt (ms)")
+    args = parser.parse_args()
+    logger.remove()  # Silencia los logs del módulo durante la medición
+
+    fake = FakeOllama(tokens=20, prompt_eval_per_token=args.per_token_ms / 1000).start()
+    results = {mode: run_conversation(fake.url, mode, args.turns) for mode in ("prompt", "context")}
+    print(f"{'turno':>5} | {'prompt: tokens':>14} {'eval ms':>8} {'total ms':>9} | {'context: tokens':>15} {'eval ms':>8} {'total ms':>9}")
+    for turn in range(args.turns):
+        if turn in (0, 1, 4, 9) or (turn + 1) % 10 == 0:
+            p, c = results["prompt"][turn], results["context"][turn]
+            print(f"{turn + 1:>5} | {p[0]:>14} {p[1]:>8.1f} {p[2]:>9.1f} | {c[0]:>15} {c[1]:>8.1f} {c[2]:>9.1f}")
+    for mode, rows in results.items():
+        print(f"{mode:>8}: tokens de prompt evaluados en total = {sum(r[0] for r in rows)}")
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Demostración del planificador de LLMModule contra un Ollama falso que atiende una petición a la vez:
+prioridad de los mensajes interactivos sobre los saludos automáticos y fusión de peticiones idénticas
+Uso: python benchmarks/bench_llm_scheduler.py [--delay 0.2]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa threading para simular varias ventanas a la vez
+import threading  # Llamadas concurrentes
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from loguru import logger  # Logger del proyecto
+
+from fake_ollama import FakeOllama  # Servidor falso de Ollama
+from modules.llm_module import LLMModule  # Módulo LLM
+from modules.llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND  # Prioridades
+
+
+def concurrent_calls(llm, calls):
+    """Lanza las llamadas (nombre, mensaje, prioridad) casi a la vez y devuelve el instante en que termina cada una"""
+    finished = {}
+    start = time.perf_counter()
+
+    def run(name, message, priority):
+        llm.generate_response("", "", message, priority=priority)
+        finished[name] = (time.perf_counter() - start) * 1000
+
+    threads = []
+    for name, message, priority in calls:
+        thread = threading.Thread(target=run, args=(name, message, priority))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.005)  # Orden de llegada determinista
+    for thread in threads:
+        thread.join()
+    return finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prioridades y fusión de peticiones del planificador")
+    parser.add_argument("--delay", type=float, default=0.2, help="Latencia simulada por generación (s)")
+    args = parser.parse_args()
+    logger.remove()  # Silencia los logs del módulo durante la medición
+
+    fake = FakeOllama(delay=args.delay).start()
+    llm = LLMModule()
+    llm.base_url = fake.url
+    llm.response_cache.max_size = 0  # Todas las peticiones llegan al planificador
+
+    # Cuatro saludos automáticos encolados y después un mensaje escrito por el usuario
+    calls = [(f"saludo {i}", f"El usuario está en estado emocional: {i}", PRIORITY_BACKGROUND) for i in range(4)]
+    calls.append(("mensaje del usuario", "hola, ¿qué tal?", PRIORITY_INTERACTIVE))
+    finished = concurrent_calls(llm, calls)
+    print("Orden de finalización (una generación a la vez):")
+    for name, ms in sorted(finished.items(), key=lambda item: item[1]):
+        print(f"  {name:<22} {ms:8.0f} ms")
+
+    # Ocho ventanas piden a la vez el mismo saludo
+    before = fake.requests
+    concurrent_calls(llm, [(f"ventana {i}", "El usuario está en estado emocional: feliz", PRIORITY_BACKGROUND) for i in range(8)])
+    print(f"8 peticiones idénticas simultáneas -> {fake.requests - before} llamada(s) a Ollama")
+    print(f"Métricas de la cola: {llm.queue_stats()}")
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
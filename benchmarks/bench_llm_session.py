@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark del coste por petición a Ollama: requests.post sin sesión frente a la sesión con pool de LLMModule
+Uso: python benchmarks/bench_llm_session.py [--requests 300]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import requests  # Peticiones sin sesión (comportamiento anterior)
+
+from fake_ollama import FakeOllama  # Servidor falso de Ollama
+from modules.llm_module import LLMModule  # Módulo LLM
+
+
+def measure(fake, call, n):
+    """Ejecuta call n veces y devuelve (ms por petición, conexiones TCP abiertas)"""
+    connections_before = fake.connections
+    start = time.perf_counter()
+    for _ in range(n):
+        call()
+    elapsed = time.perf_counter() - start
+    return elapsed / n * 1000, fake.connections - connections_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coste por petición con y sin pool de conexiones")
+    parser.add_argument("--requests", type=int, default=300, help="Peticiones por escenario")
+    args = parser.parse_args()
+
+    fake = FakeOllama().start()
+    llm = LLMModule()
+    llm.base_url = fake.url
+    llm.response_cache.max_size = 0  # Cada llamada llega al servidor
+    payload = {"model": llm.model, "prompt": "hola", "stream": False}
+
+    scenarios = {
+        "requests.post (sin sesión)": lambda: requests.post(f"{fake.url}/api/generate", json=payload, timeout=30),
+        "llm.session.post (pool)": lambda: llm.session.post(f"{fake.url}/api/generate", json=payload, timeout=llm.timeout),
+        "LLMModule.generate_response": lambda: llm.generate_response("", "", "hola"),
+    }
+    print(f"{'escenario':<30} {'ms/petición':>12} {'conexiones TCP':>15}")
+    for name, call in scenarios.items():
+        call()  # Calentamiento
+        ms, connections = measure(fake, call, args.requests)
+        print(f"{name:<30} {ms:>12.3f} {connections:>15}")
+    llm.close()
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Latencia del primer turno frente a los siguientes, sin y con precarga del modelo (y tras change_model)
+Uso: python benchmarks/bench_llm_warmup.py [--load-delay 2.0] [--turns 4]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from loguru import logger  # Logger del proyecto
+
+from fake_ollama import FakeOllama  # Servidor falso de Ollama
+from modules.llm_module import LLMModule  # Módulo LLM
+
+
+def turns(llm, count, prefix):
+    """Envía count mensajes distintos y devuelve la latencia de cada uno (ms)"""
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        llm.generate_response("", "", f"{prefix} {i}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def show(label, latencies):
+    print(f"{label:<34} primer turno {latencies[0]:7.0f} ms | siguientes " + " ".join(f"{ms:.0f}" for ms in latencies[1:]) + " ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arranque en frío frente a modelo precargado")
+    parser.add_argument("--load-delay", type=float, default=2.0, help="Tiempo simulado de carga del modelo (s)")
+    parser.add_argument("--turns", type=int, default=4, help="Turnos por escenario")
+    args = parser.parse_args()
+    logger.remove()  # Silencia los logs del módulo durante la medición
+
+    # Sin precarga: el primer mensaje paga la carga del modelo
+    fake = FakeOllama(delay=0.05, load_delay=args.load_delay).start()
+    llm = LLMModule()
+    llm.base_url = fake.url
+    show("sin precarga", turns(llm, args.turns, "frío"))
+    fake.stop()
+
+    # Con precarga: la aplicación arranca, el usuario tarda unos segundos en escribir
+    fake = FakeOllama(delay=0.05, load_delay=args.load_delay).start()
+    llm = LLMModule()
+    llm.base_url = fake.url
+    llm.warm_up()  # Equivale a LLMModule(preload=True) con la URL del servidor falso
+    time.sleep(args.load_delay + 0.2)  # Tiempo hasta el primer mensaje
+    show("con precarga", turns(llm, args.turns, "caliente"))
+    print(f"  precarga: {llm.warm_up_stats}")
+
+    # change_model recarga el modelo nuevo en segundo plano
+    llm.change_model("mistral:latest")
+    llm.wait_until_warm()
+    show("tras change_model (recargado)", turns(llm, args.turns, "cambio"))
+    fake.stop()
+
+
+if __name__ == "__main__":
+    main()
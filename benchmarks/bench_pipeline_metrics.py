@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Recorre el pipeline (emoción → LLM → base de datos) y muestra el desglose de latencias por etapa
+Uso: python benchmarks/bench_pipeline_metrics.py [--turns 20] [--image ruta.jpg] [--prometheus]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa tempfile para la base de datos temporal
+import tempfile  # Directorio temporal
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from loguru import logger  # Logger del proyecto
+
+from fake_ollama import FakeOllama  # Servidor falso de Ollama
+from modules.llm_module import LLMModule  # Módulo LLM
+from modules.database_module import ChatDatabase  # Base de datos de chat
+from modules.metrics import metrics  # Registro de métricas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Desglose de latencias del pipeline")
+    parser.add_argument("--turns", type=int, default=20, help="Turnos de conversación")
+    parser.add_argument("--image", default="", help="Imagen para medir también la etapa de visión (necesita el modelo)")
+    parser.add_argument("--prometheus", action="store_true", help="Imprime además el texto de Prometheus")
+    args = parser.parse_args()
+    logger.remove()  # Silencia los logs del módulo durante la medición
+
+    emotion = "feliz"
+    if args.image:
+        from modules.vision_module import VisionModule  # Importación diferida: necesita TensorFlow
+        vision = VisionModule()
+        for _ in range(args.turns):
+            emotion = vision.detect_emotion(args.image).get("emotion", emotion)
+
+    fake = FakeOllama(delay=0.02, tokens=8, token_delay=0.002).start()
+    llm = LLMModule()
+    llm.base_url = fake.url
+    with tempfile.TemporaryDirectory() as tmp:
+        database = ChatDatabase(os.path.join(tmp, "chat.db"))
+        session_id = database.create_new_session("benchmark")
+        history = []
+        for i in range(args.turns):
+            message = f"mensaje {i}"
+            database.save_message(session_id, "user", message, user_name="benchmark")
+            if i % 2:
+                response = "".join(llm.generate_response_stream("", emotion, message, history, session_id=str(session_id)))
+            else:
+                response = llm.generate_response("", emotion, message, history, session_id=str(session_id))["response"]
+            database.save_message(session_id, "assistant", response)
+            history.append({"user_message": message, "assistant_response": response})
+        database.get_session_messages(session_id)
+    fake.stop()
+
+    summary = metrics.summary()
+    print(f"{'etapa':<22}{'n':>6}{'media':>10}{'p50':>10}{'p95':>10}{'máx':>10}  (ms)")
+    for stage, stats in summary["stages"].items():
+        print(f"{stage:<22}{stats['count']:>6}{stats['avg_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+    print("contadores:", summary["counters"])
+    if args.prometheus:
+        print()
+        print(metrics.to_prometheus(), end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Coste de reconstruir las imágenes al cargar una sesión: original + archivo temporal + LANCZOS frente a miniatura guardada
+Uso: python benchmarks/bench_session_replay.py [--images 40] [--size 1600] [--tk]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para rutas
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa io para las imágenes en memoria
+import io  # Imágenes en memoria
+# Importa tempfile para la base de datos y el camino anterior con archivos temporales
+import tempfile  # Directorio temporal
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # Fotos sintéticas
+from PIL import Image  # Codificación y decodificación de imágenes
+
+from modules.database_module import ChatDatabase  # Base de datos de chat
+
+
+def synthetic_photo(seed, size):
+    """JPEG de size x size con gradientes y ruido (se comprime como una foto)"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size]
+    base = np.stack([(x + seed * 37) % 256, (y * 2) % 256, (x + y) % 256], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproducción de sesiones con fotos")
+    parser.add_argument("--images", type=int, default=40, help="Fotos en la sesión")
+    parser.add_argument("--size", type=int, default=1600, help="Lado de cada foto (px)")
+    parser.add_argument("--tk", action="store_true", help="Construye también los PhotoImage (necesita pantalla)")
+    args = parser.parse_args()
+
+    photo = None
+    if args.tk:
+        import tkinter as tk  # Importación diferida: necesita pantalla
+        from PIL import ImageTk
+        root = tk.Tk()
+        root.withdraw()
+        photo = ImageTk.PhotoImage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = ChatDatabase(os.path.join(tmp, "chat.db"))
+        session_id = database.create_new_session("fotos")
+        photos = [synthetic_photo(i, args.size) for i in range(args.images)]
+        start = time.perf_counter()
+        for i, data in enumerate(photos):
+            database.save_message(session_id, "image", f"Imagen {i}", image_data=data)
+        saving = (time.perf_counter() - start) / args.images * 1000
+        messages = database.get_session_messages(session_id)
+
+        # Antes: original a un archivo temporal, reabrirlo y redimensionarlo con LANCZOS
+        start = time.perf_counter()
+        for message in messages:
+            with tempfile.NamedTemporaryFile(dir=tmp, delete=False, suffix='.jpg') as tmp_img:
+                tmp_img.write(database.get_image_blob(message['image_hash']))
+            image = Image.open(tmp_img.name)
+            width, height = image.size
+            scale = min(180 / width, 180 / height, 1.0)
+            image = image.resize((int(width * scale), int(height * scale)), Image.Resampling.LANCZOS)
+            if photo:
+                photo(image)
+        before = time.perf_counter() - start
+
+        # Ahora: la miniatura guardada, decodificada desde memoria
+        start = time.perf_counter()
+        for message in messages:
+            thumbnail = database.get_image_thumbnail(message['image_hash'])
+            if photo:
+                photo(data=thumbnail)
+            else:
+                Image.open(io.BytesIO(thumbnail)).load()
+        after = time.perf_counter() - start
+        thumbnail_kb = len(thumbnail) / 1024
+        database.close()
+
+    print(f"guardar una foto (con miniatura): {saving:.1f} ms; miniatura de {thumbnail_kb:.0f} KiB")
+    print(f"reconstruir {args.images} fotos: {before * 1000:8.1f} ms -> {after * 1000:6.1f} ms  ({before / after:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark de arranque: tiempo de importación de los módulos y de carga del modelo CNN (diferida vs. síncrona)
+Uso: python benchmarks/bench_startup.py
+"""
+# Importa subprocess para medir cada escenario en un intérprete limpio
+import subprocess  # Procesos hijos
+# Importa sys y os para rutas
+import sys  # Ejecutable de Python
+import os  # Rutas
+
+# Raíz del proyecto (los escenarios se ejecutan desde ahí)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cada escenario imprime sus propias medidas; se ejecuta en un proceso nuevo para no heredar imports
+SCENARIOS = {
+    "import ChatDatabase/LLMModule": '''
+import sys, time
+t0 = time.perf_counter()
+from modules import ChatDatabase, LLMModule
+print(f"import: {(time.perf_counter() - t0) * 1000:.1f} ms, tensorflow cargado: {'tensorflow' in sys.modules}")
+''',
+    "VisionModule() síncrono": '''
+import time
+t0 = time.perf_counter()
+from modules import VisionModule
+vision = VisionModule()
+print(f"constructor: {(time.perf_counter() - t0) * 1000:.1f} ms")
+''',
+    "VisionModule(lazy=True)": '''
+import time
+t0 = time.perf_counter()
+from modules import VisionModule
+vision = VisionModule(lazy=True)
+t1 = time.perf_counter()
+vision.wait_until_ready()
+t2 = time.perf_counter()
+print(f"constructor: {(t1 - t0) * 1000:.1f} ms, modelo listo: {(t2 - t0) * 1000:.1f} ms")
+''',
+}
+
+
+def main():
+    for name, code in SCENARIOS.items():
+        result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+        output = result.stdout.strip().splitlines()[-1] if result.stdout.strip() else result.stderr.strip()[-200:]
+        print(f"{name:<32} {output}")
+
+
+if __name__ == "__main__":
+    main()
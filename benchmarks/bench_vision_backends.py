@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de latencia por imagen (p50/p99) para cada backend de inferencia de VisionModule
+Uso: python benchmarks/bench_vision_backends.py [--runs 200]
+"""
+# Importa argparse para los argumentos de línea de comandos
+import argparse  # Argumentos de línea de comandos
+# Importa sys y os para ajustar el path
+import sys  # Para manipular el path
+import os  # Para operaciones de sistema
+# Importa time para medir tiempos
+import time  # Para medir tiempos
+
+# Agrega la raíz del proyecto al path para importar módulos locales
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # Para percentiles y datos sintéticos
+
+from modules.vision_module import VisionModule  # Módulo de visión
+
+
+def percentiles(samples_ms):
+    """Devuelve (p50, p99) de una lista de tiempos en milisegundos"""
+    return float(np.percentile(samples_ms, 50)), float(np.percentile(samples_ms, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia por imagen de cada backend de inferencia")
+    parser.add_argument("--runs", type=int, default=200, help="Predicciones medidas por backend")
+    parser.add_argument("--warmup", type=int, default=10, help="Predicciones de calentamiento por backend")
+    args = parser.parse_args()
+
+    vision = VisionModule(backend="keras")  # Carga el modelo una sola vez
+    if vision.model is None:
+        print("❌ Modelo CNN no disponible")
+        return
+    # Imagen sintética ya preprocesada: solo se mide la inferencia
+    sample = np.random.rand(1, vision.img_height, vision.img_width, 3).astype(np.float32)
+
+    print(f"{'backend':<10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for backend in VisionModule.INFERENCE_BACKENDS:
+        vision.set_backend(backend)
+        if vision.backend != backend:
+            print(f"{backend:<10} {'no disponible':>21}")
+            continue
+        for _ in range(args.warmup):
+            vision._classify(vision._run_network(sample))  # Calentamiento (trazado, asignación de tensores)
+        samples = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            vision._classify(vision._run_network(sample))  # Red y clasificación, como en detect_emotion
+            samples.append((time.perf_counter() - start) * 1000)
+        p50, p99 = percentiles(samples)
+        print(f"{backend:<10} {p50:>10.2f} {p99:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
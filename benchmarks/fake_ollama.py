@@ -0,0 +1,161 @@
+"""
+Servidor HTTP local que imita la API de Ollama para los benchmarks (sin modelo real)
+"""
+# Importa json para las respuestas
+import json  # Serialización de respuestas
+# Importa socket para desactivar Nagle en las conexiones aceptadas
+import socket  # Opciones TCP
+# Importa threading para ejecutar el servidor en segundo plano
+import threading  # Hilo del servidor
+# Importa time para simular la latencia de generación
+import time  # Retardos simulados
+# Importa el servidor HTTP de la biblioteca estándar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Servidor HTTP con hilos
+
+
+class _Server(ThreadingHTTPServer):
+    """Servidor con hilos y cola de escucha amplia (con la de 5 por defecto se pierden SYN bajo carga)"""
+    request_queue_size = 128
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # El cliente cerró la conexión (p. ej. al cancelar una generación)
+
+
+class FakeOllama:
+    """
+    Servidor falso de Ollama: /api/tags, /api/generate (con y sin streaming) y /api/chat.
+    Cuenta peticiones y conexiones TCP aceptadas para medir la reutilización de sockets.
+    Simula la evaluación del prompt (prompt_eval_per_token) como Ollama: con un array context
+    solo se evalúan los tokens nuevos, el resto ya está en la caché KV.
+    Simula también la carga del modelo (load_delay): la paga la primera petición a un modelo
+    que no está en memoria, que se descarga al vencer su keep_alive.
+    """
+
+    def __init__(self, delay: float = 0.0, tokens: int = 5, token_delay: float = 0.0, prompt_eval_per_token: float = 0.0,
+                 load_delay: float = 0.0):
+        self.delay = delay  # Retardo antes de responder (s)
+        self.prompt_eval_per_token = prompt_eval_per_token  # Coste simulado por token de prompt evaluado (s)
+        self.load_delay = load_delay  # Coste simulado de cargar un modelo en memoria (s)
+        self.loaded = {}  # modelo -> instante en que se descarga
+        self.tokens = tokens  # Fragmentos por respuesta
+        self.token_delay = token_delay  # Retardo entre fragmentos (s)
+        self.requests = 0  # Peticiones atendidas
+        self.tags_requests = 0  # Consultas GET /api/tags (lista de modelos)
+        self.connections = 0  # Conexiones TCP aceptadas
+        self.payloads = []  # Cuerpos JSON recibidos
+        self._lock = threading.Lock()
+        self.server = _Server(("127.0.0.1", 0), self._make_handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Permite keep-alive
+
+            def setup(self):
+                super().setup()
+                # Sin TCP_NODELAY, cabeceras y cuerpo en escrituras separadas chocan con el ACK retardado (~40 ms)
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with fake._lock:
+                    fake.connections += 1
+
+            def log_message(self, *args):
+                pass  # Silencia el log por petición
+
+            def _send_json(self, obj):
+                body = json.dumps(obj).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests += 1
+                    fake.tags_requests += self.path == "/api/tags"
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": "llama3:latest"}, {"name": "mistral:latest"}]})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                with fake._lock:
+                    fake.requests += 1
+                    fake.payloads.append(payload)
+                load_duration = fake._load(payload.get("model"), payload.get("keep_alive", "5m"))
+                if not payload.get("prompt") and not payload.get("messages"):
+                    self._send_json({"model": payload.get("model"), "done": True, "done_reason": "load",
+                                     "load_duration": load_duration})  # Solo precarga
+                    return
+                time.sleep(fake.delay)
+                words = [f"palabra{i} " for i in range(fake.tokens)]
+                chat = self.path == "/api/chat"
+                # Tokens de prompt a evaluar: con context solo los del turno nuevo
+                if chat:
+                    prompt_tokens = sum(len(m.get("content", "").split()) for m in payload.get("messages", []))
+                else:
+                    prompt_tokens = len(payload.get("prompt", "").split())
+                start = time.perf_counter()
+                time.sleep(prompt_tokens * fake.prompt_eval_per_token)
+                context = list(payload.get("context") or []) + list(range(prompt_tokens + len(words)))
+                summary = {
+                    "done": True,
+                    "load_duration": load_duration,
+                    "context": context,
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int((time.perf_counter() - start) * 1e9),
+                    "eval_count": len(words)
+                }
+                if not payload.get("stream", True):
+                    text = "".join(words)
+                    message = {"message": {"role": "assistant", "content": text}} if chat else {"response": text}
+                    self._send_json({"model": payload.get("model"), **summary, **message})
+                    return
+                # Streaming NDJSON con transferencia por trozos
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for word in words:
+                    time.sleep(fake.token_delay)
+                    fragment = {"message": {"role": "assistant", "content": word}} if chat else {"response": word}
+                    self._write_chunk(json.dumps({"done": False, **fragment}) + "\n")
+                self._write_chunk(json.dumps(summary) + "\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, text):
+                data = text.encode('utf-8')
+                self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def _load(self, model: str, keep_alive) -> int:
+        """Carga el modelo si no está en memoria y renueva su keep_alive; devuelve la carga en ns"""
+        seconds = {"s": 1, "m": 60, "h": 3600}
+        if isinstance(keep_alive, str) and keep_alive[-1:] in seconds:
+            keep_alive = float(keep_alive[:-1]) * seconds[keep_alive[-1]]
+        keep_alive = float(keep_alive)
+        with self._lock:
+            needs_load = self.loaded.get(model, 0) < time.time()
+        start = time.perf_counter()
+        if needs_load:
+            time.sleep(self.load_delay)
+        with self._lock:
+            self.loaded[model] = time.time() + (keep_alive if keep_alive >= 0 else 10 ** 9)
+        return int((time.perf_counter() - start) * 1e9)
+
+    def start(self) -> "FakeOllama":
+        """Arranca el servidor en un hilo en segundo plano"""
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """Detiene el servidor"""
+        self.server.shutdown()
+        self.server.server_close()
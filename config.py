@@ -5,6 +5,8 @@ Configuración centralizada del proyecto Agente de Visión
 import os
 # Importa Path para manejo de rutas
 from pathlib import Path
+# Importa json para leer los usuarios inscritos
+import json
 
 # Rutas del proyecto
 BASE_DIR = Path(__file__).parent  # Directorio base del proyecto
@@ -12,10 +14,70 @@ MODELS_DIR = BASE_DIR / "models"  # Carpeta de modelos
 
 # Configuración de la CNN (Local)
 MODEL_PATH = os.getenv("MODEL_PATH", "models/emotion_model.h5")  # Ruta al modelo CNN
+VISION_BATCH_SIZE = int(os.getenv("VISION_BATCH_SIZE", "32"))  # Imágenes por lote en inferencia por lotes
+VISION_DECODE_WORKERS = int(os.getenv("VISION_DECODE_WORKERS", "4"))  # Hilos para decodificar imágenes en paralelo
+# Backend de inferencia de la CNN: "keras" (model.predict), "call" (model(x, training=False)),
+# "function" (tf.function con firma fija), "tflite" (intérprete TFLite en CPU) o "tflite_int8" (modelo cuantizado)
+VISION_INFERENCE_BACKEND = os.getenv("VISION_INFERENCE_BACKEND", "function")
+VISION_CACHE_SIZE = int(os.getenv("VISION_CACHE_SIZE", "256"))  # Predicciones en la caché LRU en memoria (0 = desactivada)
+VISION_CACHE_PATH = os.getenv("VISION_CACHE_PATH", "")  # Archivo SQLite de caché persistente (vacío = desactivada)
+VISION_LOADER_WORKERS = int(os.getenv("VISION_LOADER_WORKERS", "0"))  # Procesos para cargar el dataset (0 = núcleos de CPU)
+VISION_DATASET_CACHE_DIR = os.getenv("VISION_DATASET_CACHE_DIR", "models/dataset_cache")  # Caché memmap del dataset (vacío = desactivada)
+# Pipeline de entrenamiento: "memmap" (caché memory-mapped), "memory" (todo en RAM) o "tfdata" (streaming con tf.data)
+VISION_TRAIN_PIPELINE = os.getenv("VISION_TRAIN_PIPELINE", "memmap")
+CENTROID_HEAD_PATH = os.getenv("CENTROID_HEAD_PATH", "models/centroid_head.npz")  # Cabeza de centroides (inscripción incremental)
+CENTROID_TEMPERATURE = float(os.getenv("CENTROID_TEMPERATURE", "10.0"))  # Temperatura del softmax sobre similitudes coseno
+ENROLLED_PATH = MODELS_DIR / "enrolled.json"  # Usuarios y emociones añadidos por inscripción
+USER_INDEX_PATH = os.getenv("USER_INDEX_PATH", "models/user_index.npz")  # Índice de usuarios por embedding (dos cabezas)
+EMOTION_HEAD_PATH = os.getenv("EMOTION_HEAD_PATH", "models/emotion_head.npz")  # Cabeza de emociones (dos cabezas)
+INT8_MODEL_PATH = os.getenv("INT8_MODEL_PATH", "models/emotion_model_int8.tflite")  # Modelo cuantizado int8
 
 # Configuración de Ollama
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")  # URL base de Ollama
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3:latest")  # Modelo por defecto de Ollama
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # Tiempo que Ollama mantiene el modelo en memoria tras cada petición
+OLLAMA_LOAD_TIMEOUT = float(os.getenv("OLLAMA_LOAD_TIMEOUT", "120"))  # Timeout de lectura de la precarga del modelo (s)
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3"))  # Timeout de conexión (s)
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "30"))  # Timeout de lectura de generate (s)
+OLLAMA_STREAM_READ_TIMEOUT = float(os.getenv("OLLAMA_STREAM_READ_TIMEOUT", "60"))  # Timeout entre fragmentos en streaming (s)
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "10"))  # Conexiones keep-alive reutilizables
+OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))  # Reintentos ante errores de conexión
+OLLAMA_RETRY_BACKOFF = float(os.getenv("OLLAMA_RETRY_BACKOFF", "0.3"))  # Factor de espera exponencial entre reintentos (s)
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))  # Temperatura de muestreo de los mensajes escritos
+LLM_GREETING_TEMPERATURE = float(os.getenv("LLM_GREETING_TEMPERATURE", "0"))  # Temperatura del saludo automático (0 = determinista, cacheable)
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "128"))  # Respuestas en la caché LRU en memoria (0 = desactivada)
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "600"))  # Validez de una respuesta cacheada (s; 0 = sin caché)
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")  # Archivo SQLite de caché persistente (vacío = desactivada)
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0"))  # Solo se cachean peticiones con temperatura <= este valor (0 = solo deterministas)
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "1536"))  # Tokens máximos del prompt (estimados)
+LLM_SUMMARY_TOKEN_BUDGET = int(os.getenv("LLM_SUMMARY_TOKEN_BUDGET", "128"))  # Tokens reservados al resumen de turnos antiguos
+LLM_PROMPT_CACHE_SESSIONS = int(os.getenv("LLM_PROMPT_CACHE_SESSIONS", "32"))  # Sesiones con prefijo de prompt cacheado
+# Modo de conversación: "context" reenvía el array context de Ollama (reutiliza su caché KV y solo evalúa el turno nuevo);
+# "prompt" reenvía el historial completo en cada turno
+LLM_CONVERSATION_MODE = os.getenv("LLM_CONVERSATION_MODE", "context")
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "32"))  # Peticiones máximas esperando turno para Ollama
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "1"))  # Peticiones simultáneas a Ollama desde LLMModule
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))  # Fallos de red seguidos que abren el circuito
+LLM_BREAKER_PROBE_INTERVAL = float(os.getenv("LLM_BREAKER_PROBE_INTERVAL", "5"))  # Segundos entre sondas de salud con el circuito abierto
+LLM_MODELS_TTL = float(os.getenv("LLM_MODELS_TTL", "60"))  # Validez de la lista de modelos de Ollama en caché (s)
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "8"))  # Peticiones simultáneas máximas del cliente asíncrono
+CHAT_STREAM_POLL_MS = int(os.getenv("CHAT_STREAM_POLL_MS", "30"))  # Intervalo con que la interfaz vacía la cola de fragmentos (ms)
+
+# Métricas de rendimiento (ver modules/metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"  # Cronometra las etapas del pipeline
+METRICS_JSONL_PATH = os.getenv("METRICS_JSONL_PATH", "")  # Archivo JSON lines donde se añade cada evento (vacío = solo en memoria)
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1024"))  # Observaciones recientes por etapa para los percentiles
+
+# Base de datos del historial de chat (SQLite)
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")  # WAL: escrituras sin reescribir la base y lecturas concurrentes
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")  # NORMAL (fsync por checkpoint), FULL (fsync por transacción) u OFF
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))  # Caché de páginas por conexión (KiB)
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))  # Bytes de la base leídos por mmap (0 = desactivado)
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))  # Espera máxima por un bloqueo de escritura (s)
+DB_CACHED_STATEMENTS = int(os.getenv("DB_CACHED_STATEMENTS", "64"))  # Sentencias preparadas reutilizadas por conexión
+CHAT_THUMBNAIL_SIZE = int(os.getenv("CHAT_THUMBNAIL_SIZE", "180"))  # Lado máximo de las miniaturas del chat (px)
+CHAT_THUMBNAIL_FORMAT = os.getenv("CHAT_THUMBNAIL_FORMAT", "PNG")  # Formato de las miniaturas guardadas (PNG o WEBP)
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "50"))  # Mensajes por página al cargar una sesión (el resto al subir en el chat)
 
 # Configuración de usuarios
 USERS = {
@@ -34,4 +96,14 @@ USERS = {
 # Configuración de emociones
 EMOTIONS = [
     "cansado", "enojado", "feliz", "pensativo", "riendo", "sorprendido", "triste"  # Lista de emociones posibles
-] 
\ No newline at end of file
+]
+
+# Usuarios y emociones inscritos sin reentrenar (ver VisionModule.enroll)
+if ENROLLED_PATH.exists():
+    with open(ENROLLED_PATH, 'r', encoding='utf-8') as _f:
+        _enrolled = json.load(_f)
+    for _user_id, _user_config in _enrolled.get("users", {}).items():
+        USERS.setdefault(_user_id, _user_config)  # No sobrescribe usuarios definidos aquí
+    for _emotion in _enrolled.get("emotions", []):
+        if _emotion not in EMOTIONS:
+            EMOTIONS.append(_emotion)
@@ -1,17 +1,33 @@
 """
 Módulos del Agente de Visión
+
+Las clases se importan de forma diferida: importar ChatDatabase o LLMModule
+no carga TensorFlow, que solo se importa al usar VisionModule.
 """
+# Importa importlib para cargar los submódulos bajo demanda
+import importlib
 
-# Importa el módulo de visión
-from .vision_module import VisionModule
-# Importa el módulo LLM
-from .llm_module import LLMModule
-# Importa el módulo de base de datos
-from .database_module import ChatDatabase
+# Submódulo que define cada clase exportada
+_EXPORTS = {
+    'VisionModule': '.vision_module',
+    'LLMModule': '.llm_module',
+    'AsyncLLMModule': '.async_llm_module',
+    'ChatDatabase': '.database_module',
+}
 
 # Define los módulos exportados al importar el paquete
 __all__ = [
     'VisionModule',
     'LLMModule',
+    'AsyncLLMModule',
     'ChatDatabase'
-] 
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    """Importa el submódulo correspondiente la primera vez que se accede a una clase exportada"""
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+        globals()[name] = value  # Cachea para los siguientes accesos
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
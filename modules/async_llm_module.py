@@ -0,0 +1,165 @@
+"""
+Cliente asíncrono de Ollama: varias conversaciones concurrentes en un solo proceso
+"""
+# Importa asyncio para el semáforo de concurrencia y la cancelación
+import asyncio  # Concurrencia cooperativa
+# Importa tipos para anotaciones
+from typing import AsyncIterator, Dict, List, Optional  # Tipos para anotaciones
+# Importa la lógica común con el cliente síncrono
+from modules.llm_module import BaseLLMModule  # Prompt, payload y fallback compartidos
+# Importa el registro de métricas del pipeline
+from modules.metrics import metrics  # Tiempos por etapa
+# Importa configuración global
+from config import OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, OLLAMA_STREAM_READ_TIMEOUT, OLLAMA_POOL_SIZE, \
+    OLLAMA_MAX_CONCURRENCY  # Configuración global
+
+
+class AsyncLLMModule(BaseLLMModule):
+    """
+    Contraparte asyncio de LLMModule sobre aiohttp.
+    Comparte prompt y fallback con el cliente síncrono y limita las peticiones simultáneas a Ollama.
+    Cancelar la tarea que espera generate() o itera stream() cierra la petición HTTP.
+    """
+
+    def __init__(self, max_concurrency: int = OLLAMA_MAX_CONCURRENCY, pool_size: int = OLLAMA_POOL_SIZE):
+        super().__init__()
+        self.max_concurrency = max_concurrency  # Peticiones simultáneas permitidas
+        self.pool_size = pool_size  # Conexiones keep-alive del conector
+        self._session = None  # aiohttp.ClientSession (se crea dentro del bucle de eventos)
+        self._semaphore = None  # Limita la concurrencia (ligado al bucle de eventos)
+
+    async def __aenter__(self) -> "AsyncLLMModule":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def test_connection(self) -> bool:
+        """
+        Prueba síncrona de la conexión (la usa la sonda del cortocircuito desde su hilo).
+        """
+        import requests
+        try:
+            return requests.get(f"{self.base_url}/api/tags", timeout=(OLLAMA_CONNECT_TIMEOUT, 10)).status_code == 200
+        except Exception as e:
+            self.logger.error(f"Error al conectar con Ollama: {e}")  # Log de error
+            return False
+
+    def _get_session(self):
+        """
+        Devuelve la sesión aiohttp, creándola en el primer uso (necesita un bucle de eventos activo).
+        """
+        if self._session is None or self._session.closed:
+            import aiohttp  # Importación diferida: solo la necesita el cliente asíncrono
+            connector = aiohttp.TCPConnector(limit=self.pool_size)  # Pool de conexiones keep-alive
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def close(self):
+        """
+        Cierra la sesión y sus conexiones.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def generate(self, user_id: str, emotion: str, message: str, conversation_history: Optional[List[Dict]] = None,
+                       session_id: Optional[str] = None, temperature: Optional[float] = None) -> Dict:
+        """
+        Genera una respuesta completa; mismo formato de resultado y fallback que LLMModule.generate_response.
+        """
+        import aiohttp
+        try:
+            conversation_history = conversation_history or []
+            payload = self._prepare_payload(user_id, emotion, message, conversation_history, session_id, stream=False,
+                                            temperature=temperature)  # Sin streaming
+            cache_key, cached = self._cached_response(payload)  # Prompt idéntico ya respondido
+            if cached is not None:
+                return {"response": cached, "success": True, "model_used": self.model, "cached": True}
+            if not self.breaker.allow():
+                return self._open_circuit_result(emotion, user_id)  # Ollama caído: sin esperar al timeout
+            session = self._get_session()
+            timeout = aiohttp.ClientTimeout(sock_connect=OLLAMA_CONNECT_TIMEOUT, sock_read=OLLAMA_READ_TIMEOUT)
+            with metrics.timer("llm_generate", model=self.model):  # Incluye la espera del semáforo
+                async with self._semaphore:  # Respeta el límite de concurrencia
+                    async with session.post(f"{self.base_url}/api/generate", json=payload, timeout=timeout) as response:
+                        self.breaker.record_success()  # Ollama respondió
+                        if response.status != 200:
+                            self.logger.error(f"Error en Ollama API: {response.status}")  # Log de error
+                            return self._fallback_result(f"Ollama API error: {response.status}", emotion, user_id)
+                        try:
+                            result = await response.json(content_type=None)  # Decodifica JSON
+                        except ValueError as e:
+                            self.logger.error(f"Respuesta no es JSON válido: {e}")  # Log de error
+                            return self._fallback_result(f"Respuesta no es JSON válido: {e}", emotion, user_id)
+            if result.get("response", "").strip():
+                self._record_turn(result, user_id, emotion, message, result["response"], len(conversation_history), session_id)
+            return self._result_from_text(result.get("response", ""), emotion, user_id, cache_key)
+        except asyncio.TimeoutError:
+            self.logger.error("Timeout al esperar respuesta del modelo LLM.")  # Log de timeout
+            self.breaker.record_failure()
+            return self._fallback_result("Timeout del modelo LLM", emotion, user_id)
+        except aiohttp.ClientError as e:
+            self.logger.error(f"Error al generar respuesta: {e}")  # Log de error de red
+            if isinstance(e, aiohttp.ClientConnectionError):
+                self.breaker.record_failure()
+            return self._fallback_result(str(e), emotion, user_id)
+        except Exception as e:
+            self.logger.error(f"Error al generar respuesta: {e}")  # Log de error general
+            return self._fallback_result(str(e), emotion, user_id)
+
+    async def stream(self, user_id: str, emotion: str, message: str,
+                     conversation_history: Optional[List[Dict]] = None, session_id: Optional[str] = None,
+                     temperature: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Itera los fragmentos de la respuesta a medida que llegan (async for).
+        Si la conexión falla antes del primer fragmento devuelve la respuesta de respaldo.
+        """
+        import aiohttp
+        conversation_history = conversation_history or []
+        produced = False  # Indica si ya se devolvió algún fragmento
+        fragments = []  # Texto completo para la caché
+        final = None  # Último objeto de Ollama (context y métricas)
+        try:
+            payload = self._prepare_payload(user_id, emotion, message, conversation_history, session_id, stream=True,
+                                            temperature=temperature)  # Activa streaming
+            cache_key, cached = self._cached_response(payload)  # Prompt idéntico ya respondido
+            if cached is not None:
+                yield cached  # Respuesta completa en un solo fragmento
+                return
+            if not self.breaker.allow():
+                yield self._get_fallback_response(emotion, user_id)  # Ollama caído: sin esperar al timeout
+                return
+            session = self._get_session()
+            timeout = aiohttp.ClientTimeout(sock_connect=OLLAMA_CONNECT_TIMEOUT, sock_read=OLLAMA_STREAM_READ_TIMEOUT)
+            async with self._semaphore:  # Respeta el límite de concurrencia
+                async with session.post(f"{self.base_url}/api/generate", json=payload, timeout=timeout) as response:
+                    response.raise_for_status()  # Lanza excepción si hay error HTTP
+                    async for line in response.content:  # Una línea NDJSON por fragmento
+                        obj = self._parse_stream_line(line)  # Decodifica la línea
+                        if obj is None:
+                            continue
+                        if obj.get("done"):
+                            final = obj
+                        fragment = obj.get("response", "")  # Extrae fragmento
+                        if fragment:
+                            produced = True
+                            fragments.append(fragment)
+                            yield fragment  # Devuelve fragmento
+            self.breaker.record_success()  # Ollama respondió
+            text = "".join(fragments).strip()
+            if text:
+                self._record_turn(final, user_id, emotion, message, text, len(conversation_history), session_id)
+                if cache_key is not None:
+                    self.response_cache.put(cache_key, text)  # Solo respuestas completas
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            self.logger.error(f"Error en streaming LLM: {e}")  # Log de error
+            if isinstance(e, (asyncio.TimeoutError, aiohttp.ClientConnectionError)):
+                self.breaker.record_failure()
+            if not produced:
+                yield self._get_fallback_response(emotion, user_id)  # Respuesta de respaldo
+        except Exception as e:
+            self.logger.error(f"Error en streaming LLM: {e}")  # Log de error general
+            if not produced:
+                yield self._get_fallback_response(emotion, user_id)  # Respuesta de respaldo
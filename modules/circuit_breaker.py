@@ -0,0 +1,97 @@
+"""
+Cortocircuito para Ollama: tras varios fallos seguidos deja de llamar y comprueba la salud en segundo plano
+"""
+# Importa threading para la sonda en segundo plano
+import threading  # Hilo de sondeo y cerrojo
+# Importa time para los intervalos de sondeo
+import time  # Marcas de tiempo
+# Importa tipos para anotaciones
+from typing import Callable, Dict  # Tipos para anotaciones
+# Importa logger para depuración
+from loguru import logger  # Logger para depuración
+# Importa configuración global
+from config import LLM_BREAKER_FAILURES, LLM_BREAKER_PROBE_INTERVAL  # Configuración global
+
+# Estados del circuito
+CLOSED = "closed"  # Normal: las peticiones pasan
+OPEN = "open"  # Ollama caído: las peticiones fallan al instante
+HALF_OPEN = "half_open"  # La sonda respondió: la siguiente petición decide
+
+
+class CircuitBreaker:
+    """
+    Cortocircuito con sonda de salud. Tras failure_threshold fallos de red seguidos se abre:
+    allow() devuelve False sin tocar la red y un hilo llama a probe() cada probe_interval segundos.
+    Cuando la sonda responde pasa a semiabierto; el siguiente éxito lo cierra y un fallo lo reabre.
+    """
+
+    def __init__(self, probe: Callable[[], bool], failure_threshold: int = LLM_BREAKER_FAILURES,
+                 probe_interval: float = LLM_BREAKER_PROBE_INTERVAL):
+        self.probe = probe  # Comprobación de salud (p. ej. LLMModule.test_connection)
+        self.failure_threshold = failure_threshold  # Fallos seguidos que abren el circuito
+        self.probe_interval = probe_interval  # Segundos entre sondas con el circuito abierto
+        self.state = CLOSED  # Estado actual
+        self.failures = 0  # Fallos seguidos
+        self.opened_at = None  # Instante de la última apertura
+        self.short_circuited = 0  # Peticiones respondidas sin llamar a Ollama
+        self._lock = threading.Lock()
+        self._probing = False  # Hay un hilo de sondeo activo
+
+    def allow(self) -> bool:
+        """True si la petición puede ir a Ollama"""
+        with self._lock:
+            if self.state == OPEN:
+                self.short_circuited += 1
+                return False
+            return True
+
+    def record_success(self):
+        """Una petición a Ollama terminó bien"""
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Ollama responde de nuevo: circuito cerrado")
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """Una petición a Ollama falló por red o timeout"""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._open()
+
+    def _open(self):
+        """Abre el circuito y lanza la sonda (con el cerrojo tomado)"""
+        logger.warning(f"Ollama no responde: circuito abierto tras {self.failures} fallo(s)")
+        self.state = OPEN
+        self.opened_at = time.time()
+        if not self._probing:
+            self._probing = True
+            threading.Thread(target=self._probe_loop, daemon=True, name="ollama-health-probe").start()
+
+    def _probe_loop(self):
+        """Sondea Ollama en segundo plano mientras el circuito siga abierto"""
+        while True:
+            time.sleep(self.probe_interval)
+            try:
+                healthy = self.probe()
+            except Exception:
+                healthy = False
+            with self._lock:
+                if self.state != OPEN:
+                    self._probing = False
+                    return
+                if healthy:
+                    self.state = HALF_OPEN  # La siguiente petición real confirma
+                    self._probing = False
+                    return
+
+    def stats(self) -> Dict:
+        """Estado del circuito"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opened_at": self.opened_at,
+                "short_circuited": self.short_circuited
+            }
@@ -3,50 +3,236 @@ import sqlite3  # Importa el módulo de SQLite para bases de datos locales
 import os  # Para operaciones con el sistema de archivos
 import base64  # Para codificar/decodificar datos binarios
 from datetime import datetime  # Para manejar fechas y horas
-from typing import List, Dict, Optional, Tuple  # Tipos para anotaciones
+from typing import List, Dict, Optional, Tuple, Iterator  # Tipos para anotaciones
 import json  # Para manejar datos en formato JSON
+import threading  # Una conexión persistente por hilo
+import weakref  # Cierre de la conexión cuando termina su hilo
+import hashlib  # Clave de contenido de las imágenes
+import io  # Miniaturas en memoria
+from modules.metrics import metrics  # Tiempos de las operaciones de base de datos
+from config import DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_BUSY_TIMEOUT, \
+    DB_CACHED_STATEMENTS, CHAT_THUMBNAIL_SIZE, CHAT_THUMBNAIL_FORMAT, CHAT_PAGE_SIZE  # Configuración global
+
+# Migraciones del esquema: (versión, descripción, sentencias). Solo se añaden al final, nunca se editan.
+MIGRATIONS = [
+    (1, "tablas de sesiones y mensajes", [
+        '''
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            message_type TEXT NOT NULL, -- 'user', 'assistant', 'image'
+            content TEXT NOT NULL,
+            user_name TEXT,
+            emotion TEXT,
+            image_data BLOB,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES chat_sessions (id)
+        )
+        '''
+    ]),
+    (2, "índice (session_id, timestamp) y contador de mensajes por sesión", [
+        # Mensajes de una sesión en orden sin recorrer la tabla (también lo usa delete_session)
+        "CREATE INDEX IF NOT EXISTS idx_chat_messages_session_time ON chat_messages (session_id, timestamp)",
+        # Contador desnormalizado: get_all_sessions ya no cuenta los mensajes de cada sesión
+        "ALTER TABLE chat_sessions ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0",
+        '''
+        UPDATE chat_sessions SET message_count =
+            (SELECT COUNT(*) FROM chat_messages WHERE session_id = chat_sessions.id)
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_messages_insert AFTER INSERT ON chat_messages
+        BEGIN
+            UPDATE chat_sessions SET message_count = message_count + 1 WHERE id = NEW.session_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_messages_delete AFTER DELETE ON chat_messages
+        BEGIN
+            UPDATE chat_sessions SET message_count = message_count - 1 WHERE id = OLD.session_id;
+        END
+        '''
+    ]),
+    (3, "almacén de imágenes deduplicado por SHA-256", [
+        # Cada imagen distinta se guarda una vez; los mensajes la referencian por su hash
+        '''
+        CREATE TABLE IF NOT EXISTS image_blobs (
+            hash TEXT PRIMARY KEY, -- SHA-256 en hexadecimal del contenido
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0, -- Mensajes que la referencian
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "ALTER TABLE chat_messages ADD COLUMN image_hash TEXT REFERENCES image_blobs (hash)",
+        # Mueve las imágenes existentes (sha256 es la función registrada en _connect)
+        '''
+        INSERT OR IGNORE INTO image_blobs (hash, data, size)
+            SELECT sha256(image_data), image_data, length(image_data) FROM chat_messages WHERE image_data IS NOT NULL
+        ''',
+        "UPDATE chat_messages SET image_hash = sha256(image_data), image_data = NULL WHERE image_data IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_chat_messages_image_hash ON chat_messages (image_hash) WHERE image_hash IS NOT NULL",
+        '''
+        UPDATE image_blobs SET ref_count =
+            (SELECT COUNT(*) FROM chat_messages WHERE image_hash = image_blobs.hash)
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_image_blobs_ref AFTER INSERT ON chat_messages
+        WHEN NEW.image_hash IS NOT NULL
+        BEGIN
+            UPDATE image_blobs SET ref_count = ref_count + 1 WHERE hash = NEW.image_hash;
+        END
+        ''',
+        # La última referencia borrada elimina la imagen
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_image_blobs_unref AFTER DELETE ON chat_messages
+        WHEN OLD.image_hash IS NOT NULL
+        BEGIN
+            UPDATE image_blobs SET ref_count = ref_count - 1 WHERE hash = OLD.image_hash;
+            DELETE FROM image_blobs WHERE hash = OLD.image_hash AND ref_count <= 0;
+        END
+        '''
+    ]),
+    (4, "miniaturas precalculadas de las imágenes", [
+        # Lo que muestra el chat: al cargar una sesión no se decodifica la imagen original
+        "ALTER TABLE image_blobs ADD COLUMN thumbnail BLOB",
+        "UPDATE image_blobs SET thumbnail = make_thumbnail(data)"  # make_thumbnail es la función registrada en _connect
+    ])
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]  # Versión más reciente del esquema
+
+# Columnas de chat_messages que devuelven las consultas de mensajes (sin los bytes de las imágenes)
+_MESSAGE_COLUMNS = "id, message_type, content, user_name, emotion, image_hash, timestamp"
+
+
+
+def _sha256(data: Optional[bytes]) -> Optional[str]:
+    """Clave de contenido de una imagen (SHA-256 en hexadecimal)"""
+    return hashlib.sha256(data).hexdigest() if data is not None else None
+
+
+def make_thumbnail(data: Optional[bytes], size: int = CHAT_THUMBNAIL_SIZE) -> Optional[bytes]:
+    """
+    Miniatura de una imagen (lado máximo size, sin ampliar) codificada en CHAT_THUMBNAIL_FORMAT.
+    Devuelve None si los bytes no son una imagen válida.
+    """
+    if data is None:
+        return None
+    from PIL import Image  # Importación diferida: solo al guardar imágenes
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft("RGB", (size, size))  # JPEG: decodifica directamente a una escala reducida
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)  # Mantiene la proporción
+            output = io.BytesIO()
+            image.save(output, format=CHAT_THUMBNAIL_FORMAT)
+            return output.getvalue()
+    except Exception as e:
+        print(f"Error generando miniatura: {e}")
+        return None
+
+
+def register_functions(conn: sqlite3.Connection):
+    """Registra en una conexión las funciones SQL que usan las migraciones de imágenes y miniaturas"""
+    conn.create_function("sha256", 1, _sha256, deterministic=True)  # Usada por la migración de imágenes
+    conn.create_function("make_thumbnail", 1, make_thumbnail, deterministic=True)  # Y por la de miniaturas
+
+
+class _ThreadConnection:
+    """Conexión guardada en el threading.local de un hilo; al terminar el hilo se libera y se cierra"""
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+def _release_connection(conn: sqlite3.Connection, connections: List[sqlite3.Connection], lock: threading.Lock):
+    """Cierra una conexión y la quita del registro (hilo terminado o base cerrada)"""
+    with lock:
+        if conn in connections:
+            connections.remove(conn)
+    conn.close()
+
 
 class ChatDatabase:
     def __init__(self, db_path: str = "chat_history.db"):
         """Inicializa la base de datos de chat"""
         self.db_path = db_path  # Ruta al archivo de la base de datos
+        self._local = threading.local()  # Conexión persistente de cada hilo
+        self._connections = []  # Conexiones abiertas de los hilos vivos (para close)
+        self._lock = threading.Lock()  # Protege la lista de conexiones
         self.init_database()  # Crea las tablas si no existen
     
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Devuelve la conexión del hilo actual, abriéndola y configurándola la primera vez.
+        Reutilizarla evita abrir el archivo en cada mensaje y conserva las sentencias preparadas.
+        Usada con with, confirma la transacción al salir (o la deshace si hubo una excepción).
+        """
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_CACHED_STATEMENTS,
+                                   check_same_thread=False)  # close() puede llamarse desde otro hilo
+            conn.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")  # Persistente en el archivo
+            conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")  # Por conexión
+            conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")  # Negativo: tamaño en KiB
+            conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+            register_functions(conn)  # sha256 y make_thumbnail para las migraciones
+            holder = _ThreadConnection(conn)
+            self._local.holder = holder
+            with self._lock:
+                self._connections.append(conn)
+            # Cuando el hilo termina, threading.local suelta holder: la conexión se cierra con él
+            weakref.finalize(holder, _release_connection, conn, self._connections, self._lock)
+        return holder.conn
+
+    def close(self):
+        """Cierra todas las conexiones abiertas (se reabren en el siguiente uso)"""
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            _release_connection(conn, self._connections, self._lock)
+        self._local = threading.local()  # Olvida las conexiones cerradas de todos los hilos
+
     def init_database(self):
-        """Crea las tablas necesarias si no existen"""
-        with sqlite3.connect(self.db_path) as conn:  # Abre conexión a la base de datos
-            cursor = conn.cursor()  # Crea un cursor para ejecutar comandos SQL
-            
-            # Tabla para las sesiones de chat
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS chat_sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_name TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Tabla para los mensajes del chat
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS chat_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id INTEGER NOT NULL,
-                    message_type TEXT NOT NULL, -- 'user', 'assistant', 'image'
-                    content TEXT NOT NULL,
-                    user_name TEXT,
-                    emotion TEXT,
-                    image_data BLOB,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (session_id) REFERENCES chat_sessions (id)
-                )
-            ''')
-            
-            conn.commit()  # Guarda los cambios
+        """
+        Crea las tablas y aplica las migraciones pendientes.
+        La versión del esquema se guarda en PRAGMA user_version; cada migración corre en su propia transacción.
+        """
+        conn = self._connect()  # Conexión persistente del hilo
+        version = conn.execute("PRAGMA user_version").fetchone()[0]  # 0 en una base nueva o anterior a las migraciones
+        for target, description, statements in MIGRATIONS[version:]:
+            try:
+                conn.execute("BEGIN")  # Las sentencias DDL no abren transacción por sí solas
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {target}")
+                conn.commit()  # Guarda los cambios
+            except sqlite3.Error as e:
+                conn.rollback()  # La base queda en la versión anterior
+                raise RuntimeError(f"Error aplicando la migración {target} ({description}): {e}") from e
+            if version > 0:
+                print(f"Base de datos migrada a la versión {target}: {description}")  # Solo al actualizar una base existente
+        if version < SCHEMA_VERSION:
+            free, total = (conn.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in ("freelist_count", "page_count"))
+            if free * 4 > total:
+                conn.execute("VACUUM")  # Una migración liberó más de un cuarto del archivo (p. ej. imágenes movidas)
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # Con WAL el archivo encoge al volcar el registro
+
+    def schema_version(self) -> int:
+        """Versión del esquema aplicada a la base de datos"""
+        return self._connect().execute("PRAGMA user_version").fetchone()[0]
     
     def create_new_session(self, session_name: str) -> int:
         """Crea una nueva sesión de chat y retorna su ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        with metrics.timer("db_create_session"), self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO chat_sessions (session_name) VALUES (?)",
@@ -58,14 +244,29 @@ class ChatDatabase:
     def save_message(self, session_id: int, message_type: str, content: str, 
                     user_name: Optional[str] = None, emotion: Optional[str] = None,
                     image_data: Optional[bytes] = None) -> int:
-        """Guarda un mensaje en la base de datos"""
-        with sqlite3.connect(self.db_path) as conn:
+        """
+        Guarda un mensaje en la base de datos.
+        image_data va al almacén de imágenes: una imagen ya guardada solo suma una referencia.
+        """
+        with metrics.timer("db_save_message", type=message_type), self._connect() as conn:
             cursor = conn.cursor()
+            image_hash = _sha256(image_data)  # None si el mensaje no tiene imagen
+            if image_hash is not None:
+                # OR IGNORE: si otro hilo guardó la misma imagen a la vez no hay conflicto de clave
+                cursor.execute(
+                    "INSERT OR IGNORE INTO image_blobs (hash, data, size) VALUES (?, ?, ?)",
+                    (image_hash, image_data, len(image_data))
+                )  # El trigger suma la referencia al insertar el mensaje
+                if cursor.rowcount == 1:  # Imagen nueva: solo entonces se calcula la miniatura
+                    cursor.execute(
+                        "UPDATE image_blobs SET thumbnail = ? WHERE hash = ?",
+                        (make_thumbnail(image_data), image_hash)
+                    )
             cursor.execute('''
                 INSERT INTO chat_messages 
-                (session_id, message_type, content, user_name, emotion, image_data)
+                (session_id, message_type, content, user_name, emotion, image_hash)
                 VALUES (?, ?, ?, ?, ?, ?)
-            ''', (session_id, message_type, content, user_name, emotion, image_data))
+            ''', (session_id, message_type, content, user_name, emotion, image_hash))
             
             # Actualizar timestamp de la sesión
             cursor.execute(
@@ -78,11 +279,10 @@ class ChatDatabase:
     
     def get_all_sessions(self) -> List[Dict]:
         """Obtiene todas las sesiones de chat ordenadas por fecha de actualización"""
-        with sqlite3.connect(self.db_path) as conn:
+        with metrics.timer("db_list_sessions"), self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT id, session_name, created_at, last_updated,
-                       (SELECT COUNT(*) FROM chat_messages WHERE session_id = chat_sessions.id) as message_count
+                SELECT id, session_name, created_at, last_updated, message_count
                 FROM chat_sessions 
                 ORDER BY last_updated DESC
             ''')
@@ -99,36 +299,80 @@ class ChatDatabase:
             
             return sessions  # Retorna la lista de sesiones
     
-    def get_session_messages(self, session_id: int) -> List[Dict]:
-        """Obtiene todos los mensajes de una sesión específica"""
-        with sqlite3.connect(self.db_path) as conn:
+    @staticmethod
+    def _message_from_row(row: Tuple) -> Dict:
+        """Convierte una fila de _MESSAGE_COLUMNS en el diccionario de mensaje"""
+        return {
+            'id': row[0],
+            'type': row[1],
+            'content': row[2],
+            'user_name': row[3],
+            'emotion': row[4],
+            'image_hash': row[5],
+            'timestamp': row[6]
+        }
+
+    def get_session_messages(self, session_id: int, before_id: Optional[int] = None,
+                             limit: Optional[int] = None) -> List[Dict]:
+        """
+        Obtiene los mensajes de una sesión específica en orden cronológico.
+        Con limit devuelve solo los limit más recientes anteriores a before_id; la página anterior se pide
+        con el id del mensaje más antiguo recibido (paginación por clave sobre el índice de la sesión).
+        Las imágenes no se leen: cada mensaje trae su image_hash y get_image_blob la carga al mostrarla.
+        """
+        with metrics.timer("db_load_session", paged=limit is not None), self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, message_type, content, user_name, emotion, image_data, timestamp
-                FROM chat_messages 
-                WHERE session_id = ?
-                ORDER BY timestamp ASC
-            ''', (session_id,))
-            
-            messages = []  # Lista para almacenar los mensajes
-            for row in cursor.fetchall():
-                message = {
-                    'id': row[0],
-                    'type': row[1],
-                    'content': row[2],
-                    'user_name': row[3],
-                    'emotion': row[4],
-                    'image_data': row[5],
-                    'timestamp': row[6]
-                }
-                messages.append(message)
+            if before_id is None:
+                cursor.execute(f'''
+                    SELECT {_MESSAGE_COLUMNS}
+                    FROM chat_messages 
+                    WHERE session_id = ?
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT ?
+                ''', (session_id, -1 if limit is None else limit))  # LIMIT -1: sin límite
+            else:
+                cursor.execute(f'''
+                    SELECT {_MESSAGE_COLUMNS}
+                    FROM chat_messages 
+                    WHERE session_id = ? AND (timestamp, id) < (SELECT timestamp, id FROM chat_messages WHERE id = ?)
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT ?
+                ''', (session_id, before_id, -1 if limit is None else limit))
             
+            messages = [self._message_from_row(row) for row in cursor.fetchall()]  # Del más reciente al más antiguo
+            messages.reverse()
             return messages  # Retorna la lista de mensajes
+
+    def iter_session_messages(self, session_id: int, page_size: int = CHAT_PAGE_SIZE) -> Iterator[Dict]:
+        """
+        Recorre los mensajes de una sesión en orden cronológico leyendo page_size filas por consulta.
+        No mantiene ninguna transacción abierta entre páginas.
+        """
+        last = None  # (timestamp, id) del último mensaje entregado
+        while True:
+            with self._connect() as conn:
+                if last is None:
+                    rows = conn.execute(f'''
+                        SELECT {_MESSAGE_COLUMNS} FROM chat_messages
+                        WHERE session_id = ?
+                        ORDER BY timestamp ASC, id ASC LIMIT ?
+                    ''', (session_id, page_size)).fetchall()
+                else:
+                    rows = conn.execute(f'''
+                        SELECT {_MESSAGE_COLUMNS} FROM chat_messages
+                        WHERE session_id = ? AND (timestamp, id) > (?, ?)
+                        ORDER BY timestamp ASC, id ASC LIMIT ?
+                    ''', (session_id, *last, page_size)).fetchall()
+            for row in rows:
+                yield self._message_from_row(row)
+            if len(rows) < page_size:
+                return
+            last = (rows[-1][6], rows[-1][0])
     
     def delete_session(self, session_id: int) -> bool:
         """Elimina una sesión de chat y todos sus mensajes"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 # Eliminar mensajes primero (por la foreign key)
                 cursor.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
@@ -142,7 +386,7 @@ class ChatDatabase:
     
     def get_session_info(self, session_id: int) -> Optional[Dict]:
         """Obtiene información de una sesión específica"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT id, session_name, created_at, last_updated
@@ -163,8 +407,9 @@ class ChatDatabase:
     def save_image_to_db(self, session_id: int, image_path: str, user_name: str, emotion: str) -> int:
         """Guarda una imagen en la base de datos"""
         try:
-            with open(image_path, 'rb') as f:
-                image_data = f.read()  # Lee la imagen como binario
+            with metrics.timer("db_read_image_file"):
+                with open(image_path, 'rb') as f:
+                    image_data = f.read()  # Lee la imagen como binario
             
             return self.save_message(
                 session_id=session_id,
@@ -180,12 +425,33 @@ class ChatDatabase:
     
     def get_image_data(self, message_id: int) -> Optional[bytes]:
         """Obtiene los datos de una imagen específica"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT image_data FROM chat_messages 
-                WHERE id = ? AND message_type = 'image'
+                SELECT image_blobs.data FROM chat_messages
+                JOIN image_blobs ON image_blobs.hash = chat_messages.image_hash
+                WHERE chat_messages.id = ? AND chat_messages.message_type = 'image'
             ''', (message_id,))
             
             row = cursor.fetchone()
-            return row[0] if row else None  # Retorna los datos binarios de la imagen si existen 
\ No newline at end of file
+            return row[0] if row else None  # Retorna los datos binarios de la imagen si existen
+
+    def get_image_blob(self, image_hash: str) -> Optional[bytes]:
+        """Obtiene una imagen del almacén por su hash"""
+        with metrics.timer("db_load_image"), self._connect() as conn:
+            row = conn.execute("SELECT data FROM image_blobs WHERE hash = ?", (image_hash,)).fetchone()
+            return row[0] if row else None
+
+    def get_image_thumbnail(self, image_hash: str) -> Optional[bytes]:
+        """Obtiene la miniatura precalculada de una imagen (None si no se pudo generar)"""
+        with metrics.timer("db_load_thumbnail"), self._connect() as conn:
+            row = conn.execute("SELECT thumbnail FROM image_blobs WHERE hash = ?", (image_hash,)).fetchone()
+            return row[0] if row else None
+
+    def get_storage_stats(self) -> Dict:
+        """Imágenes distintas, referencias y bytes del almacén de imágenes"""
+        with self._connect() as conn:
+            blobs, references, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(ref_count), 0), COALESCE(SUM(size), 0) FROM image_blobs"
+            ).fetchone()
+            return {'images': blobs, 'references': references, 'bytes': size}
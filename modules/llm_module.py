@@ -3,52 +3,101 @@ Módulo LLM mejorado para integración local con Ollama (Llama3)
 """
 # Importa requests para peticiones HTTP a la API de Ollama
 import requests  # Para hacer peticiones HTTP a la API de Ollama
+# Importa el adaptador y la política de reintentos para el pool de conexiones
+from requests.adapters import HTTPAdapter  # Pool de conexiones keep-alive
+from urllib3.util.retry import Retry  # Reintentos con espera exponencial
+# Importa json para decodificar los fragmentos del streaming
+import json  # Decodificación de NDJSON
+# Importa hashlib y la caché LRU para la caché de respuestas
+import hashlib  # Clave de caché
+from modules.lru_cache import LRUCache  # LRU en memoria con caducidad y SQLite opcional
+# Importa time y OrderedDict para tiempos y el contexto de Ollama por sesión
+import time  # Tiempos y caducidad de la lista de modelos
+from collections import OrderedDict  # LRU de contextos por sesión
+# Importa threading para la señal de cancelación del streaming
+import threading  # Evento de cancelación
+# Importa abc para los métodos que cada cliente debe implementar
+from abc import ABC, abstractmethod  # Clase base abstracta
 # Importa random para respuestas de fallback aleatorias
 import random  # Para seleccionar respuestas de fallback aleatorias
+# Importa Future para la precarga del modelo en segundo plano
+from concurrent.futures import Future  # Precarga diferida
 # Importa tipos para anotaciones
 from typing import Dict, List, Optional  # Tipos para anotaciones
 # Importa logger para depuración
 from loguru import logger  # Logger para depuración
+# Importa el planificador de peticiones (prioridades y fusión de peticiones idénticas)
+from modules.llm_scheduler import RequestScheduler, PRIORITY_INTERACTIVE  # Cola delante de Ollama
+# Importa el cortocircuito para responder al instante con Ollama caído
+from modules.circuit_breaker import CircuitBreaker  # Cortocircuito con sonda de salud
+# Importa el registro de métricas del pipeline
+from modules.metrics import metrics  # Tiempos por etapa y contadores
+# Importa el constructor de prompts con presupuesto de tokens
+from modules.prompt_builder import PromptBuilder  # Ensamblado incremental del prompt
 # Importa configuración global
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL, USERS  # Configuración global
+from config import OLLAMA_BASE_URL, OLLAMA_MODEL, USERS, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, \
+    OLLAMA_STREAM_READ_TIMEOUT, OLLAMA_POOL_SIZE, OLLAMA_RETRIES, OLLAMA_RETRY_BACKOFF, LLM_CACHE_SIZE, LLM_CACHE_TTL, \
+    LLM_CACHE_PATH, LLM_CACHE_MAX_TEMPERATURE, LLM_TEMPERATURE, LLM_CONVERSATION_MODE, LLM_PROMPT_CACHE_SESSIONS, LLM_MODELS_TTL, OLLAMA_KEEP_ALIVE, OLLAMA_LOAD_TIMEOUT  # Configuración global
 
-class LLMModule:
+class ResponseCache(LRUCache):
     """
-    Módulo de LLM para chat continuo y robusto con Ollama local
+    Caché de respuestas del LLM: clave = SHA-256 de (modelo, prompt normalizado, opciones de muestreo).
+    LRU en memoria con caducidad (TTL) y almacenamiento SQLite opcional en disco.
+    Solo guarda peticiones con temperatura <= max_temperature: con muestreo, repetir la respuesta
+    cambiaría el comportamiento del chat.
+    """
+
+    def __init__(self, max_size: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL, db_path: str = LLM_CACHE_PATH,
+                 max_temperature: float = LLM_CACHE_MAX_TEMPERATURE):
+        super().__init__("response_cache", max_size, db_path, ttl)
+        self.max_temperature = max_temperature  # Temperatura máxima de una petición cacheable
+
+    @property
+    def enabled(self) -> bool:
+        """True si la caché guarda algo (en memoria o en disco)"""
+        return self.ttl > 0 and (self.max_size > 0 or bool(self.db_path))
+
+    def cacheable(self, payload: Dict) -> bool:
+        """True si la petición es lo bastante determinista para reutilizar su respuesta"""
+        return payload.get("options", {}).get("temperature", 0.8) <= self.max_temperature  # 0.8 = valor por defecto de Ollama
+
+    @staticmethod
+    def make_key(payload: Dict) -> str:
+        """Calcula la clave a partir del modelo, el prompt con espacios normalizados y las opciones de muestreo"""
+        key_data = {
+            "model": payload.get("model"),
+            "prompt": " ".join(payload.get("prompt", "").split()),  # Ignora diferencias de espacios
+            "options": payload.get("options", {})
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class BaseLLMModule(ABC):
+    """
+    Lógica común a los clientes síncrono y asíncrono: prompt, payload, fragmentos y fallback.
+    Cada cliente implementa test_connection, que también usa el cortocircuito como sonda.
     """
 
     def __init__(self):
         self.base_url = OLLAMA_BASE_URL  # URL base de la API de Ollama
         self.model = OLLAMA_MODEL  # Modelo por defecto
+        self.keep_alive = OLLAMA_KEEP_ALIVE  # Tiempo que Ollama mantiene el modelo cargado
         self.logger = logger  # Logger para mensajes
+        self.response_cache = ResponseCache()  # Respuestas ya generadas para prompts idénticos
+        self.prompt_builder = PromptBuilder()  # Prompt con presupuesto de tokens y prefijo por sesión
+        self.conversation_mode = LLM_CONVERSATION_MODE  # "prompt" (historial completo) o "context" (caché KV de Ollama)
+        self._contexts = OrderedDict()  # session_id -> context de Ollama del último turno
+        self.last_metrics = {}  # Métricas de Ollama del último turno (prompt_eval_count, duraciones...)
+        self.breaker = CircuitBreaker(probe=self.test_connection)  # Falla al instante mientras Ollama no responda
 
-    def _build_prompt(self, user_id: str, emotion: str, message: str, conversation_history: List[Dict]) -> str:
+    def _build_prompt(self, user_id: str, emotion: str, message: str, conversation_history: List[Dict],
+                      session_id: Optional[str] = None) -> str:
         """
         Construye un prompt tipo chat continuo, con contexto emocional solo si hay usuario y emoción.
+        El historial se ajusta al presupuesto de tokens; con session_id se reutiliza el prefijo ya renderizado.
         """
-        # Si no hay usuario o emoción, prompt genérico
-        if not user_id or not emotion:
-            prompt = "Eres un asistente conversacional profesional.\nChat:\n"  # Prompt base
-            for entry in conversation_history[-3:]:  # Últimos 3 turnos
-                prompt += f"Usuario: {entry['user_message']}\n"  # Mensaje del usuario
-                prompt += f"Asistente: {entry['assistant_response']}\n"  # Respuesta del asistente
-            prompt += f"Usuario: {message}\nAsistente:"
-            return prompt
-
-        # Si hay usuario y emoción, prompt personalizado
-        user_config = USERS[user_id]  # Configuración del usuario
-        user_name = user_config["name"]  # Nombre del usuario
-        prompt = (
-            f"Eres un asistente conversacional empático y profesional.\n"
-            f"Usuario: {user_name}\n"
-            f"Emoción actual: {emotion}\n\n"
-            f"Chat:\n"
-        )
-        for entry in conversation_history[-3:]:  # Últimos 3 turnos
-            prompt += f"{user_name}: {entry['user_message']}\n"  # Mensaje del usuario
-            prompt += f"Asistente: {entry['assistant_response']}\n"  # Respuesta del asistente
-        prompt += f"{user_name}: {message}\nAsistente:"
-        return prompt
+        user_name = USERS[user_id]["name"] if user_id and emotion else None  # Nombre del usuario
+        return self.prompt_builder.build(user_name, emotion, message, conversation_history, session_id)
 
     def _get_fallback_response(self, emotion: str, user_id: str) -> str:
         """
@@ -95,35 +144,330 @@ class LLMModule:
         opciones = fallback_responses.get(emotion, [f"¿En qué puedo ayudarte, {user_name}?"])
         return random.choice(opciones)  # Selecciona una respuesta aleatoria
 
-    def generate_response(self, user_id: str, emotion: str, message: str, conversation_history: Optional[List[Dict]] = None) -> Dict:
+    def _build_payload(self, prompt: str, stream: bool, temperature: Optional[float] = None) -> Dict:
+        """
+        Construye el cuerpo de la petición a /api/generate (temperature None = LLM_TEMPERATURE).
+        """
+        return {
+            "model": self.model,  # Modelo a usar
+            "prompt": prompt,  # Prompt generado
+            "stream": stream,  # Streaming o respuesta completa
+            "keep_alive": self.keep_alive,  # Evita que Ollama descargue el modelo entre turnos
+            "options": {
+                "temperature": LLM_TEMPERATURE if temperature is None else temperature,  # Temperatura de muestreo
+                "top_p": 0.9,  # Top-p sampling
+                "max_tokens": 256,  # Máximo de tokens
+                "num_predict": 100,  # Tokens a predecir
+                "top_k": 40,  # Top-k sampling
+                "repeat_penalty": 1.1  # Penalización de repetición
+            }
+        }
+
+    @staticmethod
+    def _parse_stream_line(line: bytes) -> Optional[Dict]:
+        """
+        Decodifica una línea NDJSON de Ollama (None si no es JSON).
+        Ollama envía NDJSON sin charset: las líneas llegan como bytes y se decodifican aquí.
+        """
+        try:
+            data = line.decode('utf-8').strip()  # Decodifica y limpia la línea
+            if data.startswith('{'):
+                return json.loads(data)  # Objeto con el fragmento ("response") o el cierre ("done")
+        except Exception:
+            pass  # Ignora errores de fragmentos
+        return None
+
+    def _prepare_payload(self, user_id: str, emotion: str, message: str, conversation_history: List[Dict],
+                         session_id: Optional[str], stream: bool, temperature: Optional[float] = None) -> Dict:
+        """
+        Construye el payload del turno. En modo "context", si la sesión continúa la conversación
+        anterior, envía solo el turno nuevo junto al array context que devolvió Ollama: el servidor
+        reutiliza su caché KV y no vuelve a evaluar el historial.
+        """
+        state = self._contexts.get(session_id) if session_id is not None else None
+        if (self.conversation_mode == "context" and state is not None
+                and state["key"] == (self.model, user_id, emotion)  # Mismo modelo y cabecera
+                and state["consumed"] == len(conversation_history)  # Historial sin cambios desde el último turno
+                and (not conversation_history or state["fingerprint"] == (conversation_history[-1].get('user_message'),
+                                                                          conversation_history[-1].get('assistant_response')))
+                and len(state["context"]) < self.prompt_builder.token_budget):  # Al llenarse se reconstruye con resumen
+            self._contexts.move_to_end(session_id)
+            speaker = USERS[user_id]["name"] if user_id and emotion else "Usuario"  # Etiqueta del usuario
+            payload = self._build_payload(f"{speaker}: {message}\nAsistente:", stream, temperature)  # Solo el turno nuevo
+            payload["context"] = state["context"]
+            return payload
+        prompt = self._build_prompt(user_id, emotion, message, conversation_history, session_id)  # Construye el prompt
+        return self._build_payload(prompt, stream, temperature)
+
+    def _record_turn(self, final: Optional[Dict], user_id: str, emotion: str, message: str, response_text: str,
+                     history_length: int, session_id: Optional[str]):
+        """
+        Guarda las métricas de Ollama del último turno y, en modo "context", el array context de la sesión.
+        """
+        if not final:
+            return
+        self.last_metrics = {key: final.get(key) for key in
+                             ("load_duration", "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+                              "total_duration")}
+        for stage, key in (("ollama_load", "load_duration"), ("ollama_prompt_eval", "prompt_eval_duration"),
+                           ("ollama_eval", "eval_duration")):
+            if final.get(key):
+                metrics.observe(stage, final[key] / 1e9, model=self.model)  # Ollama informa en nanosegundos
+        if self.conversation_mode != "context" or session_id is None or not final.get("context"):
+            return
+        self._contexts[session_id] = {
+            "key": (self.model, user_id, emotion),  # Modelo y cabecera con que se generó
+            "context": final["context"],  # Tokens que Ollama ya tiene evaluados
+            "consumed": history_length + 1,  # El llamador añade este turno al historial
+            "fingerprint": (message, response_text.strip())  # Entrada que se espera al final del historial
+        }
+        self._contexts.move_to_end(session_id)
+        while len(self._contexts) > LLM_PROMPT_CACHE_SESSIONS:
+            self._contexts.popitem(last=False)  # Expulsa la sesión menos usada
+
+    def forget_session(self, session_id: str):
+        """
+        Olvida el prefijo renderizado y el context de Ollama de una sesión.
+        """
+        self.prompt_builder.forget(session_id)
+        self._contexts.pop(session_id, None)
+
+    def _result_from_text(self, respuesta: str, emotion: str, user_id: str, cache_key: Optional[str] = None) -> Dict:
+        """
+        Construye el resultado de una generación completa (fallback si la respuesta está vacía).
+        Las respuestas válidas se guardan en la caché con cache_key; los fallbacks nunca.
+        """
+        if not respuesta or not respuesta.strip():  # Si la respuesta está vacía
+            fallback_response = self._get_fallback_response(emotion, user_id)  # Respuesta de respaldo
+            return {
+                "response": fallback_response,
+                "success": True,
+                "model_used": self.model,
+                "fallback": True
+            }
+
+        if cache_key is not None:
+            self.response_cache.put(cache_key, respuesta.strip())  # Guarda para prompts idénticos
+        return {
+            "response": respuesta.strip(),  # Respuesta generada
+            "success": True,  # Éxito
+            "model_used": self.model  # Modelo usado
+        }
+
+    def _cached_response(self, payload: Dict):
+        """
+        Busca la respuesta de un payload en la caché. Devuelve (clave, respuesta o None); clave None si está desactivada.
+        """
+        if not self.response_cache.enabled or "context" in payload:
+            return None, None  # Un turno con context depende del estado de la sesión en Ollama
+        if not self.response_cache.cacheable(payload):
+            return None, None  # Respuesta muestreada: otra petición igual debe dar otra respuesta
+        key = self.response_cache.make_key(payload)
+        cached = self.response_cache.get(key)
+        metrics.increment("llm_cache_hit" if cached is not None else "llm_cache_miss")
+        return key, cached
+
+    @abstractmethod
+    def test_connection(self) -> bool:
+        """
+        Prueba la conexión con Ollama local.
+        """
+
+    def _open_circuit_result(self, emotion: str, user_id: str) -> Dict:
+        """
+        Fallback inmediato mientras el circuito está abierto (no se toca la red).
+        """
+        metrics.increment("llm_circuit_open")
+        return self._fallback_result("Ollama no disponible (circuito abierto)", emotion, user_id)
+
+    def _fallback_result(self, error: str, emotion: str, user_id: str) -> Dict:
+        """
+        Resultado de respaldo cuando Ollama falla (el chat nunca se queda sin respuesta).
+        """
+        metrics.increment("llm_fallback")
+        fallback_response = self._get_fallback_response(emotion, user_id)  # Respuesta de respaldo
+        return {
+            "success": True,
+            "error": error,
+            "response": fallback_response,
+            "fallback": True
+        }
+
+
+class LLMModule(BaseLLMModule):
+    """
+    Módulo de LLM para chat continuo y robusto con Ollama local
+    """
+
+    def __init__(self, preload: bool = False):
+        super().__init__()
+        self.timeout = (OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)  # (conexión, lectura)
+        self.stream_timeout = (OLLAMA_CONNECT_TIMEOUT, OLLAMA_STREAM_READ_TIMEOUT)  # (conexión, lectura entre fragmentos)
+        self.session = self._create_session()  # Sesión HTTP con conexiones reutilizables
+        self.scheduler = RequestScheduler()  # Cola con prioridades y fusión de peticiones idénticas
+        self._models_cache = None  # (instante, lista de modelos) de la última consulta a /api/tags
+        self._warm: Future = Future()  # Se completa cuando termina la precarga del modelo
+        self._warm_lock = threading.Lock()  # Protege la precarga pendiente y el hilo de precarga
+        self._warm_pending = None  # (modelo, future) de la precarga que espera turno
+        self._warm_running = False  # True mientras el hilo de precarga está vivo
+        self.warm_up_stats = {}  # Resultado de la última precarga (modelo, carga y total en ms)
+        if preload:
+            self.warm_up()  # Carga el modelo en Ollama sin bloquear el arranque
+        else:
+            self._warm.set_result(False)  # Sin precarga: el primer mensaje carga el modelo
+
+    @staticmethod
+    def _create_session(pool_size: int = OLLAMA_POOL_SIZE, retries: int = OLLAMA_RETRIES,
+                        backoff: float = OLLAMA_RETRY_BACKOFF) -> requests.Session:
+        """
+        Crea una sesión HTTP con pool de conexiones keep-alive y reintentos con espera exponencial.
+        Solo se reintentan errores de conexión (nunca una generación ya enviada al servidor).
+        """
+        retry = Retry(
+            total=retries,  # Reintentos máximos
+            connect=retries,  # Errores al conectar
+            read=0,  # No reenvía peticiones que ya llegaron a Ollama
+            status=0,  # No reintenta por código HTTP
+            backoff_factor=backoff,  # Espera exponencial entre intentos
+            allowed_methods=None  # Incluye POST (seguro: solo errores de conexión)
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self):
+        """
+        Cierra las conexiones del pool.
+        """
+        self.session.close()
+
+    def warm_up(self) -> Future:
+        """
+        Pide a Ollama que cargue el modelo actual en un hilo en segundo plano (petición sin prompt
+        con keep_alive). El future se completa con True si el modelo quedó cargado.
+        Solo hay una precarga en curso: una nueva sustituye a la que aún esperaba turno,
+        así cambiar de modelo varias veces seguidas no encola cargas que se expulsan entre sí.
+        """
+        with self._warm_lock:
+            if self._warm_pending is not None:
+                self._warm_pending[1].set_result(False)  # Sustituida antes de empezar
+            future = Future()
+            self._warm = future
+            self._warm_pending = (self.model, future)
+            if not self._warm_running:
+                self._warm_running = True
+                threading.Thread(target=self._warm_up_worker, name="ollama-warm-up", daemon=True).start()
+        return future
+
+    def _warm_up_worker(self):
+        """
+        Atiende las precargas de una en una hasta que no queda ninguna pendiente.
+        """
+        while True:
+            with self._warm_lock:
+                if self._warm_pending is None:
+                    self._warm_running = False
+                    return
+                model, future = self._warm_pending
+                self._warm_pending = None
+            if model != self.model:
+                future.set_result(False)  # El modelo ya no es el elegido: no se carga
+                continue
+            self._warm_up_in_background(model, future)
+
+    def _warm_up_in_background(self, model: str, future: Future):
+        """
+        Precarga el modelo y guarda el tiempo de carga que informa Ollama.
+        """
+        if not self.breaker.allow():
+            future.set_result(False)  # Ollama caído: la sonda del cortocircuito avisará
+            return
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/generate",
+                json={"model": model, "keep_alive": self.keep_alive},  # Sin prompt: solo carga el modelo
+                timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_LOAD_TIMEOUT)  # Cargar un modelo grande tarda más que generar
+            )
+            self.breaker.record_success()
+            total_ms = (time.perf_counter() - start) * 1000
+            load_ms = response.json().get("load_duration", 0) / 1e6 if response.status_code == 200 else 0.0
+            self.warm_up_stats = {"model": model, "load_ms": load_ms, "total_ms": total_ms}
+            self.logger.info(f"Modelo {model} precargado en {total_ms:.0f} ms (carga en Ollama: {load_ms:.0f} ms)")  # Log de precarga
+            future.set_result(response.status_code == 200)
+        except Exception as e:
+            if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                self.breaker.record_failure()
+            self.logger.error(f"Error al precargar el modelo {model}: {e}")  # Log de error
+            future.set_result(False)
+
+    @property
+    def is_warm(self) -> bool:
+        """
+        True si la última precarga terminó y dejó el modelo cargado.
+        """
+        return self._warm.done() and self._warm.result()
+
+    def wait_until_warm(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que termine la precarga. Devuelve True si el modelo quedó cargado.
+        """
+        try:
+            return self._warm.result(timeout=timeout)
+        except Exception:
+            return False
+
+    @staticmethod
+    def _request_key(payload: Dict) -> str:
+        """
+        Clave de fusión: peticiones con el mismo payload comparten una sola llamada a Ollama.
+        """
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def breaker_stats(self) -> Dict:
+        """
+        Estado del cortocircuito de Ollama.
+        """
+        return self.breaker.stats()
+
+    def queue_stats(self) -> Dict:
+        """
+        Métricas de la cola de peticiones (profundidad, espera, fusionadas, rechazadas).
+        """
+        return self.scheduler.stats()
+
+    def generate_response(self, user_id: str, emotion: str, message: str, conversation_history: Optional[List[Dict]] = None,
+                          session_id: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE,
+                          temperature: Optional[float] = None) -> Dict:
         """
         Genera una respuesta usando Ollama local (Llama3) con manejo robusto de errores y logs.
+        La petición pasa por la cola del planificador con la prioridad indicada.
+        temperature = 0 da respuestas deterministas, las únicas que guarda la caché por defecto.
         """
         try:
             if conversation_history is None:
                 conversation_history = []  # Si no hay historial, lo inicializa
 
-            prompt = self._build_prompt(user_id, emotion, message, conversation_history)  # Construye el prompt
-
-            payload = {
-                "model": self.model,  # Modelo a usar
-                "prompt": prompt,  # Prompt generado
-                "stream": False,  # No streaming
-                "options": {
-                    "temperature": 0.7,  # Temperatura de muestreo
-                    "top_p": 0.9,  # Top-p sampling
-                    "max_tokens": 256,  # Máximo de tokens
-                    "num_predict": 100,  # Tokens a predecir
-                    "top_k": 40,  # Top-k sampling
-                    "repeat_penalty": 1.1  # Penalización de repetición
-                }
-            }
+            payload = self._prepare_payload(user_id, emotion, message, conversation_history, session_id, stream=False,
+                                            temperature=temperature)  # Sin streaming
+            cache_key, cached = self._cached_response(payload)  # Prompt idéntico ya respondido
+            if cached is not None:
+                return {"response": cached, "success": True, "model_used": self.model, "cached": True}
+            if not self.breaker.allow():
+                return self._open_circuit_result(emotion, user_id)  # Ollama caído: sin esperar al timeout
 
-            response = requests.post(
-                f"{self.base_url}/api/generate",  # Endpoint de generación
-                json=payload,  # Payload como JSON
-                timeout=30  # Timeout de 30 segundos
-            )
+            def call(cancel_event):
+                yield self.session.post(
+                    f"{self.base_url}/api/generate",  # Endpoint de generación
+                    json=payload,  # Payload como JSON
+                    timeout=self.timeout  # Timeouts de conexión y lectura
+                )
+
+            with metrics.timer("llm_generate", model=self.model):
+                response = self.scheduler.submit(self._request_key(payload), priority, call).result()  # Espera su turno
+            self.breaker.record_success()  # Ollama respondió
 
             self.logger.debug(f"Respuesta cruda de Ollama: {response.text}")  # Log de la respuesta
 
@@ -132,118 +476,123 @@ class LLMModule:
                     result = response.json()  # Intenta decodificar JSON
                 except Exception as e:
                     self.logger.error(f"Respuesta no es JSON válido: {response.text}")  # Log de error
-                    fallback_response = self._get_fallback_response(emotion, user_id)  # Respuesta de respaldo
-                    return {
-                        "success": True,
-                        "error": f"Respuesta no es JSON válido: {e}",
-                        "response": fallback_response,
-                        "fallback": True
-                    }
-                respuesta = result.get("response", "").strip()  # Extrae la respuesta
-
-                if not respuesta or not respuesta.strip():  # Si la respuesta está vacía
-                    fallback_response = self._get_fallback_response(emotion, user_id)  # Respuesta de respaldo
-                    return {
-                        "response": fallback_response,
-                        "success": True,
-                        "model_used": self.model,
-                        "fallback": True
-                    }
-
-                return {
-                    "response": respuesta,  # Respuesta generada
-                    "success": True,  # Éxito
-                    "model_used": self.model  # Modelo usado
-                }
+                    return self._fallback_result(f"Respuesta no es JSON válido: {e}", emotion, user_id)
+                if result.get("response", "").strip():
+                    self._record_turn(result, user_id, emotion, message, result["response"], len(conversation_history), session_id)
+                return self._result_from_text(result.get("response", ""), emotion, user_id, cache_key)  # Extrae la respuesta
             else:
                 self.logger.error(f"Error en Ollama API: {response.status_code}")  # Log de error
-                fallback_response = self._get_fallback_response(emotion, user_id)  # Respuesta de respaldo
-                return {
-                    "success": True,
-                    "error": f"Ollama API error: {response.status_code}",
-                    "response": fallback_response,
-                    "fallback": True
-                }
+                return self._fallback_result(f"Ollama API error: {response.status_code}", emotion, user_id)
 
         except requests.Timeout:
             self.logger.error("Timeout al esperar respuesta del modelo LLM.")  # Log de timeout
-            fallback_response = self._get_fallback_response(emotion, user_id)  # Respuesta de respaldo
-            return {
-                "success": True,
-                "error": "Timeout del modelo LLM",
-                "response": fallback_response,
-                "fallback": True
-            }
+            self.breaker.record_failure()
+            return self._fallback_result("Timeout del modelo LLM", emotion, user_id)
+        except requests.ConnectionError as e:
+            self.logger.error(f"Error al conectar con Ollama: {e}")  # Log de error de red
+            self.breaker.record_failure()
+            return self._fallback_result(str(e), emotion, user_id)
         except Exception as e:
             self.logger.error(f"Error al generar respuesta: {e}")  # Log de error general
-            fallback_response = self._get_fallback_response(emotion, user_id)  # Respuesta de respaldo
-            return {
-                "success": True,
-                "error": str(e),
-                "response": fallback_response,
-                "fallback": True
-            }
+            return self._fallback_result(str(e), emotion, user_id)
 
-    def generate_response_stream(self, user_id: str, emotion: str, message: str, conversation_history: Optional[List[Dict]] = None):
+    def generate_response_stream(self, user_id: str, emotion: str, message: str, conversation_history: Optional[List[Dict]] = None,
+                                 cancel_event: Optional[threading.Event] = None, session_id: Optional[str] = None,
+                                 priority: int = PRIORITY_INTERACTIVE, temperature: Optional[float] = None):
         """
         Genera una respuesta usando Ollama local (Llama3) en modo streaming (fragmentos).
+        Si se activa cancel_event deja de leer y, si nadie más espera la misma petición, cierra la conexión con Ollama.
         """
         if conversation_history is None:
             conversation_history = []  # Inicializa historial si no existe
-        prompt = self._build_prompt(user_id, emotion, message, conversation_history)  # Construye el prompt
-        payload = {
-            "model": self.model,  # Modelo a usar
-            "prompt": prompt,  # Prompt generado
-            "stream": True,  # Activa streaming
-            "options": {
-                "temperature": 0.7,  # Temperatura de muestreo
-                "top_p": 0.9,  # Top-p sampling
-                "max_tokens": 256,  # Máximo de tokens
-                "num_predict": 100,  # Tokens a predecir
-                "top_k": 40,  # Top-k sampling
-                "repeat_penalty": 1.1  # Penalización de repetición
-            }
-        }
         try:
-            with requests.post(f"{self.base_url}/api/generate", json=payload, stream=True, timeout=60) as response:
+            payload = self._prepare_payload(user_id, emotion, message, conversation_history, session_id, stream=True,
+                                            temperature=temperature)  # Activa streaming
+        except Exception as e:
+            self.logger.error(f"Error preparando la petición LLM: {e}")  # Log de error
+            yield self._get_fallback_response(emotion, user_id)  # Respuesta de respaldo como en generate_response
+            return
+        cache_key, cached = self._cached_response(payload)  # Prompt idéntico ya respondido
+        if cached is not None:
+            yield cached  # Respuesta completa en un solo fragmento
+            return
+        if not self.breaker.allow():
+            yield self._get_fallback_response(emotion, user_id)  # Ollama caído: sin esperar al timeout
+            return
+        produced = False  # Indica si ya se devolvió algún fragmento
+        fragments = []  # Texto completo para la caché
+        final = None  # Último objeto de Ollama (context y métricas)
+
+        def call(upstream_cancel):
+            with self.session.post(f"{self.base_url}/api/generate", json=payload, stream=True, timeout=self.stream_timeout) as response:
                 response.raise_for_status()  # Lanza excepción si hay error HTTP
-                for line in response.iter_lines(decode_unicode=True):  # Itera por fragmentos
-                    if line:
-                        try:
-                            data = line.strip()  # Limpia línea
-                            if data.startswith('{'):
-                                import json
-                                obj = json.loads(data)  # Decodifica JSON
-                                fragment = obj.get("response", "")  # Extrae fragmento
-                                if fragment:
-                                    yield fragment  # Devuelve fragmento
-                        except Exception as e:
-                            continue  # Ignora errores de fragmentos
+                for line in response.iter_lines():  # Itera por fragmentos
+                    if upstream_cancel.is_set():
+                        return  # Al salir del with se cierra la conexión
+                    yield line
+
+        try:
+            start = time.perf_counter()  # Inicio para el tiempo al primer token
+            ticket = self.scheduler.submit(self._request_key(payload), priority, call)  # Espera su turno
+            try:
+                for line in ticket:
+                    if cancel_event is not None and cancel_event.is_set():
+                        self.logger.info("Generación cancelada por el usuario")  # Log de cancelación
+                        return
+                    obj = self._parse_stream_line(line)  # Decodifica la línea
+                    if obj is None:
+                        continue
+                    if obj.get("done"):
+                        final = obj
+                    fragment = obj.get("response", "")  # Extrae fragmento
+                    if fragment:
+                        if not produced:
+                            metrics.observe("llm_first_token", time.perf_counter() - start, model=self.model)
+                        produced = True
+                        fragments.append(fragment)
+                        yield fragment  # Devuelve fragmento
+            finally:
+                ticket.close()  # Sin suscriptores, el planificador cancela la llamada
+            metrics.observe("llm_stream", time.perf_counter() - start, model=self.model)  # Respuesta completa
+            self.breaker.record_success()  # Ollama respondió
+            text = "".join(fragments).strip()
+            if text:
+                self._record_turn(final, user_id, emotion, message, text, len(conversation_history), session_id)
+                if cache_key is not None:
+                    self.response_cache.put(cache_key, text)  # Solo respuestas completas
         except Exception as e:
             self.logger.error(f"Error en streaming LLM: {e}")  # Log de error
-            yield f"[Error en streaming: {e}]"  # Devuelve error como fragmento
+            if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                self.breaker.record_failure()
+            if not produced:
+                yield self._get_fallback_response(emotion, user_id)  # Respuesta de respaldo como en generate_response
 
     def test_connection(self) -> bool:
         """
         Prueba la conexión con Ollama local.
         """
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=10)  # Prueba endpoint de modelos
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=(OLLAMA_CONNECT_TIMEOUT, 10))  # Prueba endpoint de modelos
             return response.status_code == 200  # True si responde correctamente
         except Exception as e:
             self.logger.error(f"Error al conectar con Ollama: {e}")  # Log de error
             return False  # Falla la conexión
 
-    def get_available_models(self) -> List[str]:
+    def get_available_models(self, refresh: bool = False) -> List[str]:
         """
-        Obtiene la lista de modelos disponibles en Ollama local.
+        Obtiene la lista de modelos disponibles en Ollama local (cacheada LLM_MODELS_TTL segundos).
         """
+        if not refresh and self._models_cache is not None and time.time() - self._models_cache[0] < LLM_MODELS_TTL:
+            return list(self._models_cache[1])  # Lista reciente sin tocar la red
+        if not self.breaker.allow():
+            return list(self._models_cache[1]) if self._models_cache else []  # Ollama caído: última lista conocida
         try:
-            response = requests.get(f"{self.base_url}/api/tags")  # Solicita modelos
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=self.timeout)  # Solicita modelos
             if response.status_code == 200:
                 result = response.json()  # Decodifica JSON
                 models = [model["name"] for model in result.get("models", [])]  # Extrae nombres
-                return models  # Lista de nombres de modelos
+                self._models_cache = (time.time(), models)  # Cachea la lista
+                return list(models)  # Lista de nombres de modelos
             else:
                 self.logger.error(f"Error al obtener modelos: {response.status_code}")  # Log de error
                 return []  # Devuelve lista vacía
@@ -256,10 +605,15 @@ class LLMModule:
         Cambia el modelo de Ollama local.
         """
         try:
-            available_models = self.get_available_models()  # Modelos disponibles
+            available_models = self.get_available_models()  # Modelos disponibles (caché)
+            if new_model not in available_models:
+                available_models = self.get_available_models(refresh=True)  # Puede ser un modelo recién descargado
             if new_model in available_models:
+                changed = new_model != self.model
                 self.model = new_model  # Cambia el modelo
                 self.logger.info(f"Modelo cambiado a: {new_model}")  # Log de cambio
+                if changed:
+                    self.warm_up()  # Carga el nuevo modelo antes del siguiente mensaje
                 return True  # Cambio exitoso
             else:
                 self.logger.error(f"Modelo {new_model} no disponible")  # Log de error
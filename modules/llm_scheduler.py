@@ -0,0 +1,219 @@
+"""
+Planificador de peticiones a Ollama: cola acotada con prioridades y fusión de peticiones idénticas
+"""
+# Importa heapq para la cola de prioridad
+import heapq  # Cola de prioridad
+# Importa itertools para el desempate FIFO dentro de cada prioridad
+import itertools  # Contador de orden de llegada
+# Importa threading para los hilos de trabajo y la sincronización
+import threading  # Hilos y condiciones
+# Importa time para medir el tiempo de espera en cola
+import time  # Para medir tiempos
+# Importa deque para la ventana de tiempos de espera
+from collections import deque  # Ventana de métricas
+# Importa tipos para anotaciones
+from typing import Callable, Dict, Iterable, Iterator  # Tipos para anotaciones
+# Importa configuración global
+from modules.metrics import metrics  # Tiempo de espera en cola
+from config import LLM_QUEUE_SIZE, LLM_MAX_INFLIGHT  # Configuración global
+
+# Prioridades (menor = antes): mensajes escritos por el usuario frente a respuestas automáticas
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+# Tiempos de espera recientes que se conservan para las métricas
+WAIT_WINDOW = 256
+
+
+class QueueFullError(RuntimeError):
+    """La cola de peticiones al LLM está llena"""
+
+
+class _Job:
+    """
+    Petición pendiente o en curso. Lo que produce se difunde a todos sus suscriptores;
+    quien se une tarde recibe también lo ya producido.
+    """
+
+    def __init__(self, key: str, priority: int, producer: Callable[[threading.Event], Iterable]):
+        self.key = key  # Clave de fusión
+        self.priority = priority  # Prioridad de la petición
+        self.producer = producer  # Función que hace la llamada (recibe el evento de cancelación)
+        self.items = []  # Elementos producidos (respuesta o líneas del streaming)
+        self.done = False  # Terminó (con o sin error)
+        self.error = None  # Excepción del productor
+        self.subscribers = 0  # Llamadores esperando el resultado
+        self.cancel_event = threading.Event()  # Se activa cuando ya nadie espera
+        self.enqueued = time.perf_counter()  # Instante de llegada a la cola
+        self.cond = threading.Condition()  # Avisa de elementos nuevos
+
+    def publish(self, item):
+        with self.cond:
+            self.items.append(item)
+            self.cond.notify_all()
+
+    def finish(self, error: Exception = None):
+        with self.cond:
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+
+
+class Ticket:
+    """
+    Resultado de una petición planificada: se itera para recibir lo producido
+    (o se llama a result() para el primer elemento). Cerrarlo libera la suscripción.
+    """
+
+    def __init__(self, scheduler: "RequestScheduler", job: _Job):
+        self._scheduler = scheduler
+        self._job = job
+        self._closed = False
+
+    def __iter__(self) -> Iterator:
+        job = self._job
+        index = 0
+        try:
+            while True:
+                with job.cond:
+                    while index >= len(job.items) and not job.done:
+                        job.cond.wait()
+                    if index < len(job.items):
+                        item = job.items[index]
+                        index += 1
+                    elif job.error is not None:
+                        raise job.error
+                    else:
+                        return
+                yield item
+        finally:
+            self.close()
+
+    def result(self):
+        """Devuelve el primer elemento producido (respuesta sin streaming)"""
+        for item in self:
+            return item
+        raise RuntimeError("La petición terminó sin resultado")
+
+    def close(self):
+        """Deja de esperar; si nadie más espera la petición, se cancela"""
+        if not self._closed:
+            self._closed = True
+            self._scheduler._detach(self._job)
+
+
+class RequestScheduler:
+    """
+    Cola acotada con prioridades delante de Ollama, que atiende max_inflight peticiones a la vez.
+    Las peticiones con la misma clave que otra pendiente o en curso se fusionan en una sola llamada.
+    """
+
+    def __init__(self, max_queue: int = LLM_QUEUE_SIZE, max_inflight: int = LLM_MAX_INFLIGHT):
+        self.max_queue = max_queue  # Peticiones máximas esperando
+        self.max_inflight = max_inflight  # Peticiones simultáneas a Ollama
+        self._heap = []  # (prioridad, orden de llegada, petición)
+        self._counter = itertools.count()  # Desempate FIFO
+        self._inflight = {}  # clave -> petición pendiente o en curso
+        self._lock = threading.Condition()  # Protege la cola y despierta a los hilos de trabajo
+        self._workers = []  # Hilos de trabajo (se crean en el primer envío)
+        self._waits = deque(maxlen=WAIT_WINDOW)  # Tiempos de espera recientes (s)
+        self.submitted = 0  # Peticiones recibidas
+        self.coalesced = 0  # Peticiones fusionadas con otra idéntica
+        self.rejected = 0  # Peticiones rechazadas por cola llena
+        self.max_depth = 0  # Profundidad máxima observada
+
+    def submit(self, key: str, priority: int, producer: Callable[[threading.Event], Iterable]) -> Ticket:
+        """
+        Encola una petición (o la une a una idéntica en curso) y devuelve su Ticket.
+        Lanza QueueFullError si la cola está llena.
+        """
+        with self._lock:
+            self.submitted += 1
+            job = self._inflight.get(key)
+            if job is not None and not job.cancel_event.is_set():
+                self.coalesced += 1
+                metrics.increment("llm_coalesced")
+                job.subscribers += 1
+                if priority < job.priority and self._reprioritize(job, priority):
+                    heapq.heapify(self._heap)  # Sube la petición que aún esperaba
+                return Ticket(self, job)
+            if len(self._heap) >= self.max_queue:
+                self.rejected += 1
+                metrics.increment("llm_rejected")
+                raise QueueFullError("Cola de peticiones al LLM llena")
+            job = _Job(key, priority, producer)
+            job.subscribers = 1
+            self._inflight[key] = job
+            heapq.heappush(self._heap, (priority, next(self._counter), job))
+            self.max_depth = max(self.max_depth, len(self._heap))
+            while len(self._workers) < self.max_inflight:
+                worker = threading.Thread(target=self._work, daemon=True, name=f"llm-scheduler-{len(self._workers)}")
+                self._workers.append(worker)
+                worker.start()
+            self._lock.notify()
+            return Ticket(self, job)
+
+    def _reprioritize(self, job: _Job, priority: int) -> bool:
+        """Actualiza la prioridad de una petición que sigue en la cola (True si estaba)"""
+        for index, (_, order, queued) in enumerate(self._heap):
+            if queued is job:
+                job.priority = priority
+                self._heap[index] = (priority, order, job)
+                return True
+        return False
+
+    def _detach(self, job: _Job):
+        """Un suscriptor deja de esperar; sin suscriptores la petición se cancela"""
+        with self._lock:
+            job.subscribers -= 1
+            if job.subscribers > 0 or job.done:
+                return
+            job.cancel_event.set()  # El productor deja de leer; si estaba en cola se descarta
+            if self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+
+    def _work(self):
+        """Hilo de trabajo: atiende la petición de mayor prioridad"""
+        while True:
+            with self._lock:
+                while not self._heap:
+                    self._lock.wait()
+                _, _, job = heapq.heappop(self._heap)
+            if job.cancel_event.is_set():
+                job.finish()  # Cancelada mientras esperaba
+                continue
+            waited = time.perf_counter() - job.enqueued
+            self._waits.append(waited)
+            metrics.observe("llm_queue_wait", waited, priority=job.priority)
+            error = None
+            try:
+                for item in job.producer(job.cancel_event):
+                    job.publish(item)
+                    if job.cancel_event.is_set():
+                        break
+            except Exception as e:
+                error = e
+            finally:
+                with self._lock:
+                    if self._inflight.get(job.key) is job:
+                        del self._inflight[job.key]
+                job.finish(error)
+
+    def stats(self) -> Dict:
+        """Métricas de la cola: profundidad, tiempos de espera y peticiones fusionadas o rechazadas"""
+        with self._lock:
+            waits = sorted(self._waits)
+            depth = len(self._heap)
+
+        def percentile(q):
+            return waits[min(len(waits) - 1, int(q * len(waits)))] * 1000 if waits else 0.0
+
+        return {
+            "queue_depth": depth,
+            "max_queue_depth": self.max_depth,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "wait_ms_avg": sum(waits) / len(waits) * 1000 if waits else 0.0,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p95": percentile(0.95)
+        }
@@ -0,0 +1,113 @@
+"""
+Caché LRU en memoria con caducidad opcional y almacenamiento SQLite opcional en disco.
+Base común de la caché de predicciones de visión y de la caché de respuestas del LLM.
+"""
+# Importa json para serializar los valores en disco
+import json  # Valores en la caché persistente
+# Importa sqlite3 para la caché persistente
+import sqlite3  # Caché persistente en disco
+# Importa threading para el cerrojo de la caché
+import threading  # La caché se usa desde varios hilos
+# Importa time para la caducidad de las entradas
+import time  # Instante de creación de cada entrada
+# Importa OrderedDict para la LRU en memoria
+from collections import OrderedDict  # Entradas en orden de uso
+# Importa tipos para anotaciones
+from typing import Any, Dict, Optional  # Tipos para anotaciones
+
+
+class LRUCache:
+    """
+    Caché clave -> valor serializable a JSON.
+    LRU en memoria de max_size entradas; ttl en segundos (None = sin caducidad);
+    db_path = archivo SQLite donde se guardan también las entradas ('' = sin disco).
+    """
+
+    def __init__(self, table: str, max_size: int, db_path: str = "", ttl: Optional[float] = None):
+        self.table = table  # Tabla de la caché en el archivo SQLite
+        self.max_size = max_size  # Entradas máximas en memoria
+        self.db_path = db_path  # Ruta de la caché persistente ('' = sin disco)
+        self.ttl = ttl  # Segundos de validez de una entrada (None = sin caducidad)
+        self._entries = OrderedDict()  # clave -> (instante de creación, valor), en orden de uso
+        self._lock = threading.Lock()  # La caché se usa desde varios hilos
+        self.hits = 0  # Aciertos
+        self.misses = 0  # Fallos
+        if self.db_path:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {self.table} (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        created REAL NOT NULL
+                    )
+                ''')
+
+    def _expired(self, created: float, now: float) -> bool:
+        """True si una entrada creada en created ya no es válida"""
+        return self.ttl is not None and now - created >= self.ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        """Devuelve el valor cacheado si existe y no ha caducado, o None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._entries.move_to_end(key)  # Marca como usada recientemente
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]  # Caducada
+        if self.db_path:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute(f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                if row and self._expired(row[1], now):
+                    conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))  # Caducada
+                    row = None
+            if row:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])  # Sube la entrada a memoria
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any):
+        """Guarda un valor en memoria y, si está configurado, en disco"""
+        created = time.time()
+        self._remember(key, value, created)
+        if self.db_path:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, created) VALUES (?, ?, ?)",
+                             (key, json.dumps(value, ensure_ascii=False), created))
+
+    def _remember(self, key: str, value: Any, created: float):
+        """Inserta en la LRU en memoria expulsando la entrada menos usada si se llena"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (created, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)  # Expulsa la menos usada
+
+    def clear(self):
+        """Vacía la caché en memoria y en disco"""
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> Dict:
+        """Contadores de aciertos y fallos"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size
+            }
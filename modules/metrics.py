@@ -0,0 +1,154 @@
+"""
+Métricas ligeras del pipeline (imagen → emoción → LLM → base de datos → interfaz):
+temporizadores por etapa, contadores e histogramas, exportables como JSON lines o texto Prometheus
+"""
+# Importa json para exportar eventos en JSON lines
+import json  # Serialización de eventos
+# Importa threading para proteger el registro (se usa desde varios hilos)
+import threading  # Cerrojo del registro
+# Importa time para medir duraciones
+import time  # Temporizadores
+# Importa bisect para ubicar cada observación en su cubeta
+import bisect  # Búsqueda de cubeta
+# Importa contextmanager para el temporizador con with
+from contextlib import contextmanager  # Temporizador como contexto
+# Importa deque para las ventanas de observaciones recientes
+from collections import deque  # Ventanas acotadas
+# Importa tipos para anotaciones
+from typing import Dict, Optional  # Tipos para anotaciones
+# Importa configuración global
+from config import METRICS_ENABLED, METRICS_JSONL_PATH, METRICS_WINDOW  # Configuración global
+
+# Límites superiores (s) de las cubetas de los histogramas
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Histogram:
+    """Histograma acumulado por cubetas más una ventana de observaciones recientes para percentiles"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window: int = METRICS_WINDOW):
+        self.buckets = buckets  # Límites superiores de las cubetas
+        self.counts = [0] * (len(buckets) + 1)  # Observaciones por cubeta (la última es +Inf)
+        self.sum = 0.0  # Suma de las observaciones (s)
+        self.count = 0  # Número de observaciones
+        self.max = 0.0  # Observación máxima (s)
+        self.recent = deque(maxlen=window)  # Observaciones recientes (s)
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        """Percentil q (0-1) de las observaciones recientes, en segundos"""
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas compartido por VisionModule, LLMModule, ChatDatabase y la interfaz.
+    Cada etapa cronometrada alimenta un histograma y deja un evento (para exportar como JSON lines).
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, jsonl_path: str = METRICS_JSONL_PATH, window: int = METRICS_WINDOW):
+        self.enabled = enabled  # Desactivado, los temporizadores no hacen nada
+        self.jsonl_path = jsonl_path  # Archivo al que se añade cada evento ('' = solo en memoria)
+        self.window = window  # Observaciones recientes por etapa y eventos en memoria
+        self._histograms: Dict[str, _Histogram] = {}  # etapa -> histograma
+        self._counters: Dict[str, int] = {}  # evento -> total
+        self._events = deque(maxlen=window)  # Eventos recientes
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: int = 1):
+        """Suma value al contador name"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, stage: str, seconds: float, **fields):
+        """Registra la duración de una etapa"""
+        if not self.enabled:
+            return
+        event = {"ts": time.time(), "stage": stage, "ms": round(seconds * 1000, 3), **fields}
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = _Histogram(window=self.window)
+            histogram.observe(seconds)
+            self._events.append(event)
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    @contextmanager
+    def timer(self, stage: str, **fields):
+        """Cronometra el bloque with y lo registra como la etapa stage"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **fields)
+
+    def summary(self) -> Dict:
+        """Resumen por etapa (n, media, p50, p95 y máximo en ms) y contadores"""
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": h.count,
+                    "avg_ms": h.sum / h.count * 1000 if h.count else 0.0,
+                    "p50_ms": h.percentile(0.5) * 1000,
+                    "p95_ms": h.percentile(0.95) * 1000,
+                    "max_ms": h.max * 1000
+                }
+                for stage, h in sorted(self._histograms.items())
+            }
+            return {"stages": stages, "counters": dict(sorted(self._counters.items()))}
+
+    def to_prometheus(self) -> str:
+        """Exporta histogramas y contadores en el formato de texto de Prometheus"""
+        lines = [
+            "# HELP agent_stage_duration_seconds Duración de cada etapa del pipeline",
+            "# TYPE agent_stage_duration_seconds histogram"
+        ]
+        with self._lock:
+            for stage, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += count
+                    lines.append(f'agent_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'agent_stage_duration_seconds_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'agent_stage_duration_seconds_count{{stage="{stage}"}} {h.count}')
+            lines.append("# HELP agent_events_total Eventos contados (aciertos de caché, fallbacks...)")
+            lines.append("# TYPE agent_events_total counter")
+            for name, value in sorted(self._counters.items()):
+                lines.append(f'agent_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def export_jsonl(self, path: str) -> int:
+        """Escribe los eventos recientes como JSON lines; devuelve cuántos escribió"""
+        with self._lock:
+            events = list(self._events)
+        with open(path, 'w', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        return len(events)
+
+    def reset(self):
+        """Vacía histogramas, contadores y eventos"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._events.clear()
+
+
+# Registro compartido por todos los módulos del proceso
+metrics = MetricsRegistry()
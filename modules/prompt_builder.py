@@ -0,0 +1,175 @@
+"""
+Construcción de prompts con presupuesto de tokens y prefijo incremental por sesión
+"""
+# Importa re para la estimación de tokens
+import re  # Para trocear el texto en palabras y signos
+# Importa threading para proteger la caché de sesiones
+import threading  # Cerrojo de la caché de prefijos
+# Importa OrderedDict para la LRU de sesiones
+from collections import OrderedDict, deque  # LRU de sesiones y turnos renderizados
+# Importa tipos para anotaciones
+from typing import Dict, List, Optional  # Tipos para anotaciones
+# Importa logger para depuración
+from loguru import logger  # Logger para depuración
+# Importa configuración global
+from config import LLM_PROMPT_TOKEN_BUDGET, LLM_SUMMARY_TOKEN_BUDGET, LLM_PROMPT_CACHE_SESSIONS  # Configuración global
+
+# Palabras (incluidas las acentuadas) y signos de puntuación sueltos
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+# Palabras de cada mensaje antiguo que se conservan en el resumen
+SUMMARY_WORDS = 12
+# Turnos descartados que se recuerdan para el resumen
+SUMMARY_MAX_TURNS = 32
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimación local del número de tokens (sin tokenizador del modelo).
+    Cada signo cuenta 1 y cada palabra 1 más uno por cada 6 letras, lo que se ajusta
+    por exceso a los tokenizadores BPE en español.
+    """
+    return sum(1 + len(piece) // 6 for piece in _PIECE_RE.findall(text))
+
+
+def _truncate_words(text: str, max_words: int) -> str:
+    """Recorta un texto a sus primeras max_words palabras"""
+    words = text.split()
+    if len(words) <= max_words:
+        return " ".join(words)
+    return " ".join(words[:max_words]) + "…"
+
+
+class _SessionPrompt:
+    """
+    Prefijo renderizado de una sesión: turnos ya formateados con su coste en tokens.
+    """
+
+    def __init__(self, header: str, speaker: str):
+        self.header = header  # Cabecera (sistema, usuario y emoción)
+        self.speaker = speaker  # Etiqueta del usuario en los turnos
+        self.turns = deque()  # (texto, tokens) de los turnos incluidos
+        self.turn_tokens = 0  # Tokens de los turnos incluidos
+        self.body = ""  # Turnos incluidos ya concatenados
+        self.dropped = []  # Mensajes de usuario de los turnos descartados
+        self.summary = ""  # Resumen renderizado de los turnos descartados
+        self.consumed = 0  # Entradas del historial ya procesadas
+        self.fingerprint = None  # Última entrada procesada (detecta historiales distintos)
+
+    def matches(self, history: List[Dict]) -> bool:
+        """True si el historial continúa el que ya se renderizó"""
+        if len(history) < self.consumed:
+            return False
+        return self.consumed == 0 or _fingerprint(history[self.consumed - 1]) == self.fingerprint
+
+
+def _fingerprint(entry: Dict) -> tuple:
+    """Identifica una entrada del historial por su contenido"""
+    return entry.get('user_message'), entry.get('assistant_response')
+
+
+class PromptBuilder:
+    """
+    Ensambla el prompt de chat dentro de un presupuesto de tokens.
+    Con session_id guarda el prefijo renderizado de cada sesión y en cada turno solo formatea
+    las entradas nuevas del historial. Los turnos más antiguos que no caben se descartan y
+    quedan resumidos en una línea (primeras palabras de cada mensaje del usuario).
+    """
+
+    def __init__(self, token_budget: int = LLM_PROMPT_TOKEN_BUDGET, summary_budget: int = LLM_SUMMARY_TOKEN_BUDGET,
+                 max_sessions: int = LLM_PROMPT_CACHE_SESSIONS):
+        self.token_budget = token_budget  # Tokens máximos del prompt
+        self.summary_budget = summary_budget  # Tokens reservados al resumen de turnos descartados
+        self.max_sessions = max_sessions  # Sesiones con prefijo cacheado
+        self._sessions = OrderedDict()  # session_id -> _SessionPrompt, en orden de uso
+        self._lock = threading.Lock()  # Se llama desde el hilo de la interfaz y desde hilos de trabajo
+
+    @staticmethod
+    def render_header(user_name: Optional[str], emotion: Optional[str]) -> str:
+        """Cabecera del prompt: genérica o con el usuario y su emoción actual"""
+        if not user_name or not emotion:
+            return "Eres un asistente conversacional profesional.\n"
+        return (
+            f"Eres un asistente conversacional empático y profesional.\n"
+            f"Usuario: {user_name}\n"
+            f"Emoción actual: {emotion}\n\n"
+        )
+
+    def build(self, user_name: Optional[str], emotion: Optional[str], message: str,
+              conversation_history: List[Dict], session_id: Optional[str] = None) -> str:
+        """
+        Devuelve el prompt completo para el mensaje nuevo.
+        """
+        header = self.render_header(user_name, emotion)
+        speaker = user_name if user_name and emotion else "Usuario"
+        with self._lock:
+            state = self._sessions.get(session_id) if session_id is not None else None
+            if state is None or state.header != header or not state.matches(conversation_history):
+                state = _SessionPrompt(header, speaker)  # Renderiza desde cero
+            if session_id is not None:
+                self._sessions[session_id] = state
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)  # Expulsa la sesión menos usada
+
+            # Añade solo los turnos nuevos al prefijo
+            for entry in conversation_history[state.consumed:]:
+                text = f"{speaker}: {entry['user_message']}\nAsistente: {entry['assistant_response']}\n"
+                tokens = estimate_tokens(text)
+                state.turns.append((text, tokens))
+                state.turn_tokens += tokens
+                state.body += text
+            state.consumed = len(conversation_history)
+            if conversation_history:
+                state.fingerprint = _fingerprint(conversation_history[-1])
+
+            # Mensaje nuevo: se recorta si por sí solo no cabe en el presupuesto
+            chat_label = "Chat:\n"
+            fixed_tokens = estimate_tokens(header) + estimate_tokens(chat_label)
+            tail = f"{speaker}: {message}\nAsistente:"
+            max_tail = self.token_budget - fixed_tokens
+            if estimate_tokens(tail) > max_tail:
+                words = message.split()
+                while words and estimate_tokens(f"{speaker}: {' '.join(words)}…\nAsistente:") > max_tail:
+                    words = words[:len(words) * 3 // 4]  # Recorta por el final
+                kept = ' '.join(words)
+                if not kept:  # Ni la primera palabra cabe (p. ej. texto sin espacios): recorta por caracteres
+                    kept = message.strip()
+                    while kept and estimate_tokens(f"{speaker}: {kept}…\nAsistente:") > max_tail:
+                        kept = kept[:len(kept) * 3 // 4]
+                tail = f"{speaker}: {kept}…\nAsistente:"
+                logger.warning("Mensaje recortado para no superar el presupuesto de tokens del prompt")
+
+            # Descarta los turnos más antiguos que no caben (reservando sitio para el resumen)
+            available = self.token_budget - fixed_tokens - estimate_tokens(tail)
+            evicted = False
+            while state.turns and state.turn_tokens > available - (self.summary_budget if state.dropped else 0):
+                text, tokens = state.turns.popleft()
+                state.turn_tokens -= tokens
+                state.dropped.append(text.split("\nAsistente:", 1)[0].split(": ", 1)[-1])
+                evicted = True
+            if evicted:
+                state.body = "".join(text for text, _ in state.turns)  # Solo se rehace al descartar
+                del state.dropped[:-SUMMARY_MAX_TURNS]  # El resumen solo usa los más recientes
+                state.summary = self._render_summary(state.dropped)
+            return header + state.summary + chat_label + state.body + tail
+
+    def _render_summary(self, dropped: List[str]) -> str:
+        """Resumen de los mensajes descartados que cabe en summary_budget (prioriza los más recientes)"""
+        parts = []
+        prefix = "Resumen de la conversación anterior: "
+        used = estimate_tokens(prefix) + 1
+        for text in reversed(dropped):
+            part = _truncate_words(text, SUMMARY_WORDS)
+            cost = estimate_tokens(part) + 1
+            if used + cost > self.summary_budget:
+                break
+            parts.append(part)
+            used += cost
+        if not parts:
+            return ""
+        return prefix + "; ".join(reversed(parts)) + "\n"
+
+    def forget(self, session_id: str):
+        """Elimina el prefijo cacheado de una sesión"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
@@ -8,30 +8,251 @@ import os  # Para operaciones del sistema
 import numpy as np  # Para operaciones numéricas
 # Importa PIL para manejo de imágenes
 from PIL import Image  # Para manejo de imágenes
-# Importa funciones de Keras para cargar modelos y procesar imágenes
-from tensorflow.keras.models import load_model  # Para cargar modelos Keras
-from tensorflow.keras.preprocessing.image import img_to_array  # Para convertir imágenes a arrays
+# TensorFlow se importa de forma diferida al cargar el modelo (ver _load_models)
 # Importa logger para mensajes de depuración
 from loguru import logger  # Logger para depuración
 # Importa tipos para anotaciones
-from typing import Dict  # Tipos para anotaciones
+from typing import Dict, List, Optional, Union  # Tipos para anotaciones
+# Importa el pool de hilos para decodificar imágenes en paralelo
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor  # Pools y carga diferida
+import multiprocessing  # Contexto spawn para el pool de decodificación
+# Importa utilidades para la caché de predicciones
+import hashlib  # Hash del contenido de las imágenes
+import io  # Decodificar imágenes desde bytes
+import json  # Clases y metadatos del modelo
+import threading  # Carga del modelo en segundo plano
+from modules.lru_cache import LRUCache  # LRU en memoria con SQLite opcional
+from modules.metrics import metrics  # Tiempos por etapa del pipeline
+# Importa utilidades para medir el cargador del dataset
+import time  # Tiempos de carga
+import tracemalloc  # Pico de memoria durante la carga
 
 # Importa configuración global de usuarios y emociones
-from config import USERS, EMOTIONS  # Configuración global
+from config import USERS, EMOTIONS, VISION_BATCH_SIZE, VISION_DECODE_WORKERS, VISION_INFERENCE_BACKEND, \
+    VISION_CACHE_SIZE, VISION_CACHE_PATH, VISION_LOADER_WORKERS, VISION_DATASET_CACHE_DIR, \
+    VISION_TRAIN_PIPELINE, CENTROID_HEAD_PATH, CENTROID_TEMPERATURE, ENROLLED_PATH, USER_INDEX_PATH, \
+    EMOTION_HEAD_PATH, INT8_MODEL_PATH  # Configuración global
+
+# Extensiones de imagen aceptadas en el dataset
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+def _decode_for_training(path: str, size: int) -> Optional[np.ndarray]:
+    """
+    Decodifica y redimensiona una imagen del dataset a size x size x 3 (uint8).
+    Función a nivel de módulo para poder ejecutarse en un pool de procesos. Devuelve None si falla.
+    """
+    try:
+        with Image.open(path) as img:
+            return np.asarray(img.convert('RGB').resize((size, size)), dtype=np.uint8)
+    except Exception as e:
+        print(f"Error cargando {path}: {e}")
+        return None
+
+
+def _make_batch_sequence(X: np.ndarray, y: np.ndarray, indices: np.ndarray, batch_size: int, shuffle: bool):
+    """
+    Crea un keras Sequence que lee cada lote de X (array en memoria o memmap) por índices,
+    convirtiendo a float32 normalizado solo el lote actual si X es uint8.
+    """
+    from tensorflow.keras.utils import Sequence
+
+    class _ArrayBatches(Sequence):
+        def __init__(self):
+            super().__init__()
+            self.indices = np.array(indices, dtype=np.int64)
+
+        def __len__(self):
+            return int(np.ceil(len(self.indices) / batch_size))
+
+        def __getitem__(self, i):
+            batch_idx = np.sort(self.indices[i * batch_size:(i + 1) * batch_size])  # Lectura secuencial del memmap
+            batch = X[batch_idx]
+            if batch.dtype == np.uint8:
+                batch = batch.astype(np.float32) * (1.0 / 255.0)  # Normaliza solo este lote
+            return batch, y[batch_idx]
+
+        def on_epoch_end(self):
+            if shuffle:
+                np.random.shuffle(self.indices)
+
+    batches = _ArrayBatches()
+    batches.on_epoch_end()  # Barajado inicial
+    return batches
+
+
+def _make_throughput_callback(num_images: int, log):
+    """
+    Crea un callback de Keras que registra el rendimiento de entrenamiento (imágenes/s) de cada época
+    """
+    from tensorflow.keras.callbacks import Callback
+
+    class _Throughput(Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self.start = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            elapsed = time.perf_counter() - self.start
+            log.info(f"⏱️ Época {epoch + 1}: {num_images / elapsed:.1f} imágenes/s ({elapsed:.2f}s)")
+
+    return _Throughput()
+
+
+class PredictionCache(LRUCache):
+    """
+    Caché de predicciones direccionada por contenido: clave = SHA-256 de los bytes de la imagen
+    y de la versión del modelo. LRU en memoria con almacenamiento SQLite opcional en disco.
+    """
+
+    def __init__(self, max_size: int = VISION_CACHE_SIZE, db_path: str = VISION_CACHE_PATH):
+        super().__init__("prediction_cache", max_size, db_path)  # Las predicciones no caducan: la versión va en la clave
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_version: str) -> str:
+        """Calcula la clave de caché a partir de los bytes de la imagen y la versión del modelo"""
+        digest = hashlib.sha256(image_bytes)
+        digest.update(model_version.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Devuelve una copia de la predicción cacheada o None"""
+        result = super().get(key)
+        return dict(result) if result is not None else None
+
+    def put(self, key: str, result: Dict):
+        """Guarda una copia de la predicción (quien la recibe puede modificarla)"""
+        super().put(key, dict(result))
+
+
+class CentroidHead:
+    """
+    Cabeza de clasificación por centroide más cercano sobre los embeddings de la CNN.
+    Guarda la suma de embeddings normalizados y el número de muestras por clase, de modo que
+    añadir una clase nueva solo requiere los embeddings de sus propias imágenes.
+    """
+
+    def __init__(self, classes: Optional[List[str]] = None, sums: Optional[np.ndarray] = None,
+                 counts: Optional[np.ndarray] = None):
+        self.classes = list(classes or [])  # Nombres de clase (usuario_emocion)
+        self.sums = sums  # Matriz clases x dimensión del embedding
+        self.counts = counts if counts is not None else np.zeros(0, dtype=np.int64)  # Muestras por clase
+        self._centroids = None  # Centroides normalizados (se recalculan al añadir)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["CentroidHead"]:
+        """Carga la cabeza desde un .npz; devuelve None si no existe"""
+        if not os.path.exists(path):
+            return None
+        data = np.load(path, allow_pickle=False)
+        return cls([str(c) for c in data["classes"]], data["sums"], data["counts"])
+
+    def save(self, path: str):
+        """Guarda la cabeza en un .npz"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, classes=np.array(self.classes), sums=self.sums, counts=self.counts)
+
+    @staticmethod
+    def _normalize(embeddings: np.ndarray) -> np.ndarray:
+        """Normaliza cada fila a norma L2 unitaria"""
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def add(self, label: str, embeddings: np.ndarray):
+        """Añade (o refuerza) una clase con los embeddings de sus imágenes"""
+        total = self._normalize(embeddings.astype(np.float32)).sum(axis=0)
+        if label in self.classes:
+            i = self.classes.index(label)
+            self.sums[i] += total
+            self.counts[i] += len(embeddings)
+        else:
+            self.classes.append(label)
+            self.sums = total[None, :] if self.sums is None else np.vstack([self.sums, total])
+            self.counts = np.append(self.counts, len(embeddings))
+        self._centroids = None
+
+    def similarities(self, embeddings: np.ndarray) -> np.ndarray:
+        """Similitud coseno de cada embedding con cada centroide (una sola multiplicación de matrices)"""
+        if self._centroids is None:
+            self._centroids = self._normalize(self.sums)
+        return self._normalize(embeddings.astype(np.float32)) @ self._centroids.T
+
+    def nearest(self, embeddings: np.ndarray):
+        """Devuelve (índice de la clase más cercana, similitud coseno) para cada embedding"""
+        sims = self.similarities(embeddings)
+        best = np.argmax(sims, axis=1)
+        return best, sims[np.arange(len(best)), best]
+
+    def probabilities(self, embeddings: np.ndarray, temperature: float = CENTROID_TEMPERATURE) -> np.ndarray:
+        """Softmax sobre la similitud coseno de cada embedding con cada centroide"""
+        logits = self.similarities(embeddings) * temperature
+        logits -= logits.max(axis=1, keepdims=True)  # Estabilidad numérica
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
 
 class VisionModule:
     """
     Módulo de visión que usa CNN local para detectar emociones
     """
     
-    def __init__(self):
+    # Backends de inferencia soportados (ver VISION_INFERENCE_BACKEND en config.py)
+    INFERENCE_BACKENDS = ("keras", "call", "function", "tflite", "tflite_int8")
+
+    def __init__(self, backend: Optional[str] = None, lazy: bool = False):
         self.logger = logger  # Logger para mensajes
         self.model = None  # Modelo CNN (se carga después)
         self.classes = []  # Lista de clases del modelo
         self.img_height, self.img_width = 96, 96  # Tamaño esperado de la imagen
+        self.backend = backend or VISION_INFERENCE_BACKEND  # Backend de inferencia
+        self._infer_fn = None  # Función de inferencia compilada (según backend)
+        self._files_version = ""  # Versión de los archivos del modelo y sus cabezas
+        self._backend_version = ""  # Parte de la versión que aporta el backend (modelo int8)
+        self.cache = PredictionCache()  # Caché de predicciones por contenido
+        self._ready: Future = Future()  # Se completa cuando el modelo termina de cargar
+        self.centroid_head: Optional[CentroidHead] = None  # Cabeza de centroides (clases inscritas)
+        self._embedding_model = None  # Submodelo que devuelve el embedding de la CNN
+        self.user_index: Optional[CentroidHead] = None  # Índice de usuarios por embedding (modo de dos cabezas)
+        self.emotion_head: Optional[CentroidHead] = None  # Cabeza de emociones (modo de dos cabezas)
         
-        # Cargar modelo al inicializar
-        self._load_models()
+        # Cargar modelo al inicializar (en segundo plano si lazy=True)
+        if lazy:
+            threading.Thread(target=self._load_in_background, name="vision-model-loader", daemon=True).start()
+        else:
+            self._load_models()
+            self._ready.set_result(self.model is not None)
+
+    def _load_in_background(self):
+        """
+        Importa TensorFlow y carga el modelo fuera del hilo principal, completando el future de disponibilidad
+        """
+        try:
+            self._load_models()
+            self._ready.set_result(self.model is not None)
+        except BaseException as e:
+            self._ready.set_exception(e)
+
+    @property
+    def is_ready(self) -> bool:
+        """
+        True si la carga del modelo ya terminó (con o sin éxito)
+        """
+        return self._ready.done()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que termine la carga del modelo. Devuelve True si hay modelo disponible.
+        """
+        try:
+            return bool(self._ready.result(timeout=timeout))
+        except Exception as e:
+            self.logger.error(f"❌ Error esperando la carga del modelo: {e}")  # Log de error
+            return False
+
+    def add_ready_callback(self, callback):
+        """
+        Registra una función que se llama (desde el hilo de carga) cuando el modelo está listo
+        """
+        self._ready.add_done_callback(lambda future: callback(self.model is not None))
         
     def _load_models(self):
         """
@@ -42,29 +263,264 @@ class VisionModule:
             classes_path = "models/classes.json"  # Ruta a las clases
 
             # Verifica que existan los archivos del modelo y clases
+            # Importación diferida: TensorFlow solo se carga cuando se necesita el modelo
+            from tensorflow.keras.models import load_model  # Para cargar modelos Keras
             if os.path.exists(model_path) and os.path.exists(classes_path):
                 self.model = load_model(model_path)  # Carga el modelo
                 # Cargar clases del modelo desde JSON
                 import json
                 with open(classes_path, 'r', encoding='utf-8') as f:
                     self.classes = json.load(f)  # Carga las clases
+                self._files_version = self._compute_model_version(model_path, classes_path)  # Versión para la caché
+                self._load_centroid_head()  # Clases inscritas sin reentrenar, si las hay
+                self._load_two_heads()  # Índice de usuarios + cabeza de emociones, si existen
                 self.logger.info("✅ Modelo CNN cargado correctamente")
                 self.logger.info(f"📋 Clases disponibles: {len(self.classes)}")
+                self.set_backend(self.backend)  # Prepara el backend de inferencia
             else:
                 self.logger.warning(f"⚠️ Modelo no encontrado en {model_path}. Entrenando modelo nuevo...")
                 # Entrenar y guardar modelo automáticamente
-                success = self.train_from_emociones()
+                success = self.train_from_emociones()  # Deja el modelo, las clases y el backend listos
                 if success:
-                    self.model = load_model(model_path)
-                    import json
-                    with open(classes_path, 'r', encoding='utf-8') as f:
-                        self.classes = json.load(f)
                     self.logger.info("✅ Modelo CNN entrenado y cargado correctamente")
                 else:
                     self.logger.error("❌ No se pudo entrenar el modelo CNN")
         except Exception as e:
             self.logger.error(f"❌ Error al cargar o entrenar modelos: {e}")
     
+    def _load_centroid_head(self):
+        """
+        Carga la cabeza de centroides si existe; sus clases sustituyen a las de la softmax del modelo
+        """
+        self.centroid_head = CentroidHead.load(CENTROID_HEAD_PATH)
+        if self.centroid_head is not None:
+            self.classes = list(self.centroid_head.classes)
+            self._files_version += "|" + self._compute_model_version(CENTROID_HEAD_PATH)
+            self.logger.info(f"🧭 Cabeza de centroides activa: {len(self.classes)} clases")
+
+    def _load_two_heads(self):
+        """
+        Carga el índice de usuarios y la cabeza de emociones; si existen ambos se usa el modo de dos cabezas
+        """
+        user_index, emotion_head = CentroidHead.load(USER_INDEX_PATH), CentroidHead.load(EMOTION_HEAD_PATH)
+        if user_index is None or emotion_head is None:
+            return
+        self.user_index, self.emotion_head = user_index, emotion_head
+        self._files_version += "|" + self._compute_model_version(USER_INDEX_PATH, EMOTION_HEAD_PATH)
+        self.logger.info(f"🧭 Modo de dos cabezas: {len(user_index.classes)} usuarios, "
+                         f"{len(emotion_head.classes)} emociones")
+
+    @property
+    def two_head(self) -> bool:
+        """
+        True si la identificación de usuario y la emoción se resuelven con cabezas separadas
+        """
+        return self.user_index is not None and self.emotion_head is not None
+
+    def _get_embedding_model(self):
+        """
+        Submodelo de la CNN hasta la capa anterior a la softmax (embedding de 128 dimensiones)
+        """
+        if self._embedding_model is None:
+            from tensorflow.keras.models import Model
+            self._embedding_model = Model(inputs=self.model.inputs, outputs=self.model.layers[-2].output)
+        return self._embedding_model
+
+    def _inference_model(self):
+        """
+        Red que ejecuta el backend: la CNN completa o, con cabeza de centroides, el extractor de embeddings
+        """
+        if self.two_head or self.centroid_head is not None:
+            return self._get_embedding_model()
+        return self.model
+
+    @staticmethod
+    def _compute_model_version(*paths: str) -> str:
+        """
+        Versión del modelo a partir del tamaño y fecha de modificación de sus archivos (sin leerlos)
+        """
+        parts = []
+        for path in paths:
+            stat = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+        return "|".join(parts)
+
+    @property
+    def model_version(self) -> str:
+        """
+        Versión que forma parte de la clave de caché: archivos del modelo y, con tflite_int8, el modelo cuantizado
+        (sus predicciones difieren de las float32 y no deben mezclarse en la caché)
+        """
+        return self._files_version + self._backend_version
+
+    def cache_stats(self) -> Dict:
+        """
+        Devuelve los contadores de la caché de predicciones
+        """
+        return self.cache.stats()
+
+    def set_backend(self, backend: str):
+        """
+        Selecciona y prepara el backend de inferencia. Si falla, vuelve a Keras model.predict.
+        """
+        if backend not in self.INFERENCE_BACKENDS:
+            self.logger.warning(f"⚠️ Backend de inferencia desconocido '{backend}', se usa 'keras'")
+            backend = "keras"
+        self.backend = backend
+        self._infer_fn = None
+        self._backend_version = ""
+        if self.model is None:
+            return
+        try:
+            import tensorflow as tf
+            net = self._inference_model()  # CNN completa o extractor de embeddings
+            if backend == "call":
+                # Llamada directa al modelo: evita el adaptador de datos y los callbacks de predict
+                self._infer_fn = lambda x: net(x, training=False).numpy()
+            elif backend == "function":
+                # Grafo trazado una sola vez con firma fija (lote variable, 96x96x3 float32)
+                spec = tf.TensorSpec([None, self.img_height, self.img_width, 3], tf.float32)
+                traced = tf.function(lambda x: net(x, training=False), input_signature=[spec])
+                self._infer_fn = lambda x: traced(tf.convert_to_tensor(x, dtype=tf.float32)).numpy()
+            elif backend == "tflite":
+                converter = tf.lite.TFLiteConverter.from_keras_model(net)
+                self._infer_fn = self._make_tflite_fn(converter.convert())
+            elif backend == "tflite_int8":
+                # Modelo cuantizado a int8 exportado con export_int8
+                if not os.path.exists(INT8_MODEL_PATH):
+                    raise FileNotFoundError(f"{INT8_MODEL_PATH} no existe (ejecuta export_int8)")
+                with open(INT8_MODEL_PATH, 'rb') as f:
+                    self._infer_fn = self._make_tflite_fn(f.read())
+                self._backend_version = "|tflite_int8|" + self._compute_model_version(INT8_MODEL_PATH)
+            self.logger.info(f"⚙️ Backend de inferencia: {backend}")
+        except Exception as e:
+            self.logger.error(f"❌ No se pudo preparar el backend '{backend}': {e}. Se usa 'keras'")
+            self.backend = "keras"
+            self._infer_fn = None
+
+    def _make_tflite_fn(self, tflite_model: bytes):
+        """
+        Crea una función de inferencia sobre un intérprete TFLite (CPU) a partir del modelo serializado
+        """
+        import tensorflow as tf
+        interpreter = tf.lite.Interpreter(model_content=tflite_model)  # Intérprete TFLite
+        interpreter.allocate_tensors()
+        input_detail = interpreter.get_input_details()[0]
+        output_detail = interpreter.get_output_details()[0]
+        in_scale, in_zero = input_detail['quantization']  # (0.0, 0) si la entrada es float
+        out_scale, out_zero = output_detail['quantization']
+
+        def infer(x: np.ndarray) -> np.ndarray:
+            # Redimensiona la entrada solo si cambia el tamaño de lote
+            if tuple(input_detail['shape']) != x.shape:
+                interpreter.resize_tensor_input(input_detail['index'], x.shape)
+                interpreter.allocate_tensors()
+                input_detail.update(interpreter.get_input_details()[0])
+            if input_detail['dtype'] in (np.int8, np.uint8):
+                info = np.iinfo(input_detail['dtype'])
+                x = np.clip(np.round(x / in_scale + in_zero), info.min, info.max)  # Cuantiza la entrada
+            interpreter.set_tensor(input_detail['index'], x.astype(input_detail['dtype'], copy=False))
+            interpreter.invoke()
+            output = interpreter.get_tensor(output_detail['index'])
+            if output_detail['dtype'] in (np.int8, np.uint8):
+                output = (output.astype(np.float32) - out_zero) * out_scale  # Descuantiza la salida
+            return output
+        return infer
+
+    def export_int8(self, output_path: str = INT8_MODEL_PATH, dataset_dir: str = 'emociones',
+                    calibration_size: int = 200) -> bool:
+        """
+        Exporta la red de inferencia a TFLite con cuantización int8 post-entrenamiento, calibrada con una muestra
+        aleatoria de emociones/. Entrada y salida siguen en float32, así que el preprocesado no cambia.
+        Se carga con el backend "tflite_int8". Devuelve True si tiene éxito.
+        """
+        if not self.wait_until_ready() or self.model is None:
+            self.logger.error("❌ No hay modelo CNN para exportar")
+            return False
+        try:
+            import tensorflow as tf
+            if VISION_DATASET_CACHE_DIR:
+                X, _, _ = self.load_dataset_cached(dataset_dir)
+            else:
+                X, _, _ = self.load_dataset(dataset_dir)
+            if X is None or len(X) == 0:
+                self.logger.error("❌ No hay imágenes para calibrar la cuantización")
+                return False
+            sample = np.sort(np.random.default_rng(42).choice(len(X), min(calibration_size, len(X)), replace=False))
+
+            def representative_dataset():
+                for i in sample:
+                    image = np.asarray(X[i:i + 1])
+                    if image.dtype == np.uint8:
+                        image = image.astype(np.float32) * (1.0 / 255.0)
+                    yield [image.astype(np.float32)]
+
+            converter = tf.lite.TFLiteConverter.from_keras_model(self._inference_model())
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            tflite_model = converter.convert()
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            with open(output_path, 'wb') as f:
+                f.write(tflite_model)
+        except Exception as e:
+            self.logger.error(f"❌ Error al exportar el modelo int8: {e}")
+            return False
+        self.logger.info(f"✅ Modelo int8 exportado a {output_path} ({len(tflite_model) / 1024:.0f} KB, "
+                         f"calibrado con {len(sample)} imágenes)")
+        if self.backend == "tflite_int8" and os.path.abspath(output_path) == os.path.abspath(INT8_MODEL_PATH):
+            self.set_backend("tflite_int8")  # Carga el modelo nuevo y cambia la versión de la caché
+        return True
+
+    def _run_network(self, batch: np.ndarray, batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        Ejecuta la red de inferencia (ver _inference_model) con el backend configurado
+        """
+        if self._infer_fn is None:
+            return self._inference_model().predict(batch, batch_size=batch_size, verbose=0)  # Keras model.predict
+        batch_size = batch_size or VISION_BATCH_SIZE
+        if len(batch) <= batch_size:
+            return self._infer_fn(batch)
+        # Trocear en lotes para acotar memoria
+        return np.concatenate([self._infer_fn(batch[i:i + batch_size]) for i in range(0, len(batch), batch_size)])
+
+    def _classify(self, output: np.ndarray) -> List[Dict]:
+        """
+        Convierte la salida de la red (probabilidades o embeddings) en un resultado por imagen.
+        En modo de dos cabezas, el usuario sale del índice de embeddings y la emoción de su propia cabeza.
+        """
+        if self.two_head:
+            user_idx, user_sims = self.user_index.nearest(output)  # Búsqueda coseno vectorizada
+            emotion_probs = self.emotion_head.probabilities(output)
+            emotion_idx = np.argmax(emotion_probs, axis=1)
+            results = []
+            for row in range(len(output)):
+                user_id = self.user_index.classes[int(user_idx[row])]
+                emotion = self.emotion_head.classes[int(emotion_idx[row])]
+                emotion_confidence = float(emotion_probs[row][emotion_idx[row]])
+                results.append({
+                    "emotion": f"{user_id}_{emotion}",  # Clase compuesta (compatibilidad)
+                    "confidence": emotion_confidence,  # Confianza de la emoción
+                    "user_id": user_id,  # Usuario identificado
+                    "user_confidence": float(np.clip(user_sims[row], 0.0, 1.0)),  # Similitud coseno
+                    "emotion_confidence": emotion_confidence,  # Confianza de la emoción
+                    "success": True
+                })
+            return results
+        probabilities = self.centroid_head.probabilities(output) if self.centroid_head is not None else output
+        class_indices = np.argmax(probabilities, axis=1)  # Índices de clase de todo el lote
+        results = []
+        for row, class_index in enumerate(class_indices):
+            if class_index < len(self.classes):
+                results.append({
+                    "emotion": self.classes[class_index],  # Emoción detectada
+                    "confidence": float(probabilities[row][class_index]),  # Confianza
+                    "success": True
+                })
+            else:
+                results.append({"success": False, "error": "Error en predicción del modelo"})
+        return results
+
     def _preprocess_image(self, image: Image.Image) -> np.ndarray:
         """
         Preprocesa la imagen exactamente como en el código de Colab (resize directo a 96x96, sin recorte cuadrado).
@@ -76,7 +532,7 @@ class VisionModule:
             # Redimensionar exactamente a 96x96 (sin recorte)
             image = image.resize((96, 96))  # Redimensiona
             # Convertir a array y normalizar
-            image_array = img_to_array(image)  # Convierte a array
+            image_array = np.asarray(image, dtype=np.float32)  # Convierte a array (equivalente a img_to_array)
             image_array = image_array / 255.0  # Normaliza
             # Agregar dimensión de batch
             image_array = np.expand_dims(image_array, axis=0)  # Añade dimensión batch
@@ -85,36 +541,44 @@ class VisionModule:
             self.logger.error(f"Error al preprocesar imagen: {e}")  # Log de error
             raise  # Relanza excepción
     
-    def detect_emotion(self, image_path: str) -> Dict:
+    def detect_emotion(self, image_path: Union[str, bytes]) -> Dict:
         """
         Detecta la emoción en la imagen usando el modelo CNN
-        Proceso simplificado como en el código de Colab
+        Proceso simplificado como en el código de Colab.
+        Acepta una ruta o los bytes de la imagen (p. ej. un BLOB de la base de datos);
+        si la predicción está en caché no se decodifica la imagen ni se ejecuta la CNN.
         """
         try:
-            # Cargar imagen desde el path
-            image = Image.open(image_path)  # Abre la imagen
+            self.wait_until_ready()  # Espera a que el modelo termine de cargar
+            # Leer los bytes de la imagen y consultar la caché antes de decodificar
+            with metrics.timer("vision_read"):
+                image_bytes = self._read_image_bytes(image_path)  # Bytes de la imagen
+            cache_key = PredictionCache.make_key(image_bytes, self.model_version)  # Clave por contenido
+            if self.model is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    metrics.increment("vision_cache_hit")
+                    return cached  # Acierto: sin PIL ni CNN
+                metrics.increment("vision_cache_miss")
+
+            # Cargar imagen desde los bytes
+            with metrics.timer("vision_decode"):
+                image = Image.open(io.BytesIO(image_bytes))  # Abre la imagen
+                image.load()  # Decodifica aquí para medir PIL por separado
             
             # Preprocesar imagen completa (sin detectar rostros, como en Colab)
-            processed_image = self._preprocess_image(image)  # Preprocesa
+            with metrics.timer("vision_preprocess"):
+                processed_image = self._preprocess_image(image)  # Preprocesa
             
-            if self.model is not None and len(self.classes) > 0:
+            if self.model is not None and (len(self.classes) > 0 or self.two_head):
                 # Hacer predicción (como en Colab)
-                prediction = self.model.predict(processed_image, verbose=0)  # Predice
-                class_index = np.argmax(prediction[0])  # Índice de clase
-                
-                if class_index < len(self.classes):
-                    predicted_class = self.classes[class_index]  # Clase predicha
-                    confidence = float(prediction[0][class_index])  # Confianza
-                    
-                    self.logger.info(f"Clase detectada: {predicted_class} (confianza: {confidence:.3f})")  # Log
-                    
-                    return {
-                        "emotion": predicted_class,  # Emoción detectada
-                        "confidence": confidence,  # Confianza
-                        "success": True  # Éxito
-                    }
-                else:
-                    return {"success": False, "error": "Error en predicción del modelo"}  # Error de predicción
+                with metrics.timer("vision_predict", backend=self.backend):
+                    output = self._run_network(processed_image.astype(np.float32))  # Predice con el backend configurado
+                    result = self._classify(output)[0]  # Clase (o usuario + emoción) y confianza
+                if result["success"]:
+                    self.logger.info(f"Clase detectada: {result['emotion']} (confianza: {result['confidence']:.3f})")  # Log
+                    self.cache.put(cache_key, result)  # Guarda en caché
+                return result
             else:
                 # Fallback si no hay modelo cargado
                 import random
@@ -132,49 +596,160 @@ class VisionModule:
             return {"success": False, "error": str(e)}  # Devuelve error
     
 
-    def process_image(self, image_path: str) -> Dict:
+    @staticmethod
+    def _read_image_bytes(source: Union[str, bytes]) -> bytes:
+        """
+        Devuelve los bytes crudos de una imagen dada como ruta o como bytes
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return bytes(source)
+        with open(source, 'rb') as f:
+            return f.read()
+
+    def process_image(self, image_path: Union[str, bytes]) -> Dict:
         """
         Procesa una imagen: identifica usuario y emoción
         """
         try:
             # Hacer una sola predicción (más eficiente)
             result = self.detect_emotion(image_path)  # Predicción
-            if result["success"]:
-                predicted_class = result["emotion"]  # Clase predicha
-                confidence = result["confidence"]  # Confianza
-                # Extraer usuario y emoción real del formato 'usuario_emocion'
-                user_id, emotion_found = None, None
-                pred_lower = predicted_class.lower()
-                if '_' in pred_lower:
-                    user_id, emotion_found = pred_lower.split('_', 1)
-                else:
-                    # fallback: solo emoción, usuario por defecto
-                    user_id = "user"
-                    emotion_found = pred_lower
-                # Nombre legible
-                user_name = user_id.capitalize() if user_id else "Desconocido"
-                # Validar emoción
-                if emotion_found not in EMOTIONS:
-                    import difflib
-                    close = difflib.get_close_matches(emotion_found, EMOTIONS, n=1, cutoff=0.6)
-                    if close:
-                        emotion_found = close[0]
-                    else:
-                        emotion_found = "emoción desconocida"
-                return {
-                    "user_id": user_id,
-                    "user_name": user_name,
-                    "user_confidence": confidence,
-                    "emotion": emotion_found,
-                    "emotion_confidence": confidence,
-                    "success": True
-                }
-            else:
-                return result  # Devuelve error
+            return self._build_image_result(result)  # Separa usuario y emoción
         except Exception as e:
             self.logger.error(f"Error al procesar imagen: {e}")  # Log de error
             return {"success": False, "error": str(e)}  # Devuelve error
     
+    def _build_image_result(self, result: Dict) -> Dict:
+        """
+        Convierte el resultado de detect_emotion en el diccionario de usuario y emoción de process_image
+        """
+        if not result["success"]:
+            return result  # Devuelve error
+        predicted_class = result["emotion"]  # Clase predicha
+        confidence = result["confidence"]  # Confianza
+        user_confidence = result.get("user_confidence", confidence)  # Separada en modo de dos cabezas
+        # Extraer usuario y emoción real del formato 'usuario_emocion'
+        user_id, emotion_found = None, None
+        pred_lower = predicted_class.lower()
+        if result.get("user_id"):
+            # Modo de dos cabezas: usuario del índice de embeddings (puede contener '_')
+            user_id = result["user_id"]
+            emotion_found = pred_lower[len(user_id) + 1:]
+        elif '_' in pred_lower:
+            user_id, emotion_found = pred_lower.split('_', 1)
+        else:
+            # fallback: solo emoción, usuario por defecto
+            user_id = "user"
+            emotion_found = pred_lower
+        # Nombre legible
+        user_name = user_id.capitalize() if user_id else "Desconocido"
+        # Validar emoción
+        if emotion_found not in EMOTIONS:
+            import difflib
+            close = difflib.get_close_matches(emotion_found, EMOTIONS, n=1, cutoff=0.6)
+            if close:
+                emotion_found = close[0]
+            else:
+                emotion_found = "emoción desconocida"
+        return {
+            "user_id": user_id,
+            "user_name": user_name,
+            "user_confidence": user_confidence,
+            "emotion": emotion_found,
+            "emotion_confidence": confidence,
+            "success": True
+        }
+
+    def _load_for_batch(self, source: Union[str, bytes, Image.Image]):
+        """
+        Prepara una imagen para el lote: devuelve (array sin dimensión batch, clave de caché, resultado cacheado).
+        Las imágenes PIL no pasan por la caché; si hay acierto no se decodifica la imagen.
+        """
+        if isinstance(source, Image.Image):
+            return self._preprocess_image(source)[0].astype(np.float32), None, None
+        image_bytes = self._read_image_bytes(source)  # Bytes de la imagen
+        cache_key = PredictionCache.make_key(image_bytes, self.model_version)  # Clave por contenido
+        if self.model is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return None, cache_key, cached  # Acierto: sin decodificar
+        image = Image.open(io.BytesIO(image_bytes))  # Abre la imagen
+        return self._preprocess_image(image)[0].astype(np.float32), cache_key, None  # Quita la dimensión batch
+
+    def detect_emotions_batch(self, images: List[Union[str, bytes, Image.Image]], batch_size: Optional[int] = None) -> List[Dict]:
+        """
+        Detecta la emoción de varias imágenes (rutas, bytes o imágenes PIL) con una sola llamada al modelo por lote.
+        Las imágenes se decodifican en paralelo y se devuelven los mismos diccionarios que detect_emotion,
+        en el mismo orden de entrada. Las imágenes ya cacheadas no se decodifican ni se predicen.
+        """
+        self.wait_until_ready()  # Espera a que el modelo termine de cargar
+        batch_size = batch_size or VISION_BATCH_SIZE  # Tamaño de lote configurable
+        results: List[Optional[Dict]] = [None] * len(images)  # Resultados en orden de entrada
+        if not images:
+            return []
+
+        # Decodificar y preprocesar en paralelo (PIL libera el GIL al decodificar)
+        def load(idx_source):
+            idx, source = idx_source
+            try:
+                return (idx, *self._load_for_batch(source), None)
+            except Exception as e:
+                return idx, None, None, None, e
+        with metrics.timer("vision_batch_decode", images=len(images)):
+            with ThreadPoolExecutor(max_workers=max(1, VISION_DECODE_WORKERS)) as pool:
+                loaded = list(pool.map(load, enumerate(images)))
+
+        valid_idx = []  # Índices de imágenes decodificadas correctamente
+        for idx, array, cache_key, cached, error in loaded:
+            if error is not None:
+                self.logger.error(f"Error al cargar imagen {images[idx]}: {error}")  # Log de error
+                results[idx] = {"success": False, "error": str(error)}
+            elif cached is not None:
+                results[idx] = cached  # Acierto de caché
+            else:
+                valid_idx.append(idx)
+        if not valid_idx:
+            return results
+
+        if self.model is None or (len(self.classes) == 0 and not self.two_head):
+            # Sin modelo: mismo fallback que detect_emotion, imagen por imagen
+            import random
+            for idx in valid_idx:
+                results[idx] = {
+                    "emotion": random.choice(self.classes) if self.classes else "neutral",  # Emoción aleatoria
+                    "confidence": random.uniform(0.6, 0.9),  # Confianza aleatoria
+                    "success": True
+                }
+            return results
+
+        # Apilar en un único array contiguo y predecir por lotes
+        stacked = np.stack([loaded[idx][1] for idx in valid_idx])  # Array N x 96 x 96 x 3
+        try:
+            with metrics.timer("vision_batch_predict", backend=self.backend, images=len(stacked)):
+                batch_results = self._classify(self._run_network(stacked, batch_size))  # Predicción por lotes
+        except Exception as e:
+            self.logger.error(f"Error en predicción por lotes: {e}")  # Log de error
+            for idx in valid_idx:
+                results[idx] = {"success": False, "error": str(e)}
+            return results
+
+        for idx, result in zip(valid_idx, batch_results):
+            results[idx] = result
+            cache_key = loaded[idx][2]
+            if result["success"] and cache_key is not None:
+                self.cache.put(cache_key, result)  # Guarda en caché
+        self.logger.info(f"Lote procesado: {len(valid_idx)} imágenes")  # Log
+        return results
+
+    def process_images(self, images: List[Union[str, bytes, Image.Image]], batch_size: Optional[int] = None) -> List[Dict]:
+        """
+        Procesa varias imágenes en lote: identifica usuario y emoción de cada una (mismo formato que process_image)
+        """
+        try:
+            return [self._build_image_result(r) for r in self.detect_emotions_batch(images, batch_size)]
+        except Exception as e:
+            self.logger.error(f"Error al procesar imágenes: {e}")  # Log de error
+            return [{"success": False, "error": str(e)} for _ in images]  # Devuelve error por imagen
+    
     def test_connection(self) -> bool:
         """
         Prueba si el modelo está cargado correctamente
@@ -183,6 +758,9 @@ class VisionModule:
             if self.model is not None:
                 self.logger.info("✅ Modelo CNN disponible")  # Log de éxito
                 return True  # Modelo disponible
+            elif not self.is_ready:
+                self.logger.info("⏳ Modelo CNN cargándose en segundo plano")  # Aún calentando
+                return False  # Todavía no disponible
             else:
                 self.logger.warning("⚠️ Modelo CNN no cargado")  # Log de advertencia
                 return False  # Modelo no disponible
@@ -190,44 +768,372 @@ class VisionModule:
             self.logger.error(f"Error al verificar modelo: {e}")  # Log de error
             return False  # Devuelve False
 
-    def train_from_emociones(self, dataset_dir='emociones', epochs=20, batch_size=32):
-        """Entrena el modelo CNN usando las imágenes de la carpeta 'emociones/' y guarda el modelo y las clases. Devuelve True si tiene éxito, False si falla."""
+    @staticmethod
+    def scan_dataset(dataset_dir: str = 'emociones') -> List[tuple]:
+        """
+        Recorre el dataset y devuelve la lista ordenada de (ruta, etiqueta); la etiqueta es la carpeta (usuario_emocion)
+        """
+        files = []
+        for root, dirs, names in os.walk(dataset_dir):
+            label = os.path.basename(root).lower()  # Ejemplo: 'abrahan_feliz'
+            for name in names:
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    files.append((os.path.join(root, name), label))
+        files.sort()  # Orden estable entre ejecuciones
+        return files
+
+    def _decode_into(self, paths: List[str], out: np.ndarray, rows: np.ndarray, workers: Optional[int] = None) -> np.ndarray:
+        """
+        Decodifica paths en un pool de procesos escribiendo cada imagen en out[rows[i]].
+        Devuelve la máscara de imágenes decodificadas correctamente.
+        Los procesos se crean con spawn: se llega aquí desde un hilo en segundo plano con TensorFlow
+        ya cargado, y hacer fork de un proceso así puede dejar al hijo bloqueado.
+        """
+        size = self.img_height
+        ok = np.ones(len(paths), dtype=bool)  # Imágenes decodificadas correctamente
+        if not paths:
+            return ok
+        workers = workers or VISION_LOADER_WORKERS or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            decoded = pool.map(_decode_for_training, paths, [size] * len(paths), chunksize=32)
+            for i, pixels in enumerate(decoded):
+                if pixels is None:
+                    ok[i] = False
+                else:
+                    out[rows[i]] = pixels  # Escribe en su fila
+        return ok
+
+    def load_dataset_cached(self, dataset_dir: str = 'emociones', cache_dir: str = VISION_DATASET_CACHE_DIR,
+                            workers: Optional[int] = None):
+        """
+        Carga el dataset desde una caché memory-mapped (pixels.npy uint8 + index.json) en cache_dir.
+        Cada imagen se identifica por (ruta, mtime, tamaño): solo se decodifican las nuevas o modificadas.
+        Devuelve (X memmap uint8 de solo lectura, y_idx, class_names).
+        """
+        size = self.img_height
+        files = self.scan_dataset(dataset_dir)
+        if not files:
+            return None, None, []
+        start = time.perf_counter()
+        pixels_path = os.path.join(cache_dir, "pixels.npy")
+        index_path = os.path.join(cache_dir, "index.json")
+
+        # Índice anterior: (ruta, mtime, tamaño) -> fila en pixels.npy
+        old_rows, old_pixels = {}, None
+        if os.path.exists(pixels_path) and os.path.exists(index_path):
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                if index.get("size") == size:
+                    old_pixels = np.load(pixels_path, mmap_mode='r')  # Sin leer el archivo completo
+                    old_rows = {(e["path"], e["mtime_ns"], e["bytes"]): row for row, e in enumerate(index["entries"])}
+            except Exception as e:
+                self.logger.warning(f"⚠️ Caché del dataset ilegible, se reconstruye: {e}")
+                old_rows, old_pixels = {}, None
+
+        entries, reused, pending = [], [], []  # Entradas nuevas, filas reutilizadas y rutas a decodificar
+        for path, label in files:
+            stat = os.stat(path)
+            entry = {"path": path, "mtime_ns": stat.st_mtime_ns, "bytes": stat.st_size, "label": label}
+            old_row = old_rows.get((path, stat.st_mtime_ns, stat.st_size))
+            if old_row is not None:
+                reused.append((len(entries), old_row))
+            else:
+                pending.append(len(entries))
+            entries.append(entry)
+
+        if pending or len(entries) != len(old_rows):
+            # Reconstruye pixels.npy: copia las filas vigentes y decodifica solo las nuevas
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = pixels_path + ".tmp.npy"
+            new_pixels = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                                   shape=(len(entries), size, size, 3))
+            for new_row, old_row in reused:
+                new_pixels[new_row] = old_pixels[old_row]
+            ok = self._decode_into([entries[i]["path"] for i in pending], new_pixels, np.array(pending, dtype=np.int64), workers)
+            keep = np.ones(len(entries), dtype=bool)
+            keep[np.array(pending, dtype=np.int64)[~ok]] = False  # Descarta imágenes ilegibles
+            if not keep.all():
+                compact = np.lib.format.open_memmap(tmp_path + ".c.npy", mode='w+', dtype=np.uint8,
+                                                    shape=(int(keep.sum()), size, size, 3))
+                compact[:] = new_pixels[keep]
+                del new_pixels
+                os.replace(tmp_path + ".c.npy", tmp_path)
+                new_pixels = compact
+                entries = [e for e, k in zip(entries, keep) if k]
+            new_pixels.flush()
+            del new_pixels, old_pixels  # Cierra los memmaps antes de reemplazar el archivo
+            os.replace(tmp_path, pixels_path)
+            with open(index_path, 'w', encoding='utf-8') as f:
+                json.dump({"size": size, "entries": entries}, f, ensure_ascii=False)
+            self.logger.info(f"🗂️ Caché del dataset actualizada: {len(pending)} decodificadas, {len(reused)} reutilizadas")
+
+        X = np.load(pixels_path, mmap_mode='r')  # Lectura directa desde disco
+        class_names = sorted({e["label"] for e in entries})
+        class_to_idx = {name: i for i, name in enumerate(class_names)}
+        y_idx = np.fromiter((class_to_idx[e["label"]] for e in entries), dtype=np.int64, count=len(entries))
+        self.logger.info(f"📦 Dataset desde caché: {len(X)} imágenes, {len(class_names)} clases en "
+                         f"{time.perf_counter() - start:.2f}s")
+        return X, y_idx, class_names
+
+    def load_dataset(self, dataset_dir: str = 'emociones', workers: Optional[int] = None):
+        """
+        Carga el dataset decodificando en un pool de procesos y escribiendo directamente en un array float32
+        preasignado. Devuelve (X, y_idx, class_names); registra el tiempo de carga y el pico de memoria.
+        """
+        size = self.img_height  # Tamaño de imagen
+        files = self.scan_dataset(dataset_dir)
+        if not files:
+            return None, None, []
+        class_names = sorted({label for _, label in files})  # Clases ordenadas
+        class_to_idx = {name: i for i, name in enumerate(class_names)}  # Índice O(1) por etiqueta
+
+        start = time.perf_counter()
+        tracemalloc.start()
+        X = np.empty((len(files), size, size, 3), dtype=np.float32)  # Array preasignado
+        y_idx = np.fromiter((class_to_idx[label] for _, label in files), dtype=np.int64, count=len(files))
+        ok = self._decode_into([path for path, _ in files], X, np.arange(len(files)), workers)
+        X *= 1.0 / 255.0  # Normaliza en el sitio
+        if not ok.all():
+            X, y_idx = X[ok], y_idx[ok]  # Descarta imágenes ilegibles
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.logger.info(
+            f"📦 Dataset cargado: {len(X)} imágenes, {len(class_names)} clases en "
+            f"{time.perf_counter() - start:.2f}s (array {X.nbytes / 1e6:.1f} MB, pico {peak / 1e6:.1f} MB)"
+        )
+        return X, y_idx, class_names
+
+    def extract_embeddings(self, X: np.ndarray, batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        Calcula los embeddings de un array de imágenes (float32 normalizado o uint8, p. ej. el memmap del dataset)
+        """
+        batch_size = batch_size or VISION_BATCH_SIZE
+        embedder = self._get_embedding_model()
+        chunks = []
+        for i in range(0, len(X), batch_size):
+            batch = np.asarray(X[i:i + batch_size])
+            if batch.dtype == np.uint8:
+                batch = batch.astype(np.float32) * (1.0 / 255.0)  # Normaliza solo este lote
+            chunks.append(embedder(batch, training=False).numpy())
+        return np.concatenate(chunks) if chunks else np.zeros((0, embedder.output_shape[-1]), dtype=np.float32)
+
+    def _dataset_embeddings(self, dataset_dir: str):
+        """
+        Embeddings de todo el dataset en una sola pasada (desde la caché memmap si existe).
+        Devuelve (embeddings, y_idx, class_names) o (None, None, []) si no hay datos.
+        """
+        if VISION_DATASET_CACHE_DIR:
+            X, y_idx, class_names = self.load_dataset_cached(dataset_dir)
+        else:
+            X, y_idx, class_names = self.load_dataset(dataset_dir)
+        if X is None:
+            return None, None, []
+        return self.extract_embeddings(X), y_idx, class_names
+
+    def _reload_heads(self):
+        """
+        Vuelve a cargar las cabezas guardadas, recalcula la versión del modelo y reconstruye el backend
+        """
+        self.centroid_head, self.user_index, self.emotion_head = None, None, None
+        self._files_version = self._compute_model_version("models/emotion_model.h5", "models/classes.json")
+        self._load_centroid_head()
+        self._load_two_heads()
+        self.set_backend(self.backend)  # La red de inferencia pasa a ser el extractor de embeddings
+
+    def build_two_heads(self, dataset_dir: str = 'emociones') -> bool:
+        """
+        Construye el modo de dos cabezas a partir del dataset: un índice de usuarios (un centroide de embedding
+        por usuario, búsqueda coseno vectorizada) y una cabeza de emociones sobre EMOTIONS. El coste de
+        inferencia pasa a depender del número de emociones y no de usuarios x emociones.
+        """
+        start = time.perf_counter()
+        if not self.wait_until_ready() or self.model is None:
+            self.logger.error("❌ No hay modelo CNN para construir las cabezas")
+            return False
+        try:
+            embeddings, y_idx, class_names = self._dataset_embeddings(dataset_dir)
+            if embeddings is None:
+                self.logger.error("❌ No se encontraron datos para construir las cabezas.")
+                return False
+            user_index, emotion_head = CentroidHead(), CentroidHead()
+            for i, label in enumerate(class_names):
+                if '_' not in label:
+                    continue
+                user_id, emotion = label.split('_', 1)
+                class_embeddings = embeddings[y_idx == i]
+                user_index.add(user_id, class_embeddings)
+                if emotion in EMOTIONS:
+                    emotion_head.add(emotion, class_embeddings)
+            user_index.save(USER_INDEX_PATH)
+            emotion_head.save(EMOTION_HEAD_PATH)
+            self._reload_heads()
+        except Exception as e:
+            self.logger.error(f"❌ Error al construir las cabezas: {e}")
+            return False
+        self.logger.info(f"✅ Dos cabezas construidas en {time.perf_counter() - start:.2f}s")
+        return True
+
+    def _init_centroid_head(self, dataset_dir: str) -> CentroidHead:
+        """
+        Crea la cabeza de centroides con las clases del modelo base, usando el dataset (desde la caché si existe)
+        """
+        embeddings, y_idx, class_names = self._dataset_embeddings(dataset_dir)
+        head = CentroidHead()
+        if embeddings is None:
+            return head
+        for i, label in enumerate(class_names):
+            if label in self.classes:  # Solo clases que la softmax base conoce
+                head.add(label, embeddings[y_idx == i])
+        return head
+
+    def enroll(self, user_id: str, emotion_images: Optional[Dict[str, List[str]]] = None,
+               user_name: Optional[str] = None, dataset_dir: str = 'emociones') -> bool:
+        """
+        Inscribe un usuario (o emociones nuevas) sin reentrenar la CNN: congela la red, extrae los embeddings
+        de sus imágenes y añade un centroide por clase 'usuario_emocion' a la cabeza de centroides.
+        En modo de dos cabezas, los embeddings se añaden al índice de usuarios y a la cabeza de emociones.
+        emotion_images: {emoción: [rutas]}; si es None se usan las carpetas emociones/<usuario>_<emoción>/.
+        Actualiza USERS y EMOTIONS (persistidos en models/enrolled.json). Devuelve True si tiene éxito.
+        """
+        start = time.perf_counter()
+        if not self.wait_until_ready() or self.model is None:
+            self.logger.error("❌ No hay modelo CNN para inscribir usuarios")
+            return False
+        user_id = user_id.lower()
+        if emotion_images is None:
+            emotion_images = {}
+            prefix = f"{user_id}_"
+            for path, label in self.scan_dataset(dataset_dir):
+                if label.startswith(prefix):
+                    emotion_images.setdefault(label[len(prefix):], []).append(path)
+        if not emotion_images:
+            self.logger.error(f"❌ No hay imágenes para inscribir a '{user_id}'")
+            return False
+        try:
+            two_head = self.two_head
+            head = None if two_head else (self.centroid_head or self._init_centroid_head(dataset_dir))
+            for emotion, paths in emotion_images.items():
+                pixels = np.empty((len(paths), self.img_height, self.img_width, 3), dtype=np.uint8)
+                ok = self._decode_into(list(paths), pixels, np.arange(len(paths)))
+                if not ok.any():
+                    continue
+                embeddings = self.extract_embeddings(pixels[ok])
+                if two_head:
+                    self.user_index.add(user_id, embeddings)
+                    self.emotion_head.add(emotion.lower(), embeddings)
+                else:
+                    head.add(f"{user_id}_{emotion.lower()}", embeddings)
+            if two_head:
+                self.user_index.save(USER_INDEX_PATH)
+                self.emotion_head.save(EMOTION_HEAD_PATH)
+            else:
+                head.save(CENTROID_HEAD_PATH)
+            self._reload_heads()  # Activa las cabezas y actualiza clases y versión
+            self._register_enrollment(user_id, user_name, list(emotion_images))
+        except Exception as e:
+            self.logger.error(f"❌ Error al inscribir a '{user_id}': {e}")
+            return False
+        self.logger.info(f"✅ '{user_id}' inscrito con {len(emotion_images)} emociones en {time.perf_counter() - start:.2f}s")
+        return True
+
+    @staticmethod
+    def _register_enrollment(user_id: str, user_name: Optional[str], emotions: List[str]):
+        """
+        Añade el usuario y las emociones nuevas a USERS/EMOTIONS y los persiste en models/enrolled.json
+        """
+        enrolled = {"users": {}, "emotions": []}
+        if ENROLLED_PATH.exists():
+            with open(ENROLLED_PATH, 'r', encoding='utf-8') as f:
+                enrolled = json.load(f)
+        name = user_name or user_id.capitalize()
+        user_config = USERS.get(user_id) or {
+            "name": name,  # Nombre del usuario
+            "prompt_template": "Eres un asistente amigable. Usuario: {user_name}. Responde cordialmente.",  # Plantilla de prompt
+            "personality": "profesional"  # Personalidad del asistente
+        }
+        USERS.setdefault(user_id, user_config)
+        enrolled.setdefault("users", {})[user_id] = user_config
+        for emotion in (e.lower() for e in emotions):
+            if emotion not in EMOTIONS:
+                EMOTIONS.append(emotion)
+            if emotion not in enrolled.setdefault("emotions", []):
+                enrolled["emotions"].append(emotion)
+        ENROLLED_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(ENROLLED_PATH, 'w', encoding='utf-8') as f:
+            json.dump(enrolled, f, ensure_ascii=False, indent=2)
+
+    def _build_tf_dataset(self, paths: np.ndarray, labels: np.ndarray, num_classes: int, batch_size: int,
+                          shuffle: bool = False, augment: bool = False):
+        """
+        Pipeline tf.data que lee y decodifica los archivos en paralelo (mismo preprocesado que la inferencia),
+        con barajado, aumentos opcionales, lotes y prefetch. La memoria no depende del tamaño del dataset.
+        """
+        import tensorflow as tf
+        size = self.img_height
+        autotune = tf.data.AUTOTUNE
+
+        def load(path, label):
+            image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+            image = tf.image.resize(image, [size, size], method='bicubic', antialias=True)  # Como PIL resize
+            image = tf.clip_by_value(image, 0.0, 255.0) / 255.0  # Normaliza
+            return image, tf.one_hot(label, num_classes)
+
+        def random_augment(image, label):
+            image = tf.image.random_flip_left_right(image)
+            image = tf.image.random_brightness(image, 0.1)
+            image = tf.image.random_contrast(image, 0.9, 1.1)
+            return tf.clip_by_value(image, 0.0, 1.0), label
+
+        dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+        if shuffle:
+            dataset = dataset.shuffle(len(paths), reshuffle_each_iteration=True)  # Baraja rutas, no píxeles
+        dataset = dataset.map(load, num_parallel_calls=autotune)
+        if augment:
+            dataset = dataset.map(random_augment, num_parallel_calls=autotune)
+        return dataset.batch(batch_size).prefetch(autotune)
+
+    def train_from_emociones(self, dataset_dir='emociones', epochs=20, batch_size=32, pipeline=None, augment=False):
+        """Entrena el modelo CNN usando las imágenes de la carpeta 'emociones/' y guarda el modelo y las clases. Devuelve True si tiene éxito, False si falla.
+        pipeline (por defecto VISION_TRAIN_PIPELINE): "memmap" lee los lotes de la caché memory-mapped, "memory" carga todo en RAM
+        y "tfdata" transmite los archivos con tf.data en memoria acotada (augment activa aumentos aleatorios)."""
         # Importa librerías necesarias para entrenamiento
-        import numpy as np
-        from PIL import Image
         from tensorflow.keras.utils import to_categorical
         from tensorflow.keras.models import Sequential
         from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
         from tensorflow.keras.optimizers import Adam
         from sklearn.model_selection import train_test_split
-        import json, os
 
         IMG_SIZE = self.img_height  # Tamaño de imagen
-        X, y = [], []  # Listas para datos e índices
-        class_names = set()  # Conjunto de nombres de clases
-        for root, dirs, files in os.walk(dataset_dir):
-            for file in files:
-                if file.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif')):
-                    img_path = os.path.join(root, file)
-                    # La clase será el nombre de la carpeta (usuario_emocion)
-                    label = os.path.basename(root).lower()  # Ejemplo: 'abrahan_feliz'
-                    class_names.add(label)
-                    try:
-                        img = Image.open(img_path).convert('RGB')
-                        img = img.resize((IMG_SIZE, IMG_SIZE))
-                        img = np.array(img) / 255.0
-                        X.append(img)
-                        y.append(label)
-                    except Exception as e:
-                        print(f"Error cargando {img_path}: {e}")
-        if not X or not y or not class_names:
-            self.logger.error("❌ No se encontraron datos para entrenamiento.")
-            return False
-        X = np.array(X)
-        class_names = sorted(list(class_names))
-        y_idx = [class_names.index(lbl) for lbl in y]
-        y_cat = to_categorical(y_idx, num_classes=len(class_names))
-        X_train, X_val, y_train, y_val = train_test_split(X, y_cat, test_size=0.2, random_state=42)
+        pipeline = pipeline or VISION_TRAIN_PIPELINE
+        if pipeline == "memmap" and not VISION_DATASET_CACHE_DIR:
+            pipeline = "memory"  # Caché desactivada
+        if pipeline == "tfdata":
+            files = self.scan_dataset(dataset_dir)  # Solo rutas y etiquetas en memoria
+            class_names = sorted({label for _, label in files})
+            if not files:
+                self.logger.error("❌ No se encontraron datos para entrenamiento.")
+                return False
+            class_to_idx = {name: i for i, name in enumerate(class_names)}
+            paths = np.array([path for path, _ in files])
+            y_idx = np.fromiter((class_to_idx[label] for _, label in files), dtype=np.int64, count=len(files))
+            train_idx, val_idx = train_test_split(np.arange(len(files)), test_size=0.2, random_state=42)
+            train_data = self._build_tf_dataset(paths[train_idx], y_idx[train_idx], len(class_names), batch_size,
+                                                shuffle=True, augment=augment)
+            val_data = self._build_tf_dataset(paths[val_idx], y_idx[val_idx], len(class_names), batch_size)
+        else:
+            if pipeline == "memmap":
+                X, y_idx, class_names = self.load_dataset_cached(dataset_dir)  # Memmap uint8 con decodificación incremental
+            else:
+                X, y_idx, class_names = self.load_dataset(dataset_dir)  # Carga paralela en array preasignado
+            if X is None or len(X) == 0 or not class_names:
+                self.logger.error("❌ No se encontraron datos para entrenamiento.")
+                return False
+            y_cat = to_categorical(y_idx, num_classes=len(class_names))
+            # Se dividen índices (misma partición que dividir los arrays) para no copiar X
+            train_idx, val_idx = train_test_split(np.arange(len(X)), test_size=0.2, random_state=42)
+            train_data = _make_batch_sequence(X, y_cat, train_idx, batch_size, shuffle=True)
+            val_data = _make_batch_sequence(X, y_cat, val_idx, batch_size, shuffle=False)
         # Definir modelo simple CNN
         model = Sequential([
             Conv2D(32, (3, 3), activation='relu', input_shape=(IMG_SIZE, IMG_SIZE, 3)),
@@ -240,11 +1146,22 @@ class VisionModule:
             Dense(len(class_names), activation='softmax')
         ])
         model.compile(optimizer=Adam(), loss='categorical_crossentropy', metrics=['accuracy'])
-        model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size, validation_data=(X_val, y_val), verbose=2)
+        throughput = _make_throughput_callback(len(train_idx), self.logger)  # Imágenes/s por época
+        model.fit(train_data, epochs=epochs, validation_data=val_data, verbose=2, callbacks=[throughput])
         # Guardar modelo y clases
         os.makedirs('models', exist_ok=True)
         model.save('models/emotion_model.h5')
         with open('models/classes.json', 'w', encoding='utf-8') as f:
             json.dump(class_names, f, ensure_ascii=False, indent=2)
+        for head_path in (CENTROID_HEAD_PATH, USER_INDEX_PATH, EMOTION_HEAD_PATH):
+            if os.path.exists(head_path):
+                # Los centroides se calcularon con los embeddings del modelo anterior; hay que reconstruirlos
+                os.remove(head_path)
+        self.centroid_head, self.user_index, self.emotion_head, self._embedding_model = None, None, None, None
+        # El modelo recién entrenado sustituye al cargado: clases, versión (clave de caché) y backend
+        self.model = model
+        self.classes = list(class_names)
+        self._files_version = self._compute_model_version('models/emotion_model.h5', 'models/classes.json')
+        self.set_backend(self.backend)  # El backend anterior envolvía la red (o el extractor) del modelo viejo
         self.logger.info("✅ Modelo y clases guardados en 'models/'")
         return True 
\ No newline at end of file
@@ -12,16 +12,18 @@ from PIL import Image, ImageTk  # Importa PIL para manejo de imágenes
 import sys  # Importa sys para manipular el path
 # Importa os para operaciones de sistema
 import os  # Importa os para operaciones de sistema
-# Importa tempfile para archivos temporales
-import tempfile  # Importa tempfile para archivos temporales
+# Importa io para abrir imágenes guardadas en memoria
+import io  # Importa io para leer imágenes desde bytes
 # Importa datetime para manejar fechas y horas
 from datetime import datetime  # Importa datetime para manejar fechas y horas
-# Importa threading para hilos (no usado en este archivo)
-import threading  # Importa threading para hilos (no usado en este archivo)
+# Importa threading para generar respuestas en un hilo de trabajo
+import threading  # Importa threading para el hilo de streaming
+# Importa queue para pasar fragmentos del hilo de trabajo a Tk
+import queue  # Cola de fragmentos del LLM
 # Importa re para expresiones regulares
 import re  # Importa re para expresiones regulares
-# Importa time para retardos en animación de texto
-import time  # Importa time para retardos en animación de texto
+# Importa time para medir el tiempo hasta el primer token
+import time  # Importa time para medir latencias
 
 # Agrega el directorio actual al path para importar módulos locales
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -30,10 +32,15 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from modules.vision_module import VisionModule  # Importa el módulo de visión
 # Importa el módulo LLM
 from modules.llm_module import LLMModule  # Importa el módulo LLM
+# Importa las prioridades del planificador de peticiones al LLM
+from modules.llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND  # Prioridades de la cola
 # Importa el módulo de base de datos
 from modules.database_module import ChatDatabase  # Importa el módulo de base de datos
+# Importa el registro de métricas del pipeline
+from modules.metrics import metrics  # Tiempos por etapa
 # Importa configuraciones globales
-from config import EMOTIONS, USERS  # Importa configuraciones globales
+from config import EMOTIONS, USERS, CHAT_STREAM_POLL_MS, CHAT_THUMBNAIL_SIZE, CHAT_PAGE_SIZE, \
+    LLM_GREETING_TEMPERATURE  # Importa configuraciones globales
 
 class VisionAgentChat:
     def __init__(self, root):
@@ -43,8 +50,8 @@ class VisionAgentChat:
         self.root.configure(bg='#f0f0f0')  # Color de fondo
         
         # Inicializar módulos
-        self.vision_module = VisionModule()  # Módulo de visión
-        self.llm_module = LLMModule()  # Módulo de lenguaje
+        self.vision_module = VisionModule(lazy=True)  # Módulo de visión (TensorFlow y modelo cargan en segundo plano)
+        self.llm_module = LLMModule(preload=True)  # Módulo de lenguaje (precarga el modelo en Ollama en segundo plano)
         self.database = ChatDatabase()  # Módulo de base de datos
         
         # Variables de estado
@@ -54,10 +61,17 @@ class VisionAgentChat:
         self.conversation_history = []  # Historial de conversación
         self.current_session_id = None  # ID de la sesión actual
         self.current_session_name = None  # Nombre de la sesión actual
+        self._stream_queue = queue.Queue()  # Fragmentos del LLM producidos por el hilo de trabajo
+        self._stream_id = 0  # Generación en curso
+        self._cancel_event = None  # Evento de cancelación (None si no hay generación en curso)
+        self._oldest_message_id = None  # Mensaje más antiguo mostrado de la sesión cargada
+        self._has_older = False  # Quedan mensajes anteriores por cargar
+        self._loading_older = False  # Hay una página anterior cargándose
         
         # Crear interfaz gráfica
         self.create_widgets()  # Crea los widgets de la interfaz
         self.create_menu()  # Crea el menú principal
+        self._poll_model_ready()  # Actualiza el estado del modelo cuando termine de cargar
         
         # Crear nueva sesión automáticamente al iniciar
         self.create_new_session()
@@ -81,6 +95,10 @@ class VisionAgentChat:
         menubar.add_cascade(label="Chat", menu=chat_menu)  # Agrega el menú de chat
         chat_menu.add_command(label="Limpiar Chat", command=self.clear_chat)  # Opción para limpiar chat
         chat_menu.add_command(label="Exportar Chat", command=self.export_chat)  # Opción para exportar chat
+        # Menú de Depuración
+        debug_menu = tk.Menu(menubar, tearoff=0)  # Crea el menú de depuración
+        menubar.add_cascade(label="Depuración", menu=debug_menu)  # Agrega el menú de depuración
+        debug_menu.add_command(label="Métricas de rendimiento", command=self.show_metrics_window)  # Tiempos por etapa
 
     def create_widgets(self):
         """Crear todos los widgets de la interfaz (con tags de burbuja)."""
@@ -99,6 +117,8 @@ class VisionAgentChat:
         session_frame.grid(row=0, column=0, pady=(0, 10), sticky=(tk.W, tk.E))  # Ubica el frame de sesión
         self.session_label = ttk.Label(session_frame, text="Nueva sesión", font=("Arial", 10, "bold"))  # Label de sesión
         self.session_label.grid(row=0, column=0)  # Ubica el label
+        self.model_status_label = ttk.Label(session_frame, text="⏳ Modelo calentando...", font=("Arial", 9, "italic"))  # Estado del modelo CNN
+        self.model_status_label.grid(row=1, column=0, pady=(5, 0))  # Ubica el label de estado
 
         # Panel derecho (chat)
         right_panel = ttk.Frame(main_frame)  # Frame derecho
@@ -113,6 +133,7 @@ class VisionAgentChat:
         chat_frame.rowconfigure(0, weight=1)  # Expande el frame de chat
         self.chat_display = scrolledtext.ScrolledText(chat_frame, wrap=tk.WORD, height=20, font=("Arial", 10))  # Área de texto con scroll
         self.chat_display.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))  # Ubica el área de chat
+        self.chat_display.configure(yscrollcommand=self._on_chat_scroll)  # Al llegar arriba carga mensajes anteriores
         # Definir tags de burbuja para estilos de mensajes
         self.chat_display.tag_configure("user_bubble", background="#ffe0b2", foreground="#333", justify="right", lmargin1=60, lmargin2=60, rmargin=10, spacing3=5, font=("Arial", 10, "bold"))
         self.chat_display.tag_configure("assistant_bubble", background="#e1bee7", foreground="#222", justify="left", lmargin1=10, lmargin2=10, rmargin=60, spacing3=5, font=("Arial", 10))
@@ -128,8 +149,10 @@ class VisionAgentChat:
         self.text_input.bind('<Return>', self.send_message)  # Permite enviar con Enter
         self.send_btn = ttk.Button(input_frame, text="Enviar", command=self.send_message)  # Botón enviar
         self.send_btn.grid(row=0, column=1, padx=(0, 5))  # Ubica el botón enviar
-        self.select_btn = ttk.Button(input_frame, text="Seleccionar Imagen", command=self.select_image)  # Botón seleccionar imagen
-        self.select_btn.grid(row=0, column=2)  # Ubica el botón seleccionar imagen
+        self.stop_btn = ttk.Button(input_frame, text="Detener", command=self.cancel_generation, state='disabled')  # Botón cancelar generación
+        self.stop_btn.grid(row=0, column=2, padx=(0, 5))  # Ubica el botón detener
+        self.select_btn = ttk.Button(input_frame, text="Seleccionar Imagen", command=self.select_image, state='disabled')  # Se activa cuando el modelo de visión está listo
+        self.select_btn.grid(row=0, column=3)  # Ubica el botón seleccionar imagen
 
         # Frame para emoción y usuario detectados debajo del chat
         status_frame = ttk.Frame(right_panel)  # Frame para estado
@@ -140,8 +163,20 @@ class VisionAgentChat:
         self.user_label = ttk.Label(status_frame, text="Usuario: Sin usuario", font=("Arial", 10, "bold"))  # Label de usuario
         self.user_label.grid(row=1, column=0, sticky=(tk.W, tk.E))  # Ubica el label de usuario
 
+    def _poll_model_ready(self):
+        """Consulta sin bloquear si el modelo de visión terminó de cargar y actualiza el estado"""
+        if not self.vision_module.is_ready:
+            self.root.after(200, self._poll_model_ready)  # Vuelve a consultar más tarde
+            return
+        self.select_btn.configure(state='normal')  # Ya se puede clasificar sin bloquear la interfaz
+        if self.vision_module.model is not None:
+            self.model_status_label.configure(text="✅ Modelo listo")
+        else:
+            self.model_status_label.configure(text="⚠️ Modelo no disponible")
+
     def create_new_session(self):
         """Crear una nueva sesión de chat"""
+        self.cancel_generation()  # La respuesta en curso se guarda en la sesión anterior, no en la nueva
         session_name = f"Sesión {datetime.now().strftime('%Y-%m-%d %H:%M')}"
         self.current_session_id = self.database.create_new_session(session_name)
         self.current_session_name = session_name
@@ -249,14 +284,15 @@ class VisionAgentChat:
         ttk.Button(button_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.RIGHT)
     
     def load_session(self, session_id):
-        """Cargar una sesión específica"""
+        """Cargar una sesión específica (solo la última página; el resto al subir en el chat)"""
+        self.cancel_generation()  # Termina la respuesta en curso antes de cambiar de sesión
         # Obtener información de la sesión
         session_info = self.database.get_session_info(session_id)
         if not session_info:
             messagebox.showerror("Error", "No se pudo cargar la sesión")
             return
-        # Obtener mensajes de la sesión
-        messages = self.database.get_session_messages(session_id)
+        # Obtener los mensajes más recientes de la sesión
+        messages = self.database.get_session_messages(session_id, limit=CHAT_PAGE_SIZE)
         # Actualizar variables
         self.current_session_id = session_id
         self.current_session_name = session_info['name']
@@ -265,11 +301,12 @@ class VisionAgentChat:
         self.chat_display.config(state='normal')  # Habilita edición del área de chat
         self.chat_display.delete(1.0, tk.END)  # Borra todo el chat
         self.chat_display.config(state='disabled')  # Deshabilita edición
-        # Cargar mensajes
+        self._has_older = False  # Sin paginar mientras se pinta la primera página
+        # Cargar mensajes (el historial del LLM parte de esta página: el prompt solo usa los turnos recientes)
         self.conversation_history = []  # Reinicia historial de conversación
         for message in messages:
+            self._render_history_message(message)
             if message['type'] == 'user':
-                self.add_to_chat(f"Tú: {message['content']}", "user")  # Muestra mensaje de usuario
                 self.conversation_history.append({
                     "user_message": message['content'],
                     "assistant_response": "",
@@ -277,24 +314,62 @@ class VisionAgentChat:
                     "timestamp": datetime.fromisoformat(message['timestamp'])
                 })
             elif message['type'] == 'assistant':
-                self.add_to_chat(message['content'], "assistant")  # Muestra mensaje del asistente
                 if self.conversation_history:
                     self.conversation_history[-1]["assistant_response"] = message['content']
             elif message['type'] == 'image':
-                # Si hay image_data, reconstruir imagen temporal
-                if message.get('image_data'):
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_img:
-                        tmp_img.write(message['image_data'])
-                        tmp_img_path = tmp_img.name
-                    self.add_image_to_chat(tmp_img_path, message.get('user_name'), message.get('emotion'))
-                else:
-                    self.add_to_chat("[Imagen no disponible en la base de datos]", "system")
                 self.current_user = message.get('user_name')
                 self.current_emotion = message.get('emotion')
                 self.user_label.configure(text=message.get('user_name', ''))
                 self.emotion_label.configure(text=message.get('emotion', '').title())
+        self._oldest_message_id = messages[0]['id'] if messages else None
+        self._has_older = len(messages) == CHAT_PAGE_SIZE  # Página completa: puede haber más
+        self.root.after_idle(lambda: self._on_chat_scroll(*self.chat_display.yview()))  # Si la página no llena la vista
         messagebox.showinfo("Éxito", f"Sesión '{self.current_session_name}' cargada correctamente")
 
+    def _render_history_message(self, message, index=tk.END):
+        """Muestra un mensaje guardado en la posición index del chat"""
+        if message['type'] == 'user':
+            self.add_to_chat(f"Tú: {message['content']}", "user", index)  # Muestra mensaje de usuario
+        elif message['type'] == 'assistant':
+            self.add_to_chat(message['content'], "assistant", index)  # Muestra mensaje del asistente
+        elif message['type'] == 'image':
+            # Si hay imagen, mostrar su miniatura guardada (sin decodificar el original)
+            image_hash = message.get('image_hash')
+            thumbnail = self.database.get_image_thumbnail(image_hash) if image_hash else None
+            if thumbnail is None and image_hash:
+                image_data = self.database.get_image_blob(image_hash)  # Miniatura no disponible: original en memoria
+                thumbnail = io.BytesIO(image_data) if image_data else None
+            if thumbnail is not None:
+                self.add_image_to_chat(thumbnail, message.get('user_name'), message.get('emotion'), index)
+            else:
+                self.add_to_chat("[Imagen no disponible en la base de datos]", "system", index)
+
+    def _on_chat_scroll(self, first, last):
+        """Actualiza la barra de desplazamiento y, al llegar arriba del todo, pide la página anterior"""
+        self.chat_display.vbar.set(first, last)
+        if float(first) <= 0.0 and self._has_older and not self._loading_older:
+            self._loading_older = True
+            self.root.after_idle(self._load_older_messages)  # Fuera del callback de la barra
+
+    def _load_older_messages(self):
+        """Inserta al principio del chat la página anterior al mensaje más antiguo mostrado"""
+        try:
+            if not self._has_older or self.current_session_id is None:
+                return
+            messages = self.database.get_session_messages(self.current_session_id, before_id=self._oldest_message_id,
+                                                          limit=CHAT_PAGE_SIZE)
+            self._has_older = len(messages) == CHAT_PAGE_SIZE  # Página incompleta: no quedan más
+            if not messages:
+                return
+            self._oldest_message_id = messages[0]['id']
+            self.chat_display.mark_set("history_end", "1.0")  # Donde empieza lo que ya se mostraba
+            self.chat_display.mark_gravity("history_end", tk.RIGHT)  # Avanza con cada inserción: la página queda en orden
+            for message in messages:
+                self._render_history_message(message, "history_end")
+            self.chat_display.yview("history_end")  # Mantiene a la vista lo que el usuario estaba leyendo
+        finally:
+            self._loading_older = False
+
     def limpiar_base_de_datos(self):
         """Elimina todas las sesiones y mensajes de la base de datos."""
         import sqlite3
@@ -329,10 +404,8 @@ class VisionAgentChat:
                     f.write(f"Chat - {self.current_session_name}\n")
                     f.write("=" * 50 + "\n\n")
                     
-                    # Obtener mensajes de la sesión
-                    messages = self.database.get_session_messages(self.current_session_id)
-                    
-                    for message in messages:
+                    # Recorrer los mensajes de la sesión por páginas (sin cargarlos todos en memoria)
+                    for message in self.database.iter_session_messages(self.current_session_id):
                         timestamp = message['timestamp'][:19]  # Truncar timestamp
                         if message['type'] == 'user':
                             f.write(f"[{timestamp}] Tú: {message['content']}\n\n")
@@ -345,6 +418,59 @@ class VisionAgentChat:
             except Exception as e:
                 messagebox.showerror("Error", f"No se pudo exportar el chat: {str(e)}")
     
+    def show_metrics_window(self):
+        """Ventana con los tiempos por etapa del pipeline (se refresca cada segundo)"""
+        window = tk.Toplevel(self.root)  # Ventana secundaria
+        window.title("Métricas de rendimiento")
+        window.geometry("640x420")
+        columns = ("n", "media", "p50", "p95", "max")  # Columnas de la tabla
+        tree = ttk.Treeview(window, columns=columns, show="tree headings", height=12)
+        tree.heading("#0", text="Etapa")
+        tree.column("#0", width=200)
+        for column, title in zip(columns, ("n", "Media (ms)", "p50 (ms)", "p95 (ms)", "Máx (ms)")):
+            tree.heading(column, text=title)
+            tree.column(column, width=80, anchor="e")
+        tree.pack(fill="both", expand=True, padx=10, pady=(10, 5))
+        counters_label = ttk.Label(window, text="", justify="left")  # Contadores (aciertos de caché, fallbacks...)
+        counters_label.pack(fill="x", padx=10)
+
+        def refresh():
+            if not window.winfo_exists():
+                return  # Ventana cerrada: deja de refrescar
+            summary = metrics.summary()
+            tree.delete(*tree.get_children())
+            for stage, stats in summary["stages"].items():
+                tree.insert("", tk.END, text=stage, values=(
+                    stats["count"], f"{stats['avg_ms']:.1f}", f"{stats['p50_ms']:.1f}",
+                    f"{stats['p95_ms']:.1f}", f"{stats['max_ms']:.1f}"))
+            counters = ", ".join(f"{name}: {value}" for name, value in summary["counters"].items())
+            counters_label.configure(text=f"Contadores: {counters or '-'}")
+            window.after(1000, refresh)  # Siguiente refresco
+
+        def export(kind):
+            extension = ".jsonl" if kind == "jsonl" else ".prom"
+            file_path = filedialog.asksaveasfilename(parent=window, title="Exportar métricas", defaultextension=extension,
+                                                     filetypes=[("Métricas", f"*{extension}"), ("Todos los archivos", "*.*")])
+            if not file_path:
+                return
+            try:
+                if kind == "jsonl":
+                    metrics.export_jsonl(file_path)  # Eventos recientes, uno por línea
+                else:
+                    with open(file_path, 'w', encoding='utf-8') as f:
+                        f.write(metrics.to_prometheus())  # Histogramas en formato de texto de Prometheus
+                messagebox.showinfo("Éxito", f"Métricas exportadas a: {file_path}", parent=window)
+            except Exception as e:
+                messagebox.showerror("Error", f"No se pudieron exportar las métricas: {str(e)}", parent=window)
+
+        buttons = ttk.Frame(window)
+        buttons.pack(fill="x", padx=10, pady=10)
+        ttk.Button(buttons, text="Exportar JSON lines", command=lambda: export("jsonl")).pack(side="left")
+        ttk.Button(buttons, text="Exportar Prometheus", command=lambda: export("prometheus")).pack(side="left", padx=5)
+        ttk.Button(buttons, text="Reiniciar", command=metrics.reset).pack(side="left")
+        ttk.Button(buttons, text="Cerrar", command=window.destroy).pack(side="right")
+        refresh()
+
     def select_image(self):
         """Seleccionar imagen y detectar emoción"""
         file_path = filedialog.askopenfilename(
@@ -371,8 +497,13 @@ class VisionAgentChat:
     def detect_emotion(self, image_path):
         """Detectar emoción y usuario en la imagen"""
         try:
+            if not self.vision_module.is_ready:
+                # process_image esperaría la carga (o un entrenamiento completo) bloqueando la ventana
+                self.add_to_chat("⏳ El modelo de visión se está cargando, vuelve a intentarlo en un momento.", "system")
+                return
             # Procesar imagen completa (usuario + emoción)
-            result = self.vision_module.process_image(image_path)
+            with metrics.timer("pipeline_image"):
+                result = self.vision_module.process_image(image_path)
             if result["success"]:
                 detected_user = result["user_name"]
                 detected_emotion = result["emotion"]
@@ -383,7 +514,8 @@ class VisionAgentChat:
                 self.user_label.configure(text=f"{detected_user}")
                 self.emotion_label.configure(text=f"{detected_emotion.title()}")
                 # Mostrar imagen en el chat estilo ChatGPT
-                self.add_image_to_chat(image_path, detected_user, detected_emotion)
+                with metrics.timer("ui_render_image"):
+                    self.add_image_to_chat(image_path, detected_user, detected_emotion)
                 # Guardar imagen en la base de datos si hay sesión activa
                 if self.current_session_id:
                     self.database.save_image_to_db(
@@ -411,85 +543,147 @@ class VisionAgentChat:
             self.add_to_chat(welcome_message, "assistant")
             self._welcome_shown = True
     
-    def add_streaming_response(self, response_generator):
-        """Agregar respuesta del modelo al chat, soportando string o generador."""
+    def _start_streaming_response(self, message, history_message, priority=PRIORITY_INTERACTIVE, temperature=None):
+        """
+        Lanza la generación en streaming en un hilo de trabajo.
+        El hilo solo deja fragmentos en la cola; la interfaz los pinta desde _drain_stream_queue.
+        """
+        self._stream_id += 1  # Identifica esta generación (ignora fragmentos de generaciones canceladas)
+        stream_id = self._stream_id
+        self._cancel_event = threading.Event()  # Señal de cancelación para el hilo
+        self._stream_text = ""  # Texto recibido hasta ahora
+        self._stream_history_message = history_message  # Mensaje que se guarda en el historial
+        self._stream_user = self.current_user  # Usuario y emoción al lanzar la petición
+        self._stream_emotion = self.current_emotion
+        self._stream_started = time.perf_counter()  # Para medir el tiempo hasta el primer token
+        self._first_token_ms = None
+        # Burbuja del asistente: los fragmentos se insertan en la marca, antes del salto de línea final
         self.chat_display.config(state='normal')
-        pos = self.chat_display.index(tk.END)
-        # Si es un string, mostrarlo directamente
-        if isinstance(response_generator, str):
-            self.chat_display.insert(pos, response_generator)
-            self.chat_display.insert(tk.END, "\n\n")
-            self.chat_display.config(state='disabled')
-            self.root.update_idletasks()
-            return response_generator
-        # Si es un generador, usar la lógica original
-        full_text = ""
-        buffer = ""
-        last_shown = ""
-        import re
-        sentence_end = re.compile(r'([.!?\n])')
-        for fragment in response_generator:
-            full_text += fragment
-            buffer += fragment
-            sentences = []
-            start = 0
-            for match in sentence_end.finditer(buffer):
-                end = match.end()
-                sentences.append(buffer[start:end])
-                start = end
-            if sentences:
-                to_show = "".join(sentences)
-                self.chat_display.insert(pos, to_show)
-                self.chat_display.see(tk.END)
-                self.chat_display.update_idletasks()
-                last_shown += to_show
-                buffer = buffer[start:]
-        if buffer:
-            self.chat_display.insert(pos, buffer)
+        self.chat_display.insert(tk.END, "\U0001F916 ", "assistant_bubble")
+        self.chat_display.insert(tk.END, "\n", "assistant_bubble")
+        self.chat_display.insert(tk.END, "\n")
+        self.chat_display.mark_set("stream_end", "end-3c")  # Justo antes del salto de línea de la burbuja
+        self.chat_display.mark_gravity("stream_end", tk.RIGHT)  # Avanza con cada fragmento insertado
+        self.chat_display.see(tk.END)
+        self.chat_display.config(state='disabled')
+        self.send_btn.configure(state='disabled')  # Una generación a la vez
+        self.stop_btn.configure(state='normal')
+        worker = threading.Thread(
+            target=self._stream_worker,
+            args=(stream_id, self._stream_user, self._stream_emotion, message, list(self.conversation_history),
+                  self._cancel_event, self.current_session_id, priority, temperature),
+            daemon=True
+        )
+        worker.start()
+        self.root.after(CHAT_STREAM_POLL_MS, self._drain_stream_queue, stream_id)
+
+    def _stream_worker(self, stream_id, user_id, emotion, message, history, cancel_event, session_id, priority, temperature):
+        """Hilo de trabajo: consume el generador del LLM y pasa los fragmentos por la cola (sin tocar Tk)"""
+        try:
+            for fragment in self.llm_module.generate_response_stream(
+                user_id=user_id or "",
+                emotion=emotion or "",
+                message=message,
+                conversation_history=history,
+                cancel_event=cancel_event,
+                session_id=session_id,
+                priority=priority,
+                temperature=temperature
+            ):
+                self._stream_queue.put((stream_id, "token", fragment))
+        except Exception as e:
+            self._stream_queue.put((stream_id, "error", str(e)))
+        self._stream_queue.put((stream_id, "done", None))
+
+    def _drain_stream_queue(self, current_id):
+        """Vacía la cola de fragmentos en el hilo de Tk y se reprograma mientras dure la generación"""
+        if current_id != self._stream_id:
+            return  # La generación terminó o se canceló: deja de sondear
+        text = ""
+        done = False
+        error = None
+        while True:
+            try:
+                stream_id, kind, payload = self._stream_queue.get_nowait()
+            except queue.Empty:
+                break
+            if stream_id != current_id:
+                continue  # Fragmento de una generación ya cancelada
+            if kind == "token":
+                text += payload
+            elif kind == "error":
+                error = payload
+            else:
+                done = True
+        if text:
+            if self._first_token_ms is None:
+                self._first_token_ms = (time.perf_counter() - self._stream_started) * 1000
+                metrics.observe("ui_first_token", self._first_token_ms / 1000)  # Hasta que el texto se ve en pantalla
+            self._stream_text += text
+            self.chat_display.config(state='normal')
+            self.chat_display.insert("stream_end", text, "assistant_bubble")
             self.chat_display.see(tk.END)
-            self.chat_display.update_idletasks()
-            last_shown += buffer
-        self.chat_display.insert(tk.END, "\n\n")
+            self.chat_display.config(state='disabled')
+        if error:
+            self.add_to_chat(f"❌ Error: {error}", "error")
+        if done:
+            self._finish_streaming_response()
+        else:
+            self.root.after(CHAT_STREAM_POLL_MS, self._drain_stream_queue, current_id)
+
+    def cancel_generation(self):
+        """Cancelar la generación en curso; conserva el texto ya recibido"""
+        if self._cancel_event is None:
+            return
+        self._cancel_event.set()  # El hilo deja de leer y cierra la conexión
+        self._stream_text = self._stream_text.rstrip()
+        self.chat_display.config(state='normal')
+        self.chat_display.insert("stream_end", " [cancelado]", "assistant_bubble")
         self.chat_display.config(state='disabled')
-        self.root.update_idletasks()
-        return full_text
+        self._finish_streaming_response()
+
+    def _finish_streaming_response(self):
+        """Cierra la burbuja en curso, guarda la respuesta y reactiva los controles"""
+        self._stream_id += 1  # Descarta lo que aún quede en la cola
+        self._cancel_event = None
+        self.chat_display.mark_unset("stream_end")
+        self.send_btn.configure(state='normal')
+        self.stop_btn.configure(state='disabled')
+        full_response = self._stream_text.strip()
+        if not full_response:
+            return
+        if self.current_session_id:
+            self.database.save_message(
+                session_id=self.current_session_id,
+                message_type='assistant',
+                content=full_response,
+                user_name=self._stream_user,
+                emotion=self._stream_emotion
+            )
+        self.conversation_history.append({
+            "user_message": self._stream_history_message,
+            "assistant_response": full_response,
+            "emotion": self._stream_emotion,
+            "timestamp": datetime.now()
+        })
 
     def generate_model_response(self):
-        """Generar respuesta automática del modelo (respuesta simulando streaming)."""
+        """Generar respuesta automática del modelo en streaming."""
+        if not self.current_user or not self.current_emotion:
+            return
+        if self._cancel_event is not None:
+            self.cancel_generation()  # La nueva imagen sustituye a la respuesta en curso
+        context = f"El usuario está en estado emocional: {self.current_emotion}"
         try:
-            if not self.current_user or not self.current_emotion:
-                return
-            context = f"El usuario está en estado emocional: {self.current_emotion}"
-            response = self.llm_module.generate_response(
-                user_id=self.current_user,
-                emotion=self.current_emotion,
-                message=context,
-                conversation_history=self.conversation_history
-            )
-            if response["success"]:
-                # Simular streaming aunque la respuesta sea completa
-                full_response = self.add_streaming_response(response["response"])
-                if self.current_session_id:
-                    self.database.save_message(
-                        session_id=self.current_session_id,
-                        message_type='assistant',
-                        content=full_response,
-                        user_name=self.current_user,
-                        emotion=self.current_emotion
-                    )
-                self.conversation_history.append({
-                    "user_message": context,
-                    "assistant_response": full_response,
-                    "emotion": self.current_emotion,
-                    "timestamp": datetime.now()
-                })
-            else:
-                self.add_to_chat(f"❌ Error del modelo: {response.get('error', 'Error desconocido')}", "error")
+            # Saludo automático: cede el turno a los mensajes escritos y, al ser determinista, se sirve de la caché
+            self._start_streaming_response(context, context, PRIORITY_BACKGROUND, LLM_GREETING_TEMPERATURE)
         except Exception as e:
             self.add_to_chat(f"❌ Error: {str(e)}", "error")
     
     def send_message(self, event=None):
-        """Enviar mensaje de texto (respuesta simulando streaming)."""
+        """Enviar mensaje de texto; la respuesta llega en streaming sin bloquear la interfaz."""
+        if self._cancel_event is not None:
+            return  # Hay una generación en curso (Enter no debe lanzar otra)
         message = self.text_input.get().strip()
         if message:
             timestamp = datetime.now().strftime("%H:%M")
@@ -504,36 +698,12 @@ class VisionAgentChat:
                 )
             self.text_input.delete(0, tk.END)
             try:
-                response = self.llm_module.generate_response(
-                    user_id=self.current_user if self.current_user else "",
-                    emotion=self.current_emotion if self.current_emotion else "",
-                    message=message,
-                    conversation_history=self.conversation_history
-                )
-                if response["success"]:
-                    # Simular streaming aunque la respuesta sea completa
-                    full_response = self.add_streaming_response(response["response"])
-                    if self.current_session_id:
-                        self.database.save_message(
-                            session_id=self.current_session_id,
-                            message_type='assistant',
-                            content=full_response,
-                            user_name=self.current_user,
-                            emotion=self.current_emotion
-                        )
-                    self.conversation_history.append({
-                        "user_message": message,
-                        "assistant_response": full_response,
-                        "emotion": self.current_emotion,
-                        "timestamp": datetime.now()
-                    })
-                else:
-                    self.add_to_chat(f"❌ Error del modelo: {response.get('error', 'Error desconocido')}", "error")
+                self._start_streaming_response(message, message)
             except Exception as e:
                 self.add_to_chat(f"❌ Error: {str(e)}", "error")
     
-    def add_to_chat(self, message, sender):
-        """Agregar mensaje al chat con estilo burbuja y alineación."""
+    def add_to_chat(self, message, sender, index=tk.END):
+        """Agregar mensaje al chat con estilo burbuja y alineación (al final, o en index para el historial anterior)."""
         try:
             self.chat_display.config(state='normal')
             # Definir estilos
@@ -555,34 +725,36 @@ class VisionAgentChat:
                 align = "left"
             # Insertar mensaje con icono y salto de línea
             if align == "right":
-                self.chat_display.insert(tk.END, f"{icon}{message}\n", tag)
+                self.chat_display.insert(index, f"{icon}{message}\n", tag)
             elif align == "left":
-                self.chat_display.insert(tk.END, f"{icon}{message}\n", tag)
+                self.chat_display.insert(index, f"{icon}{message}\n", tag)
             else:
-                self.chat_display.insert(tk.END, f"{icon}{message}\n", tag)
-            self.chat_display.insert(tk.END, "\n")
-            self.chat_display.see(tk.END)
+                self.chat_display.insert(index, f"{icon}{message}\n", tag)
+            self.chat_display.insert(index, "\n")
+            if index == tk.END:
+                self.chat_display.see(tk.END)
             self.chat_display.config(state='disabled')
             self.root.update_idletasks()
         except Exception as e:
             print(f"Error al agregar mensaje al chat: {e}")
 
-    def add_image_to_chat(self, image_path, user=None, emotion=None):
-        """Agregar una imagen como mensaje en el chat, estilo ChatGPT."""
+    def add_image_to_chat(self, image, user=None, emotion=None, index=tk.END):
+        """
+        Agregar una imagen como mensaje en el chat, estilo ChatGPT.
+        image es una ruta o un archivo en memoria, o los bytes de una miniatura guardada (se muestran tal cual).
+        """
         try:
             self.chat_display.config(state='normal')
-            # Cargar y redimensionar imagen
-            image = Image.open(image_path)
-            max_width = 180
-            max_height = 180
-            width, height = image.size
-            scale = min(max_width/width, max_height/height, 1.0)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(image)
+            if isinstance(image, bytes):
+                photo = ImageTk.PhotoImage(data=image)  # Miniatura ya redimensionada
+            else:
+                # Cargar y redimensionar imagen
+                image = Image.open(image)
+                image.draft("RGB", (CHAT_THUMBNAIL_SIZE, CHAT_THUMBNAIL_SIZE))  # JPEG: decodifica a escala reducida
+                image.thumbnail((CHAT_THUMBNAIL_SIZE, CHAT_THUMBNAIL_SIZE), Image.Resampling.LANCZOS)  # Sin ampliar
+                photo = ImageTk.PhotoImage(image)
             # Insertar imagen en el chat
-            self.chat_display.image_create(tk.END, image=photo)
+            self.chat_display.image_create(index, image=photo)
             # Guardar referencia para evitar garbage collection
             if not hasattr(self, '_chat_images_refs'):
                 self._chat_images_refs = []
@@ -595,8 +767,9 @@ class VisionAgentChat:
                     info += f"👤 {user}"
                 if emotion:
                     info += f"  |  😃 {emotion.title()}"
-            self.chat_display.insert(tk.END, f"{info}\n\n")
-            self.chat_display.see(tk.END)
+            self.chat_display.insert(index, f"{info}\n\n")
+            if index == tk.END:
+                self.chat_display.see(tk.END)
             self.chat_display.config(state='disabled')
             self.root.update_idletasks()
         except Exception as e:
@@ -605,9 +778,11 @@ class VisionAgentChat:
     def clear_chat(self):
         """Limpiar chat"""
         try:
+            self.cancel_generation()  # Termina la respuesta en curso antes de borrar
             self.chat_display.config(state='normal')
             self.chat_display.delete(1.0, tk.END)
             self.conversation_history = []
+            self._has_older = False  # El historial anterior ya no se muestra
             self.chat_display.config(state='disabled')
             self._welcome_shown = False
             self.start_conversation()